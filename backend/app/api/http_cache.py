@@ -0,0 +1,107 @@
+"""
+Supporto per la cache HTTP delle risposte in sola lettura.
+
+Le risposte portano un ETag forte e un header ``Cache-Control``; se la
+richiesta contiene un ``If-None-Match`` corrispondente viene restituito un
+304 senza corpo. Per i dati statici il corpo JSON viene serializzato una
+sola volta (``PrecomputedBody``).
+"""
+
+import hashlib
+import json
+from typing import Any, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+STATIC_CACHE_CONTROL = "public, max-age=86400"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag forte derivato dalle parti indicate (versione, parametri, corpo)."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True se ``If-None-Match`` contiene l'ETag (confronto debole, come da RFC 9110)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def serialize_json(payload: Any) -> bytes:
+    """Serializza il payload come JSON compatto (modelli Pydantic inclusi)."""
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Risposta 304 con gli stessi header di validazione della risposta completa."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def cached_json_response(
+    request: Request,
+    body: bytes,
+    etag: Optional[str] = None,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+) -> Response:
+    """
+    Restituisce un corpo JSON già serializzato con ETag e ``Cache-Control``.
+
+    Args:
+        request: Richiesta corrente, per ``If-None-Match``
+        body: Corpo JSON serializzato
+        etag: ETag della risorsa (default: derivato dal corpo)
+        cache_control: Valore dell'header ``Cache-Control``
+
+    Returns:
+        304 se il client ha già la versione corrente, altrimenti 200 con il corpo
+    """
+    etag = etag or make_etag(body)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
+
+
+class PrecomputedBody:
+    """
+    Corpo JSON di dati statici, serializzato al primo utilizzo.
+
+    Args:
+        build: Funzione che restituisce il payload da serializzare
+        cache_control: Header ``Cache-Control`` delle risposte
+    """
+
+    def __init__(self, build: Callable[[], Any], cache_control: str = STATIC_CACHE_CONTROL):
+        self._build = build
+        self._cache_control = cache_control
+        self._body: Optional[bytes] = None
+        self._etag: Optional[str] = None
+
+    def response(self, request: Request) -> Response:
+        """Risposta con il corpo precalcolato, o 304 se il client lo ha già."""
+        if self._body is None:
+            body = serialize_json(self._build())
+            self._etag = make_etag(body)
+            self._body = body
+        return cached_json_response(request, self._body, self._etag, self._cache_control)
+
+    def invalidate(self) -> None:
+        """Forza la serializzazione alla prossima richiesta."""
+        self._body = None
+        self._etag = None
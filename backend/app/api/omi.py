@@ -1,9 +1,12 @@
 """API endpoints per l'interrogazione diretta dei dati OMI."""
 
+import asyncio
+import json
 import logging
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from app.omi import (
@@ -12,12 +15,25 @@ from app.omi import (
     OMIServiceError,
     OMINoQuotationsError,
     PropertyType,
+    RequestPriority,
     get_all_cities,
     get_cadastral_code,
     get_omi_client,
     get_property_type,
     get_property_type_display_name,
+    search_cities,
 )
+from app.api.http_cache import (
+    REVALIDATE_CACHE_CONTROL,
+    PrecomputedBody,
+    cached_json_response,
+    etag_matches,
+    make_etag,
+    not_modified,
+    serialize_json,
+)
+from app.omi.history import get_omi_history, growth_rates
+from app.omi.quotations import QuotationTable
 
 router = APIRouter()
 
@@ -40,6 +56,53 @@ class OMIQueryRequest(BaseModel):
     )
 
 
+class OMIBatchQueryRequest(BaseModel):
+    """Richiesta di interrogazione OMI per un portafoglio di immobili."""
+
+    items: List[OMIQueryRequest] = Field(..., min_length=1, max_length=5000)
+
+
+class OMISuggestItem(BaseModel):
+    """Immobile da classificare con tipo e zona OMI suggeriti."""
+
+    address: str = Field(..., description="Indirizzo completo dell'immobile")
+    city: Optional[str] = Field(None, description="Nome del comune")
+    property_description: Optional[str] = Field(None, description="Descrizione dell'immobile")
+
+
+class OMISuggestBatchRequest(BaseModel):
+    """Richiesta di suggerimenti per un portafoglio di immobili."""
+
+    items: List[OMISuggestItem] = Field(..., min_length=1, max_length=5000)
+
+
+class OMITrendPoint(BaseModel):
+    """Valori al mq di un semestre nella serie storica."""
+
+    semestre: str
+    min: Optional[float] = None
+    max: Optional[float] = None
+    medio: Optional[float] = None
+    variazione_pct: Optional[float] = Field(
+        None, description="Variazione del valore medio rispetto al punto precedente"
+    )
+
+
+class OMITrendResponse(BaseModel):
+    """Serie storica delle quotazioni OMI di una zona."""
+
+    comune: str
+    codice_comune: str
+    zona_omi: str
+    property_type: str
+    operazione: str
+    series: List[OMITrendPoint]
+    variazione_totale_pct: Optional[float] = None
+    variazione_annua_pct: Optional[float] = Field(
+        None, description="Tasso di crescita annuo composto tra il primo e l'ultimo semestre"
+    )
+
+
 class PropertyTypeInfo(BaseModel):
     """Informazioni su un tipo di immobile."""
 
@@ -107,8 +170,129 @@ async def query_omi(request: OMIQueryRequest):
         raise HTTPException(status_code=500, detail="Errore durante la query OMI")
 
 
+@router.post("/batch-query")
+async def batch_query_omi(request: OMIBatchQueryRequest) -> StreamingResponse:
+    """
+    Interroga le API OMI per più immobili e restituisce i risultati in NDJSON.
+
+    Le richieste vengono raggruppate per comune: ogni comune richiede al più una
+    chiamata al servizio OMI (in corsia batch del rate limiter), le varianti
+    vengono ricavate dalla cache. Ogni riga contiene ``index`` (posizione nella
+    richiesta), ``status`` ("ok" o "error") e ``result`` oppure ``detail``, ed è
+    emessa appena disponibile.
+
+    Args:
+        request: Elenco delle query OMI
+
+    Returns:
+        Stream ``application/x-ndjson`` in ordine di completamento
+    """
+    omi_client = get_omi_client()
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    groups: Dict[str, List[int]] = {}
+    immediate: List[str] = []
+
+    for index, item in enumerate(request.items):
+        if item.operazione and item.operazione not in ["acquisto", "affitto"]:
+            immediate.append(
+                _batch_error_line(index, 400, "Operazione non valida. Usa 'acquisto', 'affitto' o null.")
+            )
+            continue
+        codice_comune = get_cadastral_code(item.city)
+        if not codice_comune:
+            immediate.append(
+                _batch_error_line(index, 400, f"Codice catastale non trovato per il comune: {item.city}")
+            )
+            continue
+        groups.setdefault(codice_comune, []).append(index)
+
+    async def run_group(indexes: List[int]) -> None:
+        for index in indexes:
+            item = request.items[index]
+            try:
+                response = await omi_client.query(
+                    city=item.city,
+                    metri_quadri=item.metri_quadri,
+                    operazione=item.operazione,
+                    zona_omi=item.zona_omi,
+                    tipo_immobile=get_property_type(item.tipo_immobile) if item.tipo_immobile else None,
+                    priority=RequestPriority.BATCH,
+                )
+            except OMIServiceError as e:
+                detail = "Servizio quotazioni OMI temporaneamente non disponibile."
+                if str(e):
+                    detail += f" Dettagli: {e}"
+                await queue.put(_batch_error_line(index, 502, detail))
+            except Exception:
+                logger.exception("Errore imprevisto nella batch query OMI per %s", item.city)
+                await queue.put(_batch_error_line(index, 500, "Errore durante la query OMI"))
+            else:
+                await queue.put(
+                    json.dumps(
+                        {"index": index, "status": "ok", "result": response.model_dump(mode="json")},
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                )
+
+    async def stream() -> AsyncIterator[str]:
+        for line in immediate:
+            yield line
+
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        remaining = len(request.items) - len(immediate)
+        try:
+            while remaining:
+                yield await queue.get()
+                remaining -= 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def _batch_error_line(index: int, status_code: int, detail: str) -> str:
+    """Serializza una riga NDJSON di errore per la batch query."""
+    return json.dumps(
+        {"index": index, "status": "error", "status_code": status_code, "detail": detail},
+        ensure_ascii=False,
+    ) + "\n"
+
+
+def _price_validators(
+    table: QuotationTable,
+    operazione: str,
+    metri_quadri: float,
+    property_type: Optional[PropertyType],
+    zona_omi: Optional[str],
+) -> Tuple[str, str]:
+    """
+    ETag e ``Cache-Control`` di una risposta di prezzo.
+
+    L'ETag dipende dalla versione dei dati del comune (data di scaricamento,
+    semestre, valore non aggiornato) e dai parametri della richiesta; la
+    durata in cache è quella residua dei dati, mai oltre un'ora.
+    """
+    etag = make_etag(
+        table.codice_comune,
+        table.timestamp.isoformat(),
+        table.semestre,
+        table.stale,
+        operazione,
+        metri_quadri,
+        property_type.value if property_type else None,
+        zona_omi,
+    )
+    if table.stale:
+        return etag, REVALIDATE_CACHE_CONTROL
+    remaining = get_omi_client().dataset_ttl_remaining(table.codice_comune) or 0
+    return etag, f"public, max-age={int(max(0, min(remaining, 3600)))}"
+
+
 @router.get("/purchase-price")
 async def get_purchase_price(
+    request: Request,
     city: str = Query(..., description="Nome del comune"),
     metri_quadri: float = Query(..., ge=1, description="Metri quadri"),
     tipo_immobile: Optional[str] = Query(None, description="Tipo di immobile"),
@@ -133,6 +317,13 @@ async def get_purchase_price(
         property_type = get_property_type(tipo_immobile)
 
     try:
+        table = await omi_client.get_quotation_table(city)
+        etag, cache_control = _price_validators(
+            table, "acquisto", metri_quadri, property_type, zona_omi
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, cache_control)
+
         prices = await omi_client.get_purchase_price(
             city=city,
             metri_quadri=metri_quadri,
@@ -140,7 +331,7 @@ async def get_purchase_price(
             zona_omi=zona_omi,
         )
 
-        return prices
+        return cached_json_response(request, serialize_json(prices), etag, cache_control)
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -159,6 +350,7 @@ async def get_purchase_price(
 
 @router.get("/rental-price")
 async def get_rental_price(
+    request: Request,
     city: str = Query(..., description="Nome del comune"),
     metri_quadri: float = Query(..., ge=1, description="Metri quadri"),
     tipo_immobile: Optional[str] = Query(None, description="Tipo di immobile"),
@@ -183,6 +375,13 @@ async def get_rental_price(
         property_type = get_property_type(tipo_immobile)
 
     try:
+        table = await omi_client.get_quotation_table(city)
+        etag, cache_control = _price_validators(
+            table, "affitto", metri_quadri, property_type, zona_omi
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag, cache_control)
+
         prices = await omi_client.get_rental_price(
             city=city,
             metri_quadri=metri_quadri,
@@ -190,7 +389,7 @@ async def get_rental_price(
             zona_omi=zona_omi,
         )
 
-        return prices
+        return cached_json_response(request, serialize_json(prices), etag, cache_control)
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -207,23 +406,90 @@ async def get_rental_price(
         raise HTTPException(status_code=500, detail="Errore durante il recupero prezzi OMI")
 
 
+@router.get("/trend", response_model=OMITrendResponse)
+async def get_price_trend(
+    city: str = Query(..., description="Nome del comune"),
+    zona_omi: str = Query(..., description="Zona OMI (es. B12)"),
+    tipo_immobile: Optional[str] = Query(None, description="Tipo di immobile (default: abitazioni civili)"),
+    operazione: str = Query("acquisto", description="'acquisto' o 'affitto'"),
+):
+    """
+    Restituisce la serie semestrale dei prezzi al mq di una zona e i tassi di crescita.
+
+    I dati provengono dall'archivio locale dei file OMI ufficiali importati:
+    nessuna chiamata al servizio esterno.
+
+    Args:
+        city: Nome del comune
+        zona_omi: Zona OMI
+        tipo_immobile: Tipo di immobile
+        operazione: "acquisto" (€/mq) o "affitto" (€/mq/mese)
+
+    Returns:
+        Serie storica con variazioni semestrali, totale e annua
+
+    Raises:
+        HTTPException: Se il comune non è trovato o lo storico non è disponibile
+    """
+    if operazione not in ("acquisto", "affitto"):
+        raise HTTPException(status_code=400, detail="Operazione non valida. Usa 'acquisto' o 'affitto'.")
+
+    codice_comune = get_cadastral_code(city)
+    if not codice_comune:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Codice catastale non trovato per il comune: {city}"
+        )
+
+    property_type = get_property_type(tipo_immobile or "")
+    series = get_omi_history().series(codice_comune, zona_omi, property_type.value)
+    points = series.points(operazione) if series is not None else []
+    if not points:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Storico OMI non disponibile per {city.title()} zona {zona_omi.upper()}",
+        )
+
+    growth = growth_rates(points)
+    return OMITrendResponse(
+        comune=city.title(),
+        codice_comune=codice_comune,
+        zona_omi=zona_omi.upper(),
+        property_type=property_type.value,
+        operazione=operazione,
+        series=[
+            OMITrendPoint(**point, variazione_pct=variazione)
+            for point, variazione in zip(points, growth["variazioni"])
+        ],
+        variazione_totale_pct=growth["variazione_totale_pct"],
+        variazione_annua_pct=growth["variazione_annua_pct"],
+    )
+
+
+def _property_types() -> List[PropertyTypeInfo]:
+    return [
+        PropertyTypeInfo(
+            value=prop_type.value,
+            display_name=get_property_type_display_name(prop_type)
+        )
+        for prop_type in PropertyType
+    ]
+
+
+_PROPERTY_TYPES_BODY = PrecomputedBody(_property_types)
+
+
 @router.get("/property-types", response_model=List[PropertyTypeInfo])
-async def get_property_types():
+async def get_property_types(request: Request) -> Response:
     """
     Restituisce tutti i tipi di immobile supportati dalle API OMI.
 
+    Il corpo è serializzato una sola volta e servito con ETag e Cache-Control.
+
     Returns:
         Lista di tipi di immobile con valori e nomi visualizzabili
     """
-    types = []
-    for prop_type in PropertyType:
-        types.append(
-            PropertyTypeInfo(
-                value=prop_type.value,
-                display_name=get_property_type_display_name(prop_type)
-            )
-        )
-    return types
+    return _PROPERTY_TYPES_BODY.response(request)
 
 
 @router.get("/cadastral-code")
@@ -250,26 +516,54 @@ async def get_city_cadastral_code(city: str = Query(..., description="Nome del c
     return {"city": city.title(), "code": code}
 
 
+def _supported_cities() -> List[Dict[str, str]]:
+    return [
+        {"city": city.title(), "code": code}
+        for city, code in sorted(get_all_cities().items())
+    ]
+
+
+_CITIES_BODY = PrecomputedBody(_supported_cities)
+
+
 @router.get("/cities", response_model=List[CadastralCodeInfo])
-async def get_supported_cities():
+async def get_supported_cities(request: Request) -> Response:
     """
     Restituisce tutti i comuni supportati con i loro codici catastali.
 
+    La lista viene ordinata e serializzata una sola volta; le richieste
+    successive ricevono il corpo precalcolato o un 304.
+
     Returns:
         Lista di comuni con codici catastali
     """
-    cities = get_all_cities()
-    return [
-        CadastralCodeInfo(city=city.title(), code=code)
-        for city, code in sorted(cities.items())
-    ]
+    return _CITIES_BODY.response(request)
+
+
+@router.get("/cities/search", response_model=List[CadastralCodeInfo])
+async def search_supported_cities(
+    q: str = Query(..., min_length=1, description="Inizio del nome del comune"),
+    limit: int = Query(10, ge=1, le=20, description="Numero massimo di risultati"),
+):
+    """
+    Autocompletamento dei comuni per nome.
+
+    Accenti, apostrofi e maiuscole vengono ignorati; il prefisso può
+    corrispondere anche a una parola interna ("giov" → Sesto San Giovanni).
+
+    Returns:
+        Comuni corrispondenti con i codici catastali
+    """
+    return [CadastralCodeInfo(city=city, code=code) for city, code in search_cities(q, limit)]
 
 
 @router.get("/suggest")
 async def suggest_omi_data(
     address: str = Query(..., description="Indirizzo completo dell'immobile"),
     city: str = Query(..., description="Nome del comune"),
-    property_description: Optional[str] = Query(None, description="Descrizione dell'immobile")
+    property_description: Optional[str] = Query(None, description="Descrizione dell'immobile"),
+    latitude: Optional[float] = Query(None, ge=-90, le=90, description="Latitudine dell'immobile"),
+    longitude: Optional[float] = Query(None, ge=-180, le=180, description="Longitudine dell'immobile"),
 ):
     """
     Suggerisce automaticamente tipo immobile e zona OMI in base all'indirizzo.
@@ -278,27 +572,57 @@ async def suggest_omi_data(
         address: Indirizzo completo dell'immobile
         city: Nome del comune
         property_description: Descrizione opzionale dell'immobile
+        latitude: Latitudine, per individuare la zona dai perimetri OMI
+        longitude: Longitudine, per individuare la zona dai perimetri OMI
 
     Returns:
-        Dizionario con suggested_property_type e suggested_zone
+        Dizionario con suggested_property_type, suggested_zone e le zone del
+        comune citate dall'indirizzo (zone_matches)
     """
-    from app.omi.suggester import suggest_property_type, suggest_omi_zone
+    from app.omi.suggester import suggest_omi_zone, suggest_property_type, suggest_zone_matches
 
     suggested_type = suggest_property_type(address, property_description)
-    suggested_zone = await suggest_omi_zone(city, address)
+    suggested_zone = await suggest_omi_zone(city, address, latitude, longitude)
+    zone_matches = suggest_zone_matches(city, address)
 
     return {
         "suggested_property_type": suggested_type,
         "suggested_zone": suggested_zone,
-        "confidence": "medium"  # Può essere "low", "medium", "high"
+        "zone_matches": zone_matches,
+        # Alta se la zona viene dalle descrizioni ufficiali del comune
+        "confidence": "high" if any(m["zona"] == suggested_zone for m in zone_matches) else "medium",
     }
 
 
+@router.post("/suggest-batch")
+async def suggest_omi_data_batch(request: OMISuggestBatchRequest) -> Dict[str, List[Dict[str, Optional[str]]]]:
+    """
+    Suggerisce tipo immobile e zona OMI per molti immobili in una sola chiamata.
+
+    Args:
+        request: Elenco di immobili (massimo 5000)
+
+    Returns:
+        Dizionario con ``results``, un suggerimento per immobile nello stesso ordine
+    """
+    from app.omi.suggester import suggest_batch
+
+    results = suggest_batch(
+        (item.city, item.address, item.property_description) for item in request.items
+    )
+    return {"results": results}
+
+
 @router.get("/health")
 async def health():
     """Health check per il servizio OMI."""
+    omi_client = get_omi_client()
     return {
         "status": "healthy",
         "service": "omi",
-        "api_endpoint": "https://3eurotools.it/api-quotazioni-immobiliari-omi/ricerca"
+        "mode": "offline" if omi_client.offline else "online",
+        "api_endpoint": "https://3eurotools.it/api-quotazioni-immobiliari-omi/ricerca",
+        "cache": omi_client.cache_stats(),
+        "rate_limiter": omi_client.rate_limiter_stats(),
+        "circuit_breaker": omi_client.circuit_stats(),
     }
@@ -8,9 +8,17 @@ from pathlib import Path
 from typing import List, Optional
 
 import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel, HttpUrl
 
+from app.api.http_cache import (
+    REVALIDATE_CACHE_CONTROL,
+    cached_json_response,
+    etag_matches,
+    make_etag,
+    not_modified,
+    serialize_json,
+)
 from app.valuation.photo_condition import (
     PhotoConditionResult,
     PhotoConditionServiceError,
@@ -20,6 +28,9 @@ from app.valuation.photo_condition import (
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Saved analyses can be overwritten: clients revalidate every time with the ETag
+_ANALYSIS_CACHE_CONTROL = f"private, {REVALIDATE_CACHE_CONTROL}"
+
 
 class PhotoAnalysisRequest(BaseModel):
     photos: List[HttpUrl]
@@ -477,22 +488,40 @@ async def save_analysis_result(request: PhotoAnalysisFromStorageRequest, analysi
 
 
 @router.get("/get-analysis/{listing_id}", response_model=PhotoConditionResult)
-async def get_saved_analysis(listing_id: str) -> Optional[PhotoConditionResult]:
+async def get_saved_analysis(listing_id: str, request: Request) -> Response:
     """
     Retrieve a previously saved AI analysis result for a listing ID.
     Returns 404 if no analysis has been saved for this listing.
+
+    The ETag is derived from the saved file version (mtime and size), so an
+    unchanged analysis is answered with 304 without reading the file.
     """
     safe_listing_id = _build_storage_identifier(listing_id, [])
 
     try:
+        analysis_file = _analysis_file(safe_listing_id)
+        try:
+            stat = analysis_file.stat()
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            etag = make_etag(safe_listing_id, stat.st_mtime_ns, stat.st_size)
+            if etag_matches(request, etag):
+                return not_modified(etag, _ANALYSIS_CACHE_CONTROL)
+
         result = _load_analysis_result(safe_listing_id)
-        if result is None:
+        if result is None or stat is None:
             raise HTTPException(
                 status_code=404,
                 detail="Nessuna analisi salvata trovata per questo annuncio."
             )
         logger.info(f"Retrieved saved analysis for listing {safe_listing_id}")
-        return result
+        return cached_json_response(
+            request,
+            serialize_json(result),
+            etag,
+            _ANALYSIS_CACHE_CONTROL,
+        )
     except HTTPException:
         raise
     except Exception as exc:
@@ -517,10 +546,14 @@ def _save_analysis_result(listing_id: str, result: PhotoConditionResult) -> None
         json.dump(result_dict, f, ensure_ascii=False, indent=2)
 
 
+def _analysis_file(listing_id: str) -> Path:
+    """Path of the saved analysis for a listing."""
+    return Path("storage/analysis") / f"{listing_id}.json"
+
+
 def _load_analysis_result(listing_id: str) -> Optional[PhotoConditionResult]:
     """Load analysis result from JSON file in storage."""
-    storage_dir = Path("storage/analysis")
-    analysis_file = storage_dir / f"{listing_id}.json"
+    analysis_file = _analysis_file(listing_id)
 
     if not analysis_file.exists():
         return None
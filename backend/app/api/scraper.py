@@ -15,6 +15,9 @@ from selenium.webdriver.edge.options import Options
 from selenium.common.exceptions import TimeoutException as SeleniumTimeout, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 
+from app.omi.cadastral_codes import get_city_province, search_city_by_code
+from app.omi.postal_codes import extract_postal_code, resolve_comune
+from app.valuation.listings import get_comparables_engine
 from app.valuation.photo_condition import (
     PhotoConditionResult,
     PhotoConditionServiceError,
@@ -36,6 +39,8 @@ class PropertyData(BaseModel):
     city: Optional[str] = None
     province: Optional[str] = None
     postalCode: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     surface: Optional[float] = None
     rooms: Optional[int] = None
     bedrooms: Optional[int] = None
@@ -47,6 +52,7 @@ class PropertyData(BaseModel):
     hasBalcony: Optional[bool] = None
     hasCellar: Optional[bool] = None
     propertyType: Optional[str] = None
+    contractType: Optional[str] = None  # 'vendita' or 'affitto', None if unknown
     state: Optional[str] = None
     energyClass: Optional[str] = None
     yearBuilt: Optional[int] = None
@@ -54,6 +60,91 @@ class PropertyData(BaseModel):
     photoCondition: Optional[PhotoConditionResult] = None
     source: Optional[str] = None
 
+def resolve_listing_city(data: PropertyData) -> None:
+    """Normalize city and province of a listing using its name or postal code."""
+    if not data.postalCode:
+        data.postalCode = extract_postal_code(data.address)
+    code = resolve_comune(data.city, data.postalCode, data.province)
+    if code:
+        data.city = search_city_by_code(code)
+        data.province = data.province or get_city_province(code)
+
+_COORDINATE_PATTERNS = (
+    re.compile(r'"(?:latitude|lat)"\s*:\s*"?(-?\d{1,2}\.\d+)"?\s*,\s*"(?:longitude|lng|lon)"\s*:\s*"?(-?\d{1,3}\.\d+)'),
+    re.compile(r'data-lat="(-?\d{1,2}\.\d+)"[^>]*data-lng="(-?\d{1,3}\.\d+)"'),
+)
+
+
+def extract_coordinates(soup: BeautifulSoup) -> tuple[Optional[float], Optional[float]]:
+    """Extract listing coordinates from meta tags, JSON-LD or embedded map data."""
+    candidates = []
+    latitude = soup.select_one(
+        'meta[property="place:location:latitude"], meta[itemprop="latitude"], meta[name="geo.position"]'
+    )
+    longitude = soup.select_one('meta[property="place:location:longitude"], meta[itemprop="longitude"]')
+    if latitude and latitude.get("content"):
+        content = latitude["content"].replace(",", ";")
+        if ";" in content:
+            candidates.append(tuple(content.split(";")[:2]))
+        elif longitude and longitude.get("content"):
+            candidates.append((content, longitude["content"]))
+
+    html = str(soup)
+    for pattern in _COORDINATE_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            candidates.append(match.groups())
+
+    for lat_text, lon_text in candidates:
+        try:
+            lat, lon = float(lat_text), float(lon_text)
+        except ValueError:
+            continue
+        if -90 <= lat <= 90 and -180 <= lon <= 180 and (lat, lon) != (0.0, 0.0):
+            return lat, lon
+    return None, None
+
+
+_RENT_MARKERS = ("in affitto", "affittasi", "/mese", "al mese")
+_SALE_MARKERS = ("in vendita", "vendesi")
+
+
+def extract_contract_type(soup: BeautifulSoup, url: str, *texts: Optional[str]) -> Optional[str]:
+    """
+    Tell sale listings ('vendita') from rentals ('affitto').
+
+    Uses the URL path when it carries the contract (Immobiliare.it), otherwise
+    the page title, the Open Graph title and the given texts (e.g. the price,
+    which rentals quote per month). Returns None when no marker is found.
+    """
+    path = url.lower()
+    if "/affitto" in path:
+        return "affitto"
+    if "/vendita" in path:
+        return "vendita"
+
+    og_title = soup.select_one('meta[property="og:title"]')
+    candidates = [
+        *texts,
+        soup.title.get_text() if soup.title else None,
+        og_title.get("content") if og_title else None,
+    ]
+    text = " ".join(" ".join(candidate.lower().split()) for candidate in candidates if candidate)
+    if any(marker in text for marker in _RENT_MARKERS):
+        return "affitto"
+    if any(marker in text for marker in _SALE_MARKERS):
+        return "vendita"
+    return None
+
+
+def record_listing(data: PropertyData) -> None:
+    """Persist a parsed listing so it can be used as a valuation comparable."""
+    try:
+        get_comparables_engine().save(data.model_dump(mode="json"))
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Could not store listing %s: %s", data.url, exc)
+
+
 def fetch_url_with_selenium(url: str) -> str:
     """Fetch URL content using Selenium (headless Edge)"""
     # Setup Edge options
@@ -267,6 +358,9 @@ def parse_idealista(soup: BeautifulSoup, url: str) -> PropertyData:
             if img_data not in data.images:
                 data.images.append(img_data)
 
+
+    price_text = price_elem.text if price_elem else None
+    data.contractType = extract_contract_type(soup, url, data.title, price_text)
     return data
 
 def parse_immobiliare(soup: BeautifulSoup, url: str) -> PropertyData:
@@ -411,6 +505,9 @@ def parse_immobiliare(soup: BeautifulSoup, url: str) -> PropertyData:
             if img_data not in data.images:
                 data.images.append(img_data)
 
+
+    price_text = price_elem.text if price_elem else None
+    data.contractType = extract_contract_type(soup, url, data.title, price_text)
     return data
 
 def parse_casa(soup: BeautifulSoup, url: str) -> PropertyData:
@@ -427,6 +524,9 @@ def parse_casa(soup: BeautifulSoup, url: str) -> PropertyData:
     if price_elem:
         data.price = extract_number(price_elem.text)
 
+
+    price_text = price_elem.text if price_elem else None
+    data.contractType = extract_contract_type(soup, url, data.title, price_text)
     return data
 
 @router.post("/parse-url", response_model=PropertyData)
@@ -475,6 +575,10 @@ async def parse_url(request: ParseURLRequest):
         else:  # casa
             data = parse_casa(soup, url_str)
 
+        resolve_listing_city(data)
+        if data.latitude is None or data.longitude is None:
+            data.latitude, data.longitude = extract_coordinates(soup)
+
         if data.images:
             photo_urls = [
                 image.get("url")
@@ -505,6 +609,7 @@ async def parse_url(request: ParseURLRequest):
                 except Exception as e:
                     logger.warning(f"Failed to download photos: {e}")
 
+        record_listing(data)
         return data
 
     except SeleniumTimeout:
@@ -1,10 +1,28 @@
+import asyncio
+import json
+import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter
-from pydantic import BaseModel, Field
-
-from app.omi import get_omi_client, PropertyType, get_property_type
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, PrivateAttr
+
+from app.omi import get_omi_client, PropertyType, get_property_type, search_city_by_code
+from app.omi.base_prices import get_base_price_table
+from app.omi.geo import get_zone_index
+from app.omi.postal_codes import resolve_comune
+from app.omi.rate_limiter import RequestPriority
+from app.omi.semesters import semester_of
+from app.valuation.listings import get_comparables_engine
+from app.valuation.pricing import (
+    PricingColumns,
+    adjust_price_per_sqm,
+    calculate_confidence,
+    estimate_spread,
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -15,47 +33,64 @@ def _normalize(text: Optional[str]) -> str:
     return text.strip().lower() if text else ""
 
 
-def _city_base_price(city: Optional[str], province: Optional[str]) -> float:
-    city_prices = {
-        "milano": 4700,
-        "roma": 4200,
-        "napoli": 3200,
-        "torino": 2600,
-        "bologna": 3400,
-        "firenze": 3800,
-        "genova": 2300,
-        "palermo": 2100,
-        "bari": 2300,
-        "verona": 2900,
-        "brescia": 2400,
-        "bergamo": 2500,
-        "como": 3100,
-        "monza": 3000,
-        "lesa": 2800,
-    }
+# Prezzi di riserva per i comuni e le province senza quotazioni OMI archiviate
+_FALLBACK_CITY_PRICES = {
+    "milano": 4700,
+    "roma": 4200,
+    "napoli": 3200,
+    "torino": 2600,
+    "bologna": 3400,
+    "firenze": 3800,
+    "genova": 2300,
+    "palermo": 2100,
+    "bari": 2300,
+    "verona": 2900,
+    "brescia": 2400,
+    "bergamo": 2500,
+    "como": 3100,
+    "monza": 3000,
+    "lesa": 2800,
+}
+
+_FALLBACK_PROVINCE_PRICES = {
+    "mi": 3600,
+    "rm": 3400,
+    "na": 2500,
+    "to": 2200,
+    "bg": 2000,
+    "va": 2400,
+    "no": 2200,
+    "vb": 2100,
+}
+
+_DEFAULT_BASE_PRICE = 2200
 
-    province_prices = {
-        "mi": 3600,
-        "rm": 3400,
-        "na": 2500,
-        "to": 2200,
-        "bg": 2000,
-        "va": 2400,
-        "no": 2200,
-        "vb": 2100,
-    }
 
-    default_price = 2200
+def _city_base_price(city: Optional[str], province: Optional[str]) -> float:
+    """
+    Prezzo base al mq: mediana OMI del comune, poi della provincia, con i
+    valori di riserva per i comuni e le province non ancora quotati.
+    """
+    try:
+        table = get_base_price_table()
+        price = table.comune_price(city)
+        if price is None and _normalize(city) not in _FALLBACK_CITY_PRICES:
+            price = table.province_price(city, province)
+    except Exception as e:
+        logger.warning("Prezzi base OMI non disponibili: %s", e)
+        price = None
+    if price is not None:
+        return price
 
     city_key = _normalize(city)
-    if city_key in city_prices:
-        return city_prices[city_key]
+    if city_key in _FALLBACK_CITY_PRICES:
+        return _FALLBACK_CITY_PRICES[city_key]
 
     province_key = _normalize(province)
-    if province_key in province_prices:
-        return province_prices[province_key]
+    if province_key in _FALLBACK_PROVINCE_PRICES:
+        return _FALLBACK_PROVINCE_PRICES[province_key]
 
-    return default_price
+    return _DEFAULT_BASE_PRICE
 
 
 def _adjust_price_per_sqm(property_data: "PropertyInput") -> float:
@@ -122,7 +157,42 @@ def _calculate_confidence(property_data: "PropertyInput") -> int:
     return int(round(score))
 
 
+def _real_comparables(property_data: "PropertyInput", k: int = 3) -> List["Comparable"]:
+    """Annunci reali più simili tra quelli analizzati vicino all'immobile."""
+    if property_data.latitude is None or property_data.longitude is None:
+        return []
+    try:
+        listings = get_comparables_engine().find(
+            property_data.latitude,
+            property_data.longitude,
+            k=k,
+            surface=property_data.surface,
+            property_type=property_data.property_type,
+        )
+    except Exception as e:
+        logger.warning("Comparabili reali non disponibili: %s", e)
+        return []
+    return [
+        Comparable(
+            id=f"listing_{listing.id}",
+            address=listing.address or listing.url,
+            distance=round(listing.distance, 1),
+            price=round(listing.price),
+            priceM2=round(listing.price / listing.surface),
+            surface=round(listing.surface, 1),
+            similarityScore=round(listing.similarity, 1),
+            includedInEstimate=True,
+        )
+        for listing in listings
+    ]
+
+
 def _build_comparables(property_data: "PropertyInput", price_per_sqm: float) -> List["Comparable"]:
+    comparables = _real_comparables(property_data)
+    if comparables:
+        return comparables
+
+    # Senza annunci reali vicini: comparabili indicativi attorno al prezzo stimato
     surface = max(property_data.surface, 40)
     base_address = property_data.city or property_data.address or "Immobile"
     variations = [
@@ -131,7 +201,7 @@ def _build_comparables(property_data: "PropertyInput", price_per_sqm: float) ->
         (0.06, 0.04, 1.12),
     ]
 
-    comparables: List[Comparable] = []
+    comparables = []
     for idx, (price_offset, surface_offset, distance_factor) in enumerate(variations, start=1):
         comp_surface = max(surface * (1 + surface_offset), 35)
         comp_price_m2 = price_per_sqm * (1 + price_offset)
@@ -167,6 +237,7 @@ class PropertyInput(BaseModel):
     address: str
     city: str
     province: Optional[str] = None
+    postal_code: Optional[str] = None  # CAP, usato se il nome del comune non è riconosciuto
     surface: float
     price: Optional[float] = None
     rooms: Optional[int] = None
@@ -177,6 +248,8 @@ class PropertyInput(BaseModel):
     longitude: Optional[float] = None
     property_type: Optional[str] = None  # Tipo di immobile (es. "appartamento", "villa", ecc.)
     zona_omi: Optional[str] = None  # Zona OMI specifica
+    # True se ``zona_omi`` è stata ricavata dalle coordinate e non indicata
+    _zona_from_coordinates: bool = PrivateAttr(default=False)
 
 
 class Comparable(BaseModel):
@@ -222,88 +295,191 @@ class ValuationResponse(BaseModel):
     createdAt: datetime
 
 
-@router.post("/evaluate", response_model=ValuationResponse)
-async def evaluate_property(property_data: PropertyInput):
-    """
-    Valuta un immobile utilizzando dati OMI reali e algoritmi proprietari.
+class BatchValuationRequest(BaseModel):
+    """Richiesta di valutazione per un portafoglio di immobili."""
 
-    Args:
-        property_data: Dati dell'immobile da valutare
+    items: List[PropertyInput] = Field(..., min_length=1, max_length=5000)
 
-    Returns:
-        Stima completa del valore con dati OMI
+
+# Esito della ricerca OMI: modello OMI, prezzo medio al mq, quotazioni candidate
+OMILookup = Tuple[Optional[OMIData], Optional[float], List[Dict[str, Any]]]
+
+# Chiave di raggruppamento: comune, tipo OMI, zona OMI, zona ricavata dalle coordinate
+LookupKey = Tuple[str, Optional[str], Optional[str], bool]
+
+
+def _resolve_location(property_data: PropertyInput) -> PropertyInput:
+    """Normalizza comune e zona OMI (dal CAP e dalle coordinate, se disponibili)."""
+    # Risolve il comune dal nome o, se non riconosciuto, dal CAP
+    codice_comune = resolve_comune(property_data.city, property_data.postal_code, property_data.province)
+    updates: Dict[str, Any] = {}
+    zona_from_coordinates = False
+    if property_data.zona_omi and property_data.zona_omi != property_data.zona_omi.strip().upper():
+        # Le zone OMI sono indicizzate in maiuscolo (es. "B1")
+        updates["zona_omi"] = property_data.zona_omi.strip().upper()
+
+    # Zona OMI esatta dalle coordinate, se sono disponibili i perimetri delle zone
+    if (
+        not property_data.zona_omi
+        and property_data.latitude is not None
+        and property_data.longitude is not None
+    ):
+        located = get_zone_index().locate(
+            property_data.latitude, property_data.longitude, codice_comune
+        )
+        if located:
+            codice_comune, updates["zona_omi"] = located
+            zona_from_coordinates = True
+
+    comune = search_city_by_code(codice_comune) if codice_comune else None
+    if comune and comune != property_data.city:
+        updates["city"] = comune
+    if updates:
+        property_data = property_data.model_copy(update=updates)
+        property_data._zona_from_coordinates = zona_from_coordinates
+    return property_data
+
+
+def _omi_property_type(property_data: PropertyInput) -> Optional[PropertyType]:
+    """Tipo di immobile OMI corrispondente a quello indicato, se presente."""
+    if property_data.property_type:
+        return get_property_type(property_data.property_type)
+    return None
+
+
+def _lookup_key(property_data: PropertyInput) -> LookupKey:
+    """Chiave che identifica la quotazione OMI usata per la valutazione."""
+    property_type_omi = _omi_property_type(property_data)
+    return (
+        _normalize(property_data.city),
+        property_type_omi.value if property_type_omi else None,
+        property_data.zona_omi or None,
+        # Una zona individuata ma non quotata ripiega sull'intero comune, una
+        # zona indicata no: le due ricerche non sono intercambiabili
+        property_data._zona_from_coordinates,
+    )
+
+
+async def _lookup_omi(
+    property_data: PropertyInput, priority: RequestPriority = RequestPriority.INTERACTIVE
+) -> OMILookup:
     """
-    # Calcola il prezzo base con l'algoritmo proprietario
-    price_per_sqm_base = _adjust_price_per_sqm(property_data)
+    Cerca la quotazione OMI dell'immobile (comune, zona e tipo).
 
-    # Prova a ottenere dati OMI reali
+    Gli errori del servizio non interrompono la valutazione: in quel caso si
+    usa solo l'algoritmo proprietario.
+    """
     omi_client = get_omi_client()
-    omi_data_model = None
-    price_per_sqm_omi = None
-    quotations_raw: List[Dict[str, Any]] = []
-
     try:
         # Determina il tipo di immobile OMI
-        property_type_omi = None
-        if property_data.property_type:
-            property_type_omi = get_property_type(property_data.property_type)
-
-        # Interroga le API OMI con 1 mq per ottenere il prezzo al mq
-        omi_response = await omi_client.query(
-            city=property_data.city,
-            metri_quadri=1.0,  # Richiedi per 1 mq per ottenere prezzo al mq
+        property_type_omi = _omi_property_type(property_data)
+
+        # Quotazioni al mq del comune, indicizzate per zona e tipo
+        omi_table = await omi_client.get_quotation_table(property_data.city, priority=priority)
+        zona_omi = property_data.zona_omi
+        located_zone_missing = (
+            zona_omi and property_data._zona_from_coordinates and not omi_table.select(zona_omi=zona_omi)
+        )
+        if located_zone_missing:
+            # Perimetri e quotazioni di semestri diversi: la zona individuata
+            # non è quotata, si usano le quotazioni dell'intero comune
+            logger.info("Zona OMI %s non quotata per %s", zona_omi, property_data.city)
+            zona_omi = None
+        candidates = omi_table.select(
+            zona_omi=zona_omi,
+            property_type=property_type_omi.value if property_type_omi else None,
             operazione="acquisto",
-            zona_omi=property_data.zona_omi,
-            tipo_immobile=property_type_omi,
         )
 
-        if omi_response and omi_response.quotations:
-            # Usa la prima quotazione disponibile (o quella del tipo specificato)
-            quotation = omi_response.quotations[0]
-            quotations_raw = [q.dict(exclude_none=True) for q in omi_response.quotations]
-
-            # Cerca la quotazione migliore per il tipo specificato
-            if property_type_omi:
-                for q in omi_response.quotations:
-                    if q.property_type == property_type_omi.value:
-                        quotation = q
-                        break
-
-            # I prezzi sono già al mq (richiesta con metri_quadri=1)
-            if quotation.prezzo_acquisto_medio and quotation.prezzo_acquisto_medio > 0:
-                price_per_sqm_omi = quotation.prezzo_acquisto_medio
+        if candidates:
+            # Usa la prima quotazione disponibile (già del tipo specificato, se indicato)
+            quotation = candidates[0]
+            quotations_raw = [q.to_dict(operazione="acquisto") for q in candidates]
+            acquisto_min, acquisto_max, acquisto_medio = quotation.acquisto
 
+            # I prezzi sono già al mq
+            if acquisto_medio and acquisto_medio > 0:
                 # Crea il modello OMI con dati reali
                 omi_data_model = OMIData(
                     comune=property_data.city.title(),
                     zona=quotation.zona_omi if quotation.zona_omi else "Intero comune",
-                    valoreMin=round(quotation.prezzo_acquisto_min or price_per_sqm_omi * 0.9, 0),
-                    valoreMax=round(quotation.prezzo_acquisto_max or price_per_sqm_omi * 1.1, 0),
-                    valoreNormale=round(price_per_sqm_omi, 0),
-                    semestre=f"{datetime.now().year}-S{1 if datetime.now().month <= 6 else 2}",
+                    valoreMin=round(acquisto_min or acquisto_medio * 0.9, 0),
+                    valoreMax=round(acquisto_max or acquisto_medio * 1.1, 0),
+                    valoreNormale=round(acquisto_medio, 0),
+                    semestre=omi_table.semestre or semester_of(omi_table.timestamp),
                     stato_conservazione=quotation.stato_conservazione,
                     fonte="OMI - Dati reali",
                     property_type=quotation.property_type,
-                    prezzoAffittoMin=quotation.prezzo_affitto_min,
-                    prezzoAffittoMax=quotation.prezzo_affitto_max,
-                    prezzoAffittoMedio=quotation.prezzo_affitto_medio,
                     fonteUrl=OMI_FONTE_URL,
                     quotationsRaw=quotations_raw or None,
                 )
+                return omi_data_model, acquisto_medio, quotations_raw
+            return None, None, quotations_raw
 
     except Exception as e:
-        print(f"Errore nel recupero dati OMI: {e}")
+        logger.warning("Errore nel recupero dati OMI per %s: %s", property_data.city, e)
         # Continua con i dati calcolati
 
+    return None, None, []
+
+
+def _pricing_columns(properties: List[PropertyInput]) -> PricingColumns:
+    """Colonne per il motore vettoriale, nell'ordine degli immobili."""
+    base_prices: Dict[Tuple[str, Optional[str]], float] = {}
+    for p in properties:
+        if (p.city, p.province) not in base_prices:
+            base_prices[p.city, p.province] = _city_base_price(p.city, p.province)
+    return PricingColumns.from_rows(
+        (
+            base_prices[p.city, p.province],
+            p.surface,
+            p.floor,
+            p.rooms,
+            p.bedrooms,
+            p.bathrooms,
+            p.price,
+            p.latitude,
+            p.longitude,
+        )
+        for p in properties
+    )
+
+
+def _confidence_boost(price_per_sqm_omi: Optional[float]) -> int:
+    """Punti di confidenza aggiunti quando è disponibile una quotazione OMI reale."""
+    return 15 if price_per_sqm_omi and price_per_sqm_omi > 0 else 0
+
+
+def _build_valuation(
+    property_data: PropertyInput,
+    omi_lookup: OMILookup,
+    valuation_id: Optional[str] = None,
+    price_per_sqm_base: Optional[float] = None,
+    base_confidence: Optional[int] = None,
+    spread: Optional[float] = None,
+) -> ValuationResponse:
+    """
+    Calcola la valutazione combinando la quotazione OMI con l'algoritmo proprietario.
+
+    ``price_per_sqm_base``, ``base_confidence`` e ``spread`` possono arrivare già
+    calcolati dal motore vettoriale (valutazioni batch); altrimenti si usa il
+    percorso scalare.
+    """
+    omi_data_model, price_per_sqm_omi, quotations_raw = omi_lookup
+
+    # Calcola il prezzo base con l'algoritmo proprietario
+    if price_per_sqm_base is None:
+        price_per_sqm_base = _adjust_price_per_sqm(property_data)
+    if base_confidence is None:
+        base_confidence = _calculate_confidence(property_data)
+
     # Determina il prezzo finale al mq
     if price_per_sqm_omi and price_per_sqm_omi > 0:
         # Combina il prezzo OMI con quello calcolato (peso 70% OMI, 30% algoritmo)
         price_per_sqm = price_per_sqm_omi * 0.7 + price_per_sqm_base * 0.3
-        confidence_boost = 15  # Maggiore confidenza con dati OMI reali
     else:
         # Usa solo il prezzo calcolato
         price_per_sqm = price_per_sqm_base
-        confidence_boost = 0
 
         # Crea dati OMI stimati se non disponibili
         if not omi_data_model:
@@ -315,7 +491,7 @@ async def evaluate_property(property_data: PropertyInput):
                 valoreMin=round(omi_value_min, 0),
                 valoreMax=round(omi_value_max, 0),
                 valoreNormale=round(price_per_sqm, 0),
-                semestre=f"{datetime.now().year}-S{1 if datetime.now().month <= 6 else 2}",
+                semestre=semester_of(),
                 fonte="Algoritmo proprietario",
                 quotationsRaw=quotations_raw or None,
             )
@@ -324,11 +500,13 @@ async def evaluate_property(property_data: PropertyInput):
     estimated_value = price_per_sqm * property_data.surface
 
     # Calcola la confidenza
-    confidence = _calculate_confidence(property_data) + confidence_boost
+    # Maggiore confidenza con dati OMI reali
+    confidence = base_confidence + _confidence_boost(price_per_sqm_omi)
     confidence = min(confidence, 95)  # Cap a 95
 
     # Calcola il range di stima
-    spread = max(0.08, 0.18 - (confidence - 55) * 0.002)
+    if spread is None:
+        spread = float(estimate_spread(confidence))
     estimated_min = estimated_value * (1 - spread)
     estimated_max = estimated_value * (1 + spread)
 
@@ -345,7 +523,7 @@ async def evaluate_property(property_data: PropertyInput):
     quality_score = min(95, int(confidence + 8))
 
     return ValuationResponse(
-        id=f"val_{datetime.now().timestamp()}",
+        id=valuation_id or f"val_{datetime.now().timestamp()}",
         estimatedValue=round(estimated_value, 0),
         estimatedValueMin=round(estimated_min, 0),
         estimatedValueMax=round(estimated_max, 0),
@@ -360,6 +538,109 @@ async def evaluate_property(property_data: PropertyInput):
     )
 
 
+@router.post("/evaluate", response_model=ValuationResponse)
+async def evaluate_property(property_data: PropertyInput):
+    """
+    Valuta un immobile utilizzando dati OMI reali e algoritmi proprietari.
+
+    Args:
+        property_data: Dati dell'immobile da valutare
+
+    Returns:
+        Stima completa del valore con dati OMI
+    """
+    property_data = _resolve_location(property_data)
+    return _build_valuation(property_data, await _lookup_omi(property_data))
+
+
+@router.post("/evaluate-batch")
+async def evaluate_batch(request: BatchValuationRequest) -> StreamingResponse:
+    """
+    Valuta più immobili e restituisce le valutazioni in NDJSON.
+
+    Gli immobili vengono raggruppati per comune, tipo e zona OMI: ogni gruppo
+    cerca la quotazione una sola volta (in corsia batch del rate limiter) e
+    valuta tutti i suoi immobili con il motore vettoriale. Ogni riga contiene ``index`` (posizione
+    nella richiesta), ``status`` ("ok" o "error") e ``result`` (una
+    ``ValuationResponse``) oppure ``detail``, ed è emessa appena disponibile.
+
+    Args:
+        request: Elenco degli immobili da valutare
+
+    Returns:
+        Stream ``application/x-ndjson`` in ordine di completamento
+    """
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    groups: Dict[LookupKey, List[Tuple[int, PropertyInput]]] = {}
+    batch_id = f"val_{datetime.now().timestamp()}"
+
+    for index, item in enumerate(request.items):
+        property_data = _resolve_location(item)
+        groups.setdefault(_lookup_key(property_data), []).append((index, property_data))
+
+    def error_line(index: int) -> str:
+        line = {
+            "index": index,
+            "status": "error",
+            "status_code": 500,
+            "detail": "Errore durante la valutazione",
+        }
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    async def run_group(items: List[Tuple[int, PropertyInput]]) -> None:
+        try:
+            omi_lookup = await _lookup_omi(items[0][1], priority=RequestPriority.BATCH)
+            # Prezzi base e confidenze dell'intero gruppo in un solo passaggio vettoriale
+            columns = _pricing_columns([property_data for _, property_data in items])
+            base_prices = adjust_price_per_sqm(columns).tolist()
+            confidences = calculate_confidence(columns)
+            # Il gruppo condivide la quotazione OMI, quindi anche l'aumento di confidenza
+            boosted = (confidences + _confidence_boost(omi_lookup[1])).clip(max=95)
+            spreads = estimate_spread(boosted).tolist()
+            confidences = confidences.tolist()
+        except Exception:
+            # Ogni immobile del gruppo riceve comunque la sua riga, altrimenti
+            # lo stream resterebbe in attesa
+            logger.exception("Errore nella valutazione batch per %s", items[0][1].city)
+            for index, _ in items:
+                await queue.put(error_line(index))
+            return
+
+        for position, (index, property_data) in enumerate(items):
+            try:
+                valuation = _build_valuation(
+                    property_data,
+                    omi_lookup,
+                    f"{batch_id}_{index}",
+                    price_per_sqm_base=base_prices[position],
+                    base_confidence=confidences[position],
+                    spread=spreads[position],
+                )
+            except Exception:
+                logger.exception("Errore nella valutazione batch per %s", property_data.city)
+                await queue.put(error_line(index))
+            else:
+                line = {"index": index, "status": "ok", "result": valuation.model_dump(mode="json")}
+                await queue.put(json.dumps(line, ensure_ascii=False) + "\n")
+
+    async def stream() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(run_group(items)) for items in groups.values()]
+        remaining = len(request.items)
+        try:
+            while remaining:
+                yield await queue.get()
+                remaining -= 1
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 @router.get("/health")
 async def health():
-    return {"status": "healthy", "service": "valuation"}
+    return {
+        "status": "healthy",
+        "service": "valuation",
+        "base_prices": get_base_price_table().snapshot().label,
+    }
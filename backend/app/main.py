@@ -1,17 +1,35 @@
 import base64
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router as api_router
+from app.omi import get_omi_client
+from app.omi.warmer import OMICacheWarmer
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-carica in background la cache OMI dei comuni più richiesti
+    omi_client = get_omi_client()
+    warmer = OMICacheWarmer.from_env(omi_client)
+    warmer.start()
+    try:
+        yield
+    finally:
+        await warmer.stop()
+        await omi_client.close()
+
+
 app = FastAPI(
     title="HomeEstimate API",
     description="API per la stima del valore immobiliare",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 _FAVICON_BASE64 = (
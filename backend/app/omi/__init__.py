@@ -6,10 +6,12 @@ from app.omi.cadastral_codes import (
     CADASTRAL_CODES,
     get_all_cities,
     get_cadastral_code,
+    search_cities,
     search_city_by_code,
 )
 from app.omi.client import (
     OMICache,
+    OMICircuitOpenError,
     OMIClient,
     OMIQuotation,
     OMIResponse,
@@ -17,6 +19,15 @@ from app.omi.client import (
     OMIServiceError,
     get_omi_client,
 )
+from app.omi.postal_codes import get_codes_by_postal_code, resolve_comune
+from app.omi.rate_limiter import RequestPriority, TokenBucketScheduler
+from app.omi.geo import OMIZoneIndex, ZonePolygon, get_zone_index
+from app.omi.history import OMIPriceHistory, get_omi_history
+from app.omi.offline import OMIOfflineDataset
+from app.omi.quotations import QuotationRecord, QuotationTable
+from app.omi.resilience import CircuitBreaker, CircuitState
+from app.omi.shared import InMemorySharedState, OMISharedState, SQLiteSharedState
+from app.omi.store import OMIQuotationStore
 from app.omi.property_types import (
     PROPERTY_TYPE_MAPPING,
     PropertyType,
@@ -25,23 +36,52 @@ from app.omi.property_types import (
 )
 from app.omi.suggester import (
     get_zone_description,
+    suggest_batch,
     suggest_omi_zone,
     suggest_property_type,
+    suggest_zone_matches,
 )
+from app.omi.zone_index import OMIZoneDescriptionIndex, get_zone_description_index
+from app.omi.base_prices import BasePriceSnapshot, BasePriceTable, get_base_price_table
 
 __all__ = [
     # Cadastral codes
     "CADASTRAL_CODES",
     "get_cadastral_code",
     "search_city_by_code",
+    "search_cities",
     "get_all_cities",
+    "get_codes_by_postal_code",
+    "resolve_comune",
     # Client
     "OMIClient",
     "OMIQuotation",
     "OMIResponse",
     "OMIServiceError",
     "OMINoQuotationsError",
+    "OMICircuitOpenError",
     "get_omi_client",
+    "OMIQuotationStore",
+    "OMIOfflineDataset",
+    "OMIPriceHistory",
+    "OMIZoneIndex",
+    "ZonePolygon",
+    "get_zone_index",
+    "OMIZoneDescriptionIndex",
+    "get_zone_description_index",
+    "BasePriceSnapshot",
+    "BasePriceTable",
+    "get_base_price_table",
+    "get_omi_history",
+    "QuotationRecord",
+    "QuotationTable",
+    "RequestPriority",
+    "TokenBucketScheduler",
+    "CircuitBreaker",
+    "CircuitState",
+    "OMISharedState",
+    "SQLiteSharedState",
+    "InMemorySharedState",
     # Property types
     "PropertyType",
     "PROPERTY_TYPE_MAPPING",
@@ -50,5 +90,6 @@ __all__ = [
     # Suggester
     "suggest_property_type",
     "suggest_omi_zone",
+    "suggest_batch",
     "get_zone_description",
 ]
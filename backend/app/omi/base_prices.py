@@ -0,0 +1,185 @@
+"""
+Prezzi base al mq per comune e provincia, dalle quotazioni OMI archiviate.
+
+La tabella viene costruita dall'archivio dei file ufficiali
+(``OMIOfflineDataset``): per ogni comune il prezzo base è la mediana dei
+valori medi di compravendita delle abitazioni civili nelle sue zone, per ogni
+provincia la mediana dei prezzi dei suoi comuni.
+
+La tabella è un'istantanea immutabile con una versione (semestre e
+importazione di origine). Al più ogni ``OMI_BASE_PRICES_CHECK_INTERVAL``
+secondi si controlla se nell'archivio è arrivato un nuovo semestre; in quel
+caso la nuova istantanea viene costruita a parte e sostituisce la precedente
+in un solo passaggio, senza riavviare il servizio.
+"""
+
+import logging
+import os
+import threading
+import time
+from statistics import median
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from app.omi.cadastral_codes import get_cadastral_code, get_city_province
+from app.omi.offline import OMIOfflineDataset
+from app.omi.property_types import PropertyType
+
+logger = logging.getLogger(__name__)
+
+# Tipo di immobile di riferimento per il prezzo base
+BASE_PROPERTY_TYPE = PropertyType.ABITAZIONI_CIVILI.value
+
+
+class BasePriceSnapshot:
+    """
+    Prezzi base di un semestre OMI, indicizzati per codice catastale e sigla di provincia.
+
+    Args:
+        version: Versione dell'archivio da cui è stata costruita
+        semestre: Semestre delle quotazioni (None se l'archivio è vuoto)
+        comuni: Mappa {codice catastale: prezzo al mq}
+        province: Mappa {sigla provincia: prezzo al mq}
+    """
+
+    __slots__ = ("version", "semestre", "comuni", "province")
+
+    def __init__(
+        self,
+        version: Tuple[int, float],
+        semestre: Optional[str],
+        comuni: Dict[str, float],
+        province: Dict[str, float],
+    ):
+        self.version = version
+        self.semestre = semestre
+        self.comuni: Mapping[str, float] = MappingProxyType(comuni)
+        self.province: Mapping[str, float] = MappingProxyType(province)
+
+    @property
+    def label(self) -> str:
+        """Versione leggibile, es. "2024-S1#3@1718000000"."""
+        count, imported_at = self.version
+        return f"{self.semestre or 'vuota'}#{count}@{int(imported_at)}"
+
+    def __len__(self) -> int:
+        return len(self.comuni)
+
+
+def build_snapshot(dataset: OMIOfflineDataset) -> BasePriceSnapshot:
+    """Costruisce i prezzi base dal semestre più recente dell'archivio."""
+    version = dataset.version()
+    semesters = dataset.semesters()
+    semestre = semesters[-1] if semesters else None
+    if semestre is None:
+        return BasePriceSnapshot(version, None, {}, {})
+
+    by_comune: Dict[str, List[float]] = {}
+    provinces: Dict[str, str] = {}
+    for codice_comune, provincia, _zona, medio in dataset.purchase_midpoints(BASE_PROPERTY_TYPE, semestre):
+        by_comune.setdefault(codice_comune, []).append(medio)
+        if provincia:
+            provinces[codice_comune] = provincia.upper()
+
+    comuni = {codice: round(median(values), 1) for codice, values in by_comune.items()}
+    by_province: Dict[str, List[float]] = {}
+    for codice, price in comuni.items():
+        provincia = provinces.get(codice) or get_city_province(codice)
+        if provincia:
+            by_province.setdefault(provincia, []).append(price)
+    province = {sigla: round(median(values), 1) for sigla, values in by_province.items()}
+    return BasePriceSnapshot(version, semestre, comuni, province)
+
+
+class BasePriceTable:
+    """
+    Tabella dei prezzi base con ricaricamento automatico.
+
+    Args:
+        dataset: Archivio dei file OMI ufficiali
+        check_interval: Secondi tra due controlli della versione dell'archivio
+    """
+
+    def __init__(self, dataset: OMIOfflineDataset, check_interval: float = 60.0):
+        self._dataset = dataset
+        self._check_interval = check_interval
+        self._snapshot: Optional[BasePriceSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> BasePriceSnapshot:
+        """Istantanea corrente, ricostruita se l'archivio è cambiato dall'ultimo controllo."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self._check_interval:
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - self._checked_at < self._check_interval:
+                return snapshot
+            try:
+                if snapshot is None or self._dataset.version() != snapshot.version:
+                    snapshot = self._load()
+            except Exception as exc:  # noqa: BLE001
+                if snapshot is None:
+                    raise
+                logger.warning("Prezzi base OMI non aggiornati: %s", exc)
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def reload(self) -> BasePriceSnapshot:
+        """Ricostruisce subito la tabella dall'archivio."""
+        with self._lock:
+            snapshot = self._load()
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def _load(self) -> BasePriceSnapshot:
+        snapshot = build_snapshot(self._dataset)
+        # Sostituzione atomica: le letture in corso usano l'istantanea precedente
+        self._snapshot = snapshot
+        logger.info(
+            "Prezzi base OMI %s: %d comuni, %d province",
+            snapshot.label,
+            len(snapshot.comuni),
+            len(snapshot.province),
+        )
+        return snapshot
+
+    def comune_price(self, city: Optional[str]) -> Optional[float]:
+        """Prezzo base al mq del comune, o None se non quotato."""
+        codice_comune = get_cadastral_code(city) if city else None
+        if not codice_comune:
+            return None
+        return self.snapshot().comuni.get(codice_comune)
+
+    def province_price(self, city: Optional[str], province: Optional[str]) -> Optional[float]:
+        """Prezzo base al mq della provincia indicata o di quella del comune."""
+        sigla = province.strip().upper() if province else None
+        if not sigla and city:
+            codice_comune = get_cadastral_code(city)
+            sigla = get_city_province(codice_comune) if codice_comune else None
+        if not sigla:
+            return None
+        return self.snapshot().province.get(sigla)
+
+
+# Istanza singleton della tabella
+_base_price_table: Optional[BasePriceTable] = None
+
+
+def get_base_price_table() -> BasePriceTable:
+    """
+    Ottiene la tabella singleton dei prezzi base.
+
+    Condivide l'archivio dei file ufficiali con lo storico (``get_omi_history``).
+    """
+    global _base_price_table
+    if _base_price_table is None:
+        from app.omi.history import get_omi_history
+
+        _base_price_table = BasePriceTable(
+            get_omi_history().dataset,
+            check_interval=float(os.getenv("OMI_BASE_PRICES_CHECK_INTERVAL", 60)),
+        )
+    return _base_price_table
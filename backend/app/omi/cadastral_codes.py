@@ -1,432 +1,149 @@
 """
 Codici catastali dei comuni italiani.
-Fonte: Agenzia delle Entrate
+Fonte: Agenzia delle Entrate / ISTAT (Elenco dei comuni italiani)
+
+La tabella dei comuni è conservata in ``data/comuni.csv`` (``codice;denominazione;
+sigla_provincia;codice_istat``) e viene letta solo al primo accesso. Un comune
+può comparire su più righe consecutive: la prima riporta la denominazione
+ufficiale, le successive nomi alternativi (es. bilingui) usati solo per la
+ricerca. Lo stesso codice su righe non consecutive è un errore nei dati.
+
+Il file si rigenera dall'elenco ufficiale ISTAT con::
+
+    python -m app.omi.cadastral_codes Elenco-comuni-italiani.csv
 """
 
-from typing import Dict, Optional
-
-# Dizionario dei codici catastali dei comuni italiani più rilevanti
-CADASTRAL_CODES: Dict[str, str] = {
-    # Lombardia - Capoluoghi e città principali
-    "milano": "F205",
-    "bergamo": "A794",
-    "brescia": "B157",
-    "como": "C933",
-    "cremona": "D150",
-    "lecco": "E507",
-    "lodi": "E648",
-    "mantova": "E897",
-    "monza": "F704",
-    "pavia": "G388",
-    "sondrio": "I822",
-    "varese": "L682",
-
-    # Lombardia - Altri comuni importanti
-    # Provincia di Milano
-    "rho": "H264",
-    "sesto san giovanni": "I687",
-    "cinisello balsamo": "C707",
-    "legnano": "E514",
-    "abbiategrasso": "A010",
-    "magenta": "E801",
-    "corbetta": "C986",
-    "melzo": "F120",
-    "gorgonzola": "E094",
-    "segrate": "I577",
-    "cologno monzese": "C895",
-    "san donato milanese": "H827",
-    "corsico": "D045",
-    "rozzano": "H623",
-    "opera": "G078",
-    "buccinasco": "B240",
-    "san giuliano milanese": "H930",
-    "pioltello": "G686",
-    "vimodrone": "M053",
-    "peschiera borromeo": "G488",
-
-    # Provincia di Monza e Brianza
-    "desio": "D286",
-    "seregno": "I625",
-    "lissone": "E617",
-    "cesano maderno": "C566",
-    "limbiate": "E591",
-    "vimercate": "M052",
-    "carate brianza": "B729",
-    "brugherio": "B212",
-    "giussano": "E062",
-    "muggio": "F797",
-
-    # Provincia di Bergamo
-    "treviglio": "L400",
-    "seriate": "I628",
-    "dalmine": "D245",
-    "romano di lombardia": "H511",
-    "albino": "A162",
-    "alzano lombardo": "A246",
-    "caravaggio": "B731",
-    "stezzano": "I951",
-    "ponte san pietro": "G854",
-    "trescore balneario": "L386",
-
-    # Provincia di Brescia
-    "montichiari": "F471",
-    "lumezzane": "E738",
-    "chiari": "C618",
-    "rezzato": "H256",
-    "ghedi": "E024",
-    "palazzolo sull'oglio": "G284",
-    "manerbio": "E879",
-    "orzinuovi": "G149",
-    "rovato": "H598",
-
-    # Lago di Garda - Provincia di Brescia
-    "desenzano del garda": "D284",
-    "sirmione": "I633",
-    "lonato del garda": "E666",
-    "padenghe sul garda": "G213",
-    "moniga del garda": "F373",
-    "manerba del garda": "E883",
-    "san felice del benaco": "H838",
-    "salò": "H717",
-    "gardone riviera": "D917",
-    "toscolano-maderno": "L305",
-    "gargnano": "D924",
-    "tignale": "L169",
-    "tremosine sul garda": "L371",
-    "limone sul garda": "E596",
-
-    # Lago di Garda - Provincia di Verona
-    "peschiera del garda": "G489",
-    "castelnuovo del garda": "C223",
-    "lazise": "E502",
-    "bardolino": "A650",
-    "garda": "D915",
-    "torri del benaco": "L287",
-    "brenzone sul garda": "B154",
-    "malcesine": "E848",
-
-    # Provincia di Como
-    "erba": "D416",
-    "cantù": "B639",
-    "mariano comense": "E951",
-    "olgiate comasco": "G030",
-    "lomazzo": "E661",
-    "cernobbio": "C520",
-
-    # Lago di Como - Provincia di Como
-    "laglio": "E405",
-    "brienno": "B171",
-    "argegno": "A392",
-    "colonno": "C900",
-    "sala comacina": "H682",
-    "ossuccio": "G179",
-    "lenno": "E527",
-    "tremezzo": "L372",
-    "griante": "E172",
-    "menaggio": "F125",
-    "bellagio": "A744",
-    "varenna": "L680",
-
-    # Lago di Como - Provincia di Lecco
-    "mandello del lario": "E879",
-    "abbadia lariana": "A005",
-    "lierna": "E581",
-    "bellano": "A745",
-    "dervio": "D281",
-    "colico": "C839",
-
-    # Lago di Lugano - Provincia di Como
-    "campione d'italia": "B516",
-    "lanzo d'intelvi": "E443",
-    "porlezza": "G889",
-    "valsolda": "L650",
-
-    # Provincia di Varese
-    "busto arsizio": "B300",
-    "gallarate": "D869",
-    "saronno": "I441",
-    "tradate": "L319",
-    "luino": "E734",
-    "castellanza": "C139",
-    "somma lombardo": "I819",
-    "malnate": "E863",
-    "cassano magnago": "C004",
-
-    # Lago di Varese - Provincia di Varese
-    "gavirate": "D946",
-    "azzate": "A525",
-    "bodio lomnago": "A918",
-    "bregano": "B133",
-    "biandronno": "A842",
-    "cazzago brabbia": "C408",
-
-    # Provincia di Pavia
-    "vigevano": "L872",
-    "voghera": "M109",
-    "mortara": "F754",
-    "stradella": "I969",
-
-    # Provincia di Cremona
-    "crema": "D142",
-    "casalmaggiore": "B898",
-
-    # Provincia di Mantova
-    "castiglione delle stiviere": "C312",
-    "suzzara": "L020",
-    "viadana": "L826",
-
-    # Provincia di Lecco
-    "merate": "F133",
-    "calolziocorte": "B423",
-
-    # Provincia di Lodi
-    "codogno": "C816",
-    "sant'angelo lodigiano": "I274",
-
-    # Provincia di Sondrio
-    "tirano": "L175",
-    "morbegno": "F712",
-
-    # Lazio
-    "roma": "H501",
-    "frosinone": "D810",
-    "latina": "E472",
-    "rieti": "H282",
-    "viterbo": "M082",
-
-    # Campania
-    "napoli": "F839",
-    "avellino": "A509",
-    "benevento": "A783",
-    "caserta": "B963",
-    "salerno": "H703",
-
-    # Piemonte - Capoluoghi
-    "torino": "L219",
-    "alessandria": "A182",
-    "asti": "A479",
-    "biella": "A859",
-    "cuneo": "D205",
-    "novara": "F952",
-    "verbania": "L746",
-    "vercelli": "L750",
-
-    # Piemonte - Altri comuni importanti
-    # Provincia di Torino
-    "moncalieri": "F335",
-    "rivoli": "H355",
-    "collegno": "C860",
-    "settimo torinese": "I703",
-    "nichelino": "F889",
-    "venaria reale": "L736",
-    "chieri": "C627",
-    "pinerolo": "G674",
-    "carmagnola": "B792",
-    "ivrea": "E333",
-    "grugliasco": "E216",
-    "chivasso": "C665",
-    "orbassano": "G087",
-    "beinasco": "A734",
-    "san mauro torinese": "I030",
-    "caselle torinese": "B955",
-    "alpignano": "A217",
-    "avigliana": "A518",
-    "giaveno": "E020",
-    "cirié": "C722",
-    "leini": "E518",
-    "volpiano": "M120",
-    "rivarolo canavese": "H335",
-    "trofarello": "L444",
-    "cuorgné": "D211",
-    "piossasco": "G691",
-
-    # Provincia di Alessandria
-    "casale monferrato": "B885",
-    "novi ligure": "F965",
-    "tortona": "L304",
-    "acqui terme": "A052",
-    "valenza": "L570",
-    "ovada": "G200",
-
-    # Provincia di Asti
-    "canelli": "B594",
-    "nizza monferrato": "F902",
-
-    # Provincia di Biella
-    "cossato": "D094",
-    "candelo": "B586",
-
-    # Provincia di Cuneo
-    "alba": "A124",
-    "bra": "B111",
-    "fossano": "D742",
-    "mondovì": "F351",
-    "savigliano": "I473",
-    "saluzzo": "H701",
-    "borgo san dalmazzo": "B006",
-
-    # Provincia di Novara
-    "arona": "A429",
-    "borgomanero": "B008",
-    "galliate": "D872",
-    "trecate": "L359",
-
-    # Provincia di Verbano-Cusio-Ossola
-    "omegna": "G062",
-    "domodossola": "D332",
-    "villadossola": "M026",
-    "stresa": "I976",
-
-    # Lago Maggiore - Piemonte (Verbano-Cusio-Ossola e Novara)
-    "baveno": "A725",
-    "cannobio": "B615",
-    "ghiffa": "E003",
-    "oggebbio": "G008",
-    "cannero riviera": "B609",
-    "mergozzo": "F146",
-    "lesa": "E549",
-    "meina": "F093",
-    "belgirate": "A741",
-    "dormelletto": "D347",
-
-    # Lago Maggiore - Lombardia (Varese)
-    "angera": "A290",
-    "sesto calende": "I688",
-    "castelletto sopra ticino": "C145",
-    "ispra": "E367",
-    "ranco": "H173",
-    "leggiuno": "E509",
-    "monvalle": "F704",
-    "laveno-mombello": "E496",
-    "maccagno con pino e veddasca": "E782",
-
-    # Lago di Orta (Novara)
-    "orta san giulio": "G134",
-    "pettenasco": "G520",
-    "pella": "G422",
-
-    # Provincia di Vercelli
-    "borgosesia": "B013",
-    "santhià": "I337",
-
-    # Veneto
-    "venezia": "L736",
-    "belluno": "A757",
-    "padova": "G224",
-    "rovigo": "H620",
-    "treviso": "L407",
-    "verona": "L781",
-    "vicenza": "L840",
-
-    # Emilia-Romagna
-    "bologna": "A944",
-    "ferrara": "D548",
-    "forli": "D704",
-    "modena": "F257",
-    "parma": "G337",
-    "piacenza": "G535",
-    "ravenna": "H199",
-    "reggio emilia": "H223",
-    "rimini": "H294",
-
-    # Toscana
-    "firenze": "D612",
-    "arezzo": "A390",
-    "grosseto": "E202",
-    "livorno": "E625",
-    "lucca": "E715",
-    "massa": "F023",
-    "pisa": "G702",
-    "pistoia": "G713",
-    "prato": "G999",
-    "siena": "I726",
-
-    # Puglia
-    "bari": "A662",
-    "brindisi": "B180",
-    "foggia": "D643",
-    "lecce": "E506",
-    "taranto": "L049",
-    "barletta": "A669",
-
-    # Sicilia
-    "palermo": "G273",
-    "agrigento": "A089",
-    "caltanissetta": "B429",
-    "catania": "C351",
-    "enna": "C342",
-    "messina": "F158",
-    "ragusa": "H163",
-    "siracusa": "I754",
-    "trapani": "L331",
-
-    # Liguria
-    "genova": "D969",
-    "imperia": "E290",
-    "la spezia": "E463",
-    "savona": "I480",
-
-    # Trentino-Alto Adige
-    "trento": "L378",
-    "bolzano": "A952",
-
-    # Friuli-Venezia Giulia
-    "trieste": "L424",
-    "gorizia": "E098",
-    "pordenone": "G888",
-    "udine": "L483",
-
-    # Marche
-    "ancona": "A271",
-    "ascoli piceno": "A462",
-    "fermo": "D542",
-    "macerata": "E783",
-    "pesaro": "G540",
-    "urbino": "L500",
-
-    # Umbria
-    "perugia": "G478",
-    "terni": "L117",
-
-    # Calabria
-    "catanzaro": "C352",
-    "cosenza": "D086",
-    "crotone": "D122",
-    "reggio calabria": "H224",
-    "vibo valentia": "F537",
-
-    # Sardegna
-    "cagliari": "B354",
-    "nuoro": "F979",
-    "oristano": "G113",
-    "sassari": "I452",
-    "olbia": "G015",
-
-    # Abruzzo
-    "laquila": "A345",
-    "chieti": "C632",
-    "pescara": "G482",
-    "teramo": "L103",
-
-    # Molise
-    "campobasso": "B519",
-    "isernia": "E335",
-
-    # Basilicata
-    "potenza": "G942",
-    "matera": "F052",
-
-    # Valle d'Aosta
-    "aosta": "A326",
-}
-
-
-def get_cadastral_code(city: str) -> Optional[str]:
+import argparse
+import csv
+import io
+import logging
+import sys
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from app.omi.city_index import CityIndex
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = Path(__file__).resolve().parent / "data" / "comuni.csv"
+
+_HEADER = "codice;denominazione;sigla_provincia;codice_istat"
+
+
+def _name_key(name: str) -> str:
+    """Chiave di ricerca di un nome di comune."""
+    return " ".join(name.strip().lower().split())
+
+
+class ComuniIndex:
+    """
+    Indici della tabella dei comuni: nome → codice e codice → denominazione.
+
+    Entrambe le ricerche sono accessi diretti a dizionario, indipendenti dal
+    numero di comuni. I nomi alternativi di un comune seguono subito la riga
+    della denominazione ufficiale.
+
+    Raises:
+        ValueError: Se un codice già usato ricompare più avanti con un altro
+            nome (due comuni con lo stesso codice)
+    """
+
+    __slots__ = ("by_name", "by_code", "provinces", "istat_codes")
+
+    def __init__(self, rows: Sequence[Tuple[str, str, str, str]]):
+        self.by_name: Dict[str, str] = {}
+        self.by_code: Dict[str, str] = {}
+        self.provinces: Dict[str, str] = {}
+        self.istat_codes: Dict[str, str] = {}
+        previous = None
+        for code, name, provincia, codice_istat in rows:
+            if code != previous and code in self.by_code:
+                raise ValueError(
+                    f"Codice catastale {code} assegnato sia a {self.by_code[code]} sia a {name}"
+                )
+            previous = code
+            self.by_name.setdefault(_name_key(name), code)
+            if code not in self.by_code:
+                self.by_code[code] = name
+                if provincia:
+                    self.provinces[code] = provincia
+                if codice_istat:
+                    self.istat_codes[code] = codice_istat
+
+    @classmethod
+    def from_text(cls, text: str) -> "ComuniIndex":
+        """Costruisce gli indici dal contenuto di ``comuni.csv``."""
+        rows = []
+        for line in text.splitlines()[1:]:
+            if not line:
+                continue
+            code, name, provincia, codice_istat = (line.split(";") + ["", ""])[:4]
+            rows.append((code, name, provincia, codice_istat))
+        return cls(rows)
+
+
+_index: Optional[ComuniIndex] = None
+_search_index: Optional[CityIndex] = None
+_index_lock = threading.Lock()
+
+
+def _comuni() -> ComuniIndex:
+    """Indici dei comuni, caricati dal file dati al primo utilizzo."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ComuniIndex.from_text(DATA_PATH.read_text(encoding="utf-8"))
+                logger.debug("Caricati %d comuni da %s", len(_index.by_code), DATA_PATH)
+    return _index
+
+
+def _city_index() -> CityIndex:
+    """Indici di ricerca approssimata e autocompletamento, costruiti al primo utilizzo."""
+    global _search_index
+    comuni = _comuni()
+    if _search_index is None:
+        with _index_lock:
+            if _search_index is None:
+                _search_index = CityIndex(comuni.by_name, comuni.by_code)
+    return _search_index
+
+
+class _CadastralCodes(Mapping[str, str]):
+    """Vista in sola lettura {comune: codice_catastale}, caricata al primo accesso."""
+
+    def __getitem__(self, city: str) -> str:
+        return _comuni().by_name[city]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_comuni().by_name)
+
+    def __len__(self) -> int:
+        return len(_comuni().by_name)
+
+    def __contains__(self, city: object) -> bool:
+        return city in _comuni().by_name
+
+    def __repr__(self) -> str:
+        return f"CADASTRAL_CODES({len(self)} comuni)"
+
+
+# Dizionario dei codici catastali dei comuni italiani (nomi in minuscolo)
+CADASTRAL_CODES: Mapping[str, str] = _CadastralCodes()
+
+
+def get_cadastral_code(city: str, fuzzy: bool = True) -> Optional[str]:
     """
     Ottiene il codice catastale di un comune italiano.
 
+    Oltre al nome esatto accetta varianti senza accenti o apostrofi,
+    abbreviazioni ("Sesto S. Giovanni") e piccoli errori di battitura.
+
     Args:
         city: Nome del comune (case-insensitive)
+        fuzzy: Se False accetta solo il nome esatto
 
     Returns:
         Codice catastale o None se non trovato
@@ -434,8 +151,27 @@ def get_cadastral_code(city: str) -> Optional[str]:
     if not city:
         return None
 
-    city_normalized = city.strip().lower()
-    return CADASTRAL_CODES.get(city_normalized)
+    code = _comuni().by_name.get(_name_key(city))
+    if code is None and fuzzy:
+        code = _city_index().resolve(city)
+    return code
+
+
+def search_cities(query: str, limit: int = 10) -> List[Tuple[str, str]]:
+    """
+    Autocompletamento dei nomi dei comuni.
+
+    Args:
+        query: Inizio del nome o di una sua parola (accenti e maiuscole ignorati)
+        limit: Numero massimo di risultati
+
+    Returns:
+        Coppie ``(denominazione, codice_catastale)``
+    """
+    if not query or not query.strip():
+        return []
+    by_code = _comuni().by_code
+    return [(by_code[code], code) for code in _city_index().complete(query, limit)]
 
 
 def search_city_by_code(code: str) -> Optional[str]:
@@ -451,19 +187,135 @@ def search_city_by_code(code: str) -> Optional[str]:
     if not code:
         return None
 
-    code_upper = code.strip().upper()
-    for city, cadastral_code in CADASTRAL_CODES.items():
-        if cadastral_code == code_upper:
-            return city.title()
+    return _comuni().by_code.get(code.strip().upper())
 
-    return None
+
+def get_city_province(code: str) -> Optional[str]:
+    """Sigla della provincia del comune, se presente nella tabella."""
+    if not code:
+        return None
+    return _comuni().provinces.get(code.strip().upper())
 
 
-def get_all_cities() -> Dict[str, str]:
+def get_all_cities() -> Mapping[str, str]:
     """
     Restituisce tutti i comuni e i loro codici catastali.
 
     Returns:
-        Dizionario {comune: codice_catastale}
+        Vista in sola lettura {comune: codice_catastale}
+    """
+    return MappingProxyType(_comuni().by_name)
+
+
+def _find_column(header: List[str], *prefixes: str) -> Optional[int]:
+    """Posizione della prima colonna che inizia con uno dei prefissi, in ordine di preferenza."""
+    normalised = [" ".join(column.lower().split()) for column in header]
+    for prefix in prefixes:
+        for position, column in enumerate(normalised):
+            if column.startswith(prefix):
+                return position
+    return None
+
+
+def read_istat_file(path: Union[str, Path]) -> List[Tuple[str, str, str, str]]:
+    """
+    Legge l'elenco dei comuni pubblicato dall'ISTAT.
+
+    Il file è un CSV separato da ``;`` (codifica Windows-1252 o UTF-8). Per
+    i comuni bilingui la denominazione in altra lingua diventa un nome
+    alternativo.
+
+    Returns:
+        Righe ``(codice, denominazione, sigla_provincia, codice_istat)``
+
+    Raises:
+        ValueError: Se mancano le colonne del codice catastale o della denominazione
+    """
+    raw = Path(path).read_bytes()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("cp1252")
+
+    reader = csv.reader(io.StringIO(text), delimiter=";")
+    header = next(reader, [])
+    code_col = _find_column(header, "codice catastale")
+    name_col = _find_column(header, "denominazione in italiano", "denominazione (italiana")
+    other_col = _find_column(header, "denominazione altra lingua")
+    sigla_col = _find_column(header, "sigla automobilistica")
+    istat_col = _find_column(header, "codice comune formato alfanumerico")
+    if code_col is None or name_col is None:
+        raise ValueError(f"Colonne del codice catastale o della denominazione assenti in {path}")
+
+    def cell(row: List[str], column: Optional[int]) -> str:
+        return row[column].strip() if column is not None and column < len(row) else ""
+
+    rows: List[Tuple[str, str, str, str]] = []
+    for row in reader:
+        code, name = cell(row, code_col).upper(), cell(row, name_col)
+        if not code or not name:
+            continue
+        sigla, codice_istat = cell(row, sigla_col), cell(row, istat_col)
+        rows.append((code, name, sigla, codice_istat))
+        other = cell(row, other_col)
+        if other and _name_key(other) != _name_key(name):
+            rows.append((code, other, sigla, codice_istat))
+    return rows
+
+
+def write_comuni_file(
+    rows: Sequence[Tuple[str, str, str, str]],
+    path: Union[str, Path] = DATA_PATH,
+    aliases: Optional[Mapping[str, str]] = None,
+) -> int:
+    """
+    Scrive la tabella dei comuni nel formato di ``comuni.csv``.
+
+    Args:
+        rows: Righe ``(codice, denominazione, sigla_provincia, codice_istat)``
+        path: File di destinazione
+        aliases: Nomi alternativi {nome: codice} da conservare per i codici presenti
+
+    Returns:
+        Numero di comuni scritti
     """
-    return CADASTRAL_CODES.copy()
+    by_code: Dict[str, List[Tuple[str, str, str, str]]] = {}
+    for row in rows:
+        by_code.setdefault(row[0], []).append(row)
+
+    names = {_name_key(row[1]) for row in rows}
+    for alias, code in (aliases or {}).items():
+        if code in by_code and _name_key(alias) not in names:
+            first = by_code[code][0]
+            by_code[code].append((code, alias, first[2], first[3]))
+            names.add(_name_key(alias))
+
+    lines = [_HEADER]
+    for code in sorted(by_code, key=lambda code: _name_key(by_code[code][0][1])):
+        lines.extend(";".join(row) for row in by_code[code])
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return len(by_code)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Rigenera ``comuni.csv`` dall'elenco ufficiale dei comuni ISTAT."""
+    parser = argparse.ArgumentParser(
+        description="Rigenera la tabella dei comuni dall'elenco ufficiale ISTAT"
+    )
+    parser.add_argument("istat", type=Path, help="File Elenco-comuni-italiani.csv")
+    parser.add_argument("--output", type=Path, default=DATA_PATH, help="File di destinazione")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    rows = read_istat_file(args.istat)
+    aliases = None
+    if args.output.exists():
+        # I nomi alternativi già presenti (es. "laquila") restano cercabili
+        aliases = ComuniIndex.from_text(args.output.read_text(encoding="utf-8")).by_name
+    count = write_comuni_file(rows, args.output, aliases=aliases)
+    logger.info("Scritti %d comuni in %s", count, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
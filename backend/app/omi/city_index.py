@@ -0,0 +1,249 @@
+"""
+Ricerca tollerante dei nomi dei comuni.
+
+Sopra la tabella dei comuni (``cadastral_codes``) vengono costruiti, una sola
+volta, tre indici:
+
+- chiavi normalizzate (senza accenti, apostrofi e punteggiatura), anche in
+  forma compatta e senza preposizioni articolate ("Reggio nell'Emilia" →
+  "reggio emilia");
+- un indice di trigrammi per le corrispondenze approssimate (errori di
+  battitura, abbreviazioni come "Sesto S. Giovanni");
+- un trie dei prefissi di ogni parola per l'autocompletamento.
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Articoli e preposizioni ignorati nella chiave "essenziale" del nome
+_STOPWORDS = frozenset(
+    {
+        "d", "di", "de", "del", "dei", "della", "delle", "dello", "degli",
+        "l", "la", "le", "lo", "il", "i", "gli",
+        "in", "nel", "nell", "nella", "nelle", "nello", "nei",
+        "sul", "sull", "sulla", "sui", "al", "all", "alla", "ai", "e", "ed",
+    }
+)
+
+
+def normalize_city_name(name: str) -> str:
+    """
+    Forma normalizzata di un nome: minuscolo, senza accenti né punteggiatura.
+
+    Esempio: ``"Sant'Angelo Lodigiano"`` → ``"sant angelo lodigiano"``.
+    """
+    decomposed = unicodedata.normalize("NFKD", name.lower())
+    ascii_name = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", ascii_name).strip()
+
+
+def _core_key(normalized: str) -> str:
+    """Chiave compatta senza articoli e preposizioni."""
+    return "".join(token for token in normalized.split() if token not in _STOPWORDS)
+
+
+def _trigrams(normalized: str) -> Set[str]:
+    padded = f"  {normalized} "
+    return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+
+def _abbreviation_match(query: List[str], candidate: List[str]) -> bool:
+    """True se le parole coincidono, con le iniziali della query come abbreviazioni."""
+    if len(query) != len(candidate):
+        return False
+    return all(
+        word == other or (len(word) == 1 and other.startswith(word))
+        for word, other in zip(query, candidate)
+    )
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entries: List[Tuple[int, int]] = []
+
+
+class CityIndex:
+    """
+    Indici di ricerca precalcolati sui nomi dei comuni.
+
+    Args:
+        names: Mappa {nome: codice_catastale}, inclusi i nomi alternativi
+        display_names: Denominazione ufficiale per codice, usata per ordinare i risultati
+        max_completions: Risultati conservati in ogni nodo del trie
+    """
+
+    __slots__ = ("_exact", "_compact", "_core", "_names", "_codes", "_trigrams", "_sizes", "_trie")
+
+    def __init__(
+        self,
+        names: Mapping[str, str],
+        display_names: Optional[Mapping[str, str]] = None,
+        max_completions: int = 20,
+    ):
+        self._exact: Dict[str, str] = {}
+        self._compact: Dict[str, str] = {}
+        self._core: Dict[str, str] = {}
+        self._names: List[str] = []
+        self._codes: List[str] = []
+        self._trigrams: Dict[str, List[int]] = {}
+        self._sizes: List[int] = []
+        self._trie = _TrieNode()
+
+        for name, code in names.items():
+            normalized = normalize_city_name(name)
+            if not normalized or normalized in self._exact:
+                continue
+            self._exact[normalized] = code
+            self._compact.setdefault(normalized.replace(" ", ""), code)
+            self._core.setdefault(_core_key(normalized), code)
+
+            entry = len(self._names)
+            self._names.append(normalized)
+            self._codes.append(code)
+            grams = _trigrams(normalized)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._trigrams.setdefault(gram, []).append(entry)
+
+        official = {
+            code: normalize_city_name(display) for code, display in (display_names or {}).items()
+        }
+        nodes: List[_TrieNode] = []
+        for entry, normalized in enumerate(self._names):
+            # Il nome ufficiale precede gli alias; l'inizio del nome le parole interne
+            is_alias = int(official.get(self._codes[entry], normalized) != normalized)
+            start = 0
+            for word in normalized.split():
+                start = normalized.index(word, start)
+                node = self._trie
+                for char in normalized[start:]:
+                    node = node.children.setdefault(char, _TrieNode())
+                    if not node.entries:
+                        nodes.append(node)
+                    node.entries.append((int(start > 0) * 2 + is_alias, entry))
+                start += len(word)
+
+        for node in nodes:
+            ranked = sorted(
+                set(node.entries),
+                key=lambda item: (item[0], len(self._names[item[1]]), self._names[item[1]]),
+            )
+            node.entries = ranked[:max_completions]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def resolve(self, name: str, min_score: float = 0.7) -> Optional[str]:
+        """
+        Codice catastale del comune che corrisponde al nome, anche approssimato.
+
+        Prova nell'ordine la forma normalizzata, quella compatta, quella senza
+        preposizioni, le abbreviazioni e infine la somiglianza per trigrammi,
+        che deve superare ``min_score`` e non essere ambigua. La somiglianza
+        corregge solo errori di battitura: nei nomi di più parole la prima deve
+        coincidere, in quelli di una sola parola l'iniziale. Senza
+        corrispondenze restituisce None, così il chiamante può ripiegare su
+        CAP o provincia.
+        """
+        normalized = normalize_city_name(name)
+        if not normalized:
+            return None
+        code = (
+            self._exact.get(normalized)
+            or self._compact.get(normalized.replace(" ", ""))
+            or self._core.get(_core_key(normalized))
+        )
+        if code:
+            return code
+
+        tokens = normalized.split()
+        if any(len(token) == 1 for token in tokens):
+            abbreviated = {
+                self._codes[entry]
+                for entry in self._entries_for(normalized)
+                if _abbreviation_match(tokens, self._names[entry].split())
+            }
+            if len(abbreviated) == 1:
+                return abbreviated.pop()
+
+        # La somiglianza corregge solo errori di battitura: nei nomi composti la
+        # prima parola deve coincidere ("Agrate Brianza" non è "Carate Brianza"),
+        # in quelli di una sola parola l'iniziale
+        best: Dict[str, float] = {}
+        for entry, score in self._scores(normalized).items():
+            candidate = self._names[entry]
+            if len(tokens) > 1:
+                if candidate.split()[0] != tokens[0]:
+                    continue
+            elif candidate[0] != normalized[0]:
+                continue
+            code = self._codes[entry]
+            if score > best.get(code, 0.0):
+                best[code] = score
+        matches = sorted(best.items(), key=lambda item: -item[1])
+        if not matches or matches[0][1] < min_score:
+            return None
+        best_code, best_score = matches[0]
+        if any(code != best_code and score >= best_score - 0.05 for code, score in matches[1:]):
+            return None
+        return best_code
+
+    def _scores(self, normalized: str) -> Dict[int, float]:
+        """Coefficiente di Dice sui trigrammi per ogni voce con trigrammi in comune."""
+        grams = _trigrams(normalized)
+        counts: Dict[int, int] = {}
+        for gram in grams:
+            for entry in self._trigrams.get(gram, ()):
+                counts[entry] = counts.get(entry, 0) + 1
+        return {
+            entry: 2 * common / (len(grams) + self._sizes[entry]) for entry, common in counts.items()
+        }
+
+    def _entries_for(self, normalized: str) -> Set[int]:
+        entries: Set[int] = set()
+        for gram in _trigrams(normalized):
+            entries.update(self._trigrams.get(gram, ()))
+        return entries
+
+    def fuzzy(self, name: str, limit: int = 5) -> List[Tuple[str, float]]:
+        """
+        Comuni più simili al nome secondo il coefficiente di Dice sui trigrammi.
+
+        Returns:
+            Coppie ``(codice, punteggio)`` in ordine di punteggio decrescente,
+            un solo risultato per codice
+        """
+        best: Dict[str, float] = {}
+        for entry, score in self._scores(normalize_city_name(name)).items():
+            code = self._codes[entry]
+            if score > best.get(code, 0.0):
+                best[code] = score
+        ranked = sorted(best.items(), key=lambda item: -item[1])
+        return [(code, round(score, 3)) for code, score in ranked[:limit]]
+
+    def complete(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Codici dei comuni con una parola che inizia con il prefisso.
+
+        I nomi che iniziano con il prefisso precedono quelli in cui il
+        prefisso corrisponde a una parola interna; a parità, i più corti.
+        """
+        node = self._trie
+        for char in normalize_city_name(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        codes: List[str] = []
+        for _, entry in node.entries:
+            code = self._codes[entry]
+            if code not in codes:
+                codes.append(code)
+                if len(codes) >= limit:
+                    break
+        return codes
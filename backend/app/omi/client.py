@@ -2,25 +2,68 @@
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from pathlib import Path
+from functools import partial
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import httpx
 from pydantic import BaseModel, Field
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 from app.omi.cadastral_codes import get_cadastral_code
-from app.omi.property_types import PropertyType
+from app.omi.property_types import PropertyType, normalise_property_type
+from app.omi.offline import OMIOfflineDataset
+from app.omi.quotations import QuotationTable
+from app.omi.rate_limiter import RequestPriority, TokenBucketScheduler
+from app.omi.resilience import CircuitBreaker
+from app.omi.shared import OMISharedState, SQLiteSharedState
+from app.omi.store import OMIQuotationStore
 
 
 logger = logging.getLogger(__name__)
 
+BASE_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_STORE_PATH = BASE_DIR / "storage" / "omi" / "quotations.sqlite3"
+
 PROPERTY_TYPE_VALUES = {prop_type.value for prop_type in PropertyType}
 
+# Campi dello schema {zona: {tipo: {...}}} restituito da 3eurotools
+_KNOWN_SCHEMA_PRICE_FIELDS = (
+    "prezzo_acquisto_min",
+    "prezzo_acquisto_max",
+    "prezzo_acquisto_medio",
+    "prezzo_affitto_min",
+    "prezzo_affitto_max",
+    "prezzo_affitto_medio",
+)
+_KNOWN_SCHEMA_STATE_FIELD = "stato_di_conservazione_mediano_della_zona"
+
+# Voce della cache negativa condivisa per i comuni senza quotazioni (risultato
+# vuoto, non un errore)
+_EMPTY_RESULT = "__risultato_vuoto__"
+_KNOWN_SCHEMA_FIELDS = frozenset(_KNOWN_SCHEMA_PRICE_FIELDS)
+
 
 class OMIServiceError(RuntimeError):
     """Errore generato dal servizio di quotazioni OMI esterno."""
 
 
+class OMICircuitOpenError(OMIServiceError):
+    """Il circuito verso il servizio OMI è aperto: la chiamata non è stata effettuata."""
+
+
+def _is_transient_error(exc: BaseException) -> bool:
+    """Errori per cui ha senso ritentare: rete, timeout, 5xx e 429."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status_code = exc.response.status_code
+        return status_code >= 500 or status_code in (408, 429)
+    return isinstance(exc, httpx.TransportError)
+
+
 class OMINoQuotationsError(RuntimeError):
     """Segnala che non sono disponibili quotazioni per i parametri richiesti."""
 
@@ -67,32 +110,213 @@ class OMIResponse(BaseModel):
     quotations: List[OMIQuotation] = Field(default_factory=list)
     timestamp: datetime = Field(default_factory=datetime.now)
     zone_count: int = Field(default=0, description="Numero di zone OMI trovate")
+    semestre: Optional[str] = Field(
+        default=None,
+        description="Semestre OMI delle quotazioni (AAAA-S1/S2), se noto",
+    )
+    stale: bool = Field(
+        default=False,
+        description="True se il servizio OMI non è raggiungibile e viene servito l'ultimo dato valido",
+    )
 
 
-class OMICache:
-    """Cache semplice per ridurre le chiamate API."""
+CachedValue = Union[OMIResponse, QuotationTable]
+
+
+class _CacheEntry:
+    """Voce della cache OMI con scadenza su orologio monotono."""
+
+    __slots__ = ("value", "expires_at", "stale_until", "retain_until", "size")
+
+    def __init__(
+        self,
+        value: CachedValue,
+        expires_at: float,
+        stale_until: float,
+        retain_until: float,
+        size: int,
+    ):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.retain_until = retain_until
+        self.size = size
+
+
+def _estimate_response_size(response: CachedValue) -> int:
+    """Stima approssimativa dell'occupazione in memoria di una voce di cache OMI."""
+    if isinstance(response, QuotationTable):
+        return response.estimated_size()
+    return 1024 + 640 * len(response.quotations)
+
 
-    def __init__(self, ttl_seconds: int = 3600):
-        self._cache: Dict[str, tuple[OMIResponse, datetime]] = {}
-        self._ttl = timedelta(seconds=ttl_seconds)
+class OMICache:
+    """Cache LRU in memoria con scadenza TTL e dimensione limitata.
+
+    Le voci scadono dopo ``ttl_seconds`` misurati con ``time.monotonic`` e
+    vengono rimosse sia in lettura sia dalla pulizia periodica (``sweep``).
+    Quando si supera ``max_entries`` o ``max_bytes`` viene espulsa la voce
+    usata meno di recente. Con ``stale_ttl_seconds`` le voci scadute restano
+    disponibili tramite ``get_stale`` per quel periodo aggiuntivo, così da
+    servirle mentre vengono aggiornate in background; con
+    ``stale_if_error_seconds`` restano disponibili più a lungo come ultimo
+    valore noto da usare quando il servizio OMI non risponde.
+    """
 
-    def get(self, key: str) -> Optional[OMIResponse]:
+    def __init__(
+        self,
+        ttl_seconds: int = 3600,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        stale_ttl_seconds: float = 0.0,
+        stale_if_error_seconds: float = 0.0,
+        sizeof: Optional[Callable[[CachedValue], int]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._cache: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._ttl = float(ttl_seconds)
+        self._stale_ttl = float(stale_ttl_seconds)
+        self._stale_if_error = float(stale_if_error_seconds)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof or _estimate_response_size
+        self._clock = clock
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._stale_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._cache.get(key)
+        return entry is not None and entry.expires_at > self._clock()
+
+    def get(self, key: str) -> Optional[CachedValue]:
         """Recupera un valore dalla cache se non scaduto."""
-        if key in self._cache:
-            value, timestamp = self._cache[key]
-            if datetime.now() - timestamp < self._ttl:
-                return value
-            else:
-                del self._cache[key]
-        return None
+        entry = self._cache.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        now = self._clock()
+        if entry.expires_at <= now:
+            if entry.retain_until <= now:
+                self._remove(key)
+                self._expirations += 1
+            self._misses += 1
+            return None
+
+        self._cache.move_to_end(key)
+        self._hits += 1
+        return entry.value
 
-    def set(self, key: str, value: OMIResponse) -> None:
-        """Salva un valore nella cache."""
-        self._cache[key] = (value, datetime.now())
+    def get_stale(self, key: str, on_error: bool = False) -> Optional[CachedValue]:
+        """
+        Recupera un valore anche se scaduto.
+
+        Args:
+            key: Chiave della voce
+            on_error: Usa la finestra ``stale_if_error_seconds`` invece di ``stale_ttl_seconds``
+        """
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        limit = entry.retain_until if on_error else entry.stale_until
+        if limit <= self._clock():
+            return None
+        self._cache.move_to_end(key)
+        self._stale_hits += 1
+        return entry.value
+
+    def ttl_remaining(self, key: str) -> Optional[float]:
+        """Secondi rimanenti prima della scadenza della voce, o None se assente."""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        return entry.expires_at - self._clock()
+
+    def set(self, key: str, value: CachedValue, ttl_seconds: Optional[float] = None) -> None:
+        """Salva un valore nella cache, espellendo le voci meno recenti se necessario."""
+        if key in self._cache:
+            self._remove(key)
+
+        ttl = self._ttl if ttl_seconds is None else float(ttl_seconds)
+        size = self._sizeof(value)
+        expires_at = self._clock() + ttl
+        self._cache[key] = _CacheEntry(
+            value,
+            expires_at,
+            expires_at + self._stale_ttl,
+            expires_at + max(self._stale_ttl, self._stale_if_error),
+            size,
+        )
+        self._total_bytes += size
+        self._enforce_limits()
+
+    def sweep(self) -> int:
+        """Rimuove tutte le voci scadute e restituisce quante ne sono state eliminate."""
+        now = self._clock()
+        expired = [key for key, entry in self._cache.items() if entry.retain_until <= now]
+        for key in expired:
+            self._remove(key)
+        self._expirations += len(expired)
+        return len(expired)
+
+    async def run_sweeper(self, interval_seconds: float = 60.0) -> None:
+        """Esegue ``sweep`` a intervalli regolari finché il task non viene annullato."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            removed = self.sweep()
+            if removed:
+                logger.debug("Cache OMI: rimosse %d voci scadute", removed)
+
+    def stats(self) -> Dict[str, float]:
+        """Restituisce i contatori di utilizzo della cache."""
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._cache),
+            "bytes": self._total_bytes,
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "expirations": self._expirations,
+            "stale_hits": self._stale_hits,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+        }
 
     def clear(self) -> None:
         """Pulisce la cache."""
         self._cache.clear()
+        self._total_bytes = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._cache.pop(key)
+        self._total_bytes -= entry.size
+
+    def _enforce_limits(self) -> None:
+        while self._cache and (
+            (self._max_entries and len(self._cache) > self._max_entries)
+            or (self._max_bytes and self._total_bytes > self._max_bytes)
+        ):
+            key = next(iter(self._cache))
+            self._remove(key)
+            self._evictions += 1
+
+
+class _InFlight:
+    """Chiamata OMI in corso condivisa tra più richieste concorrenti."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[QuotationTable]"):
+        self.task = task
+        self.waiters = 0
 
 
 class OMIClient:
@@ -100,17 +324,95 @@ class OMIClient:
 
     BASE_URL = "https://3eurotools.it/api-quotazioni-immobiliari-omi/ricerca"
 
-    def __init__(self, cache_ttl: int = 3600):
+    def __init__(
+        self,
+        cache_ttl: int = 3600,
+        cache_max_entries: int = 1024,
+        cache_max_bytes: Optional[int] = 32 * 1024 * 1024,
+        cache_sweep_interval: float = 60.0,
+        cache_stale_ttl: float = 3600.0,
+        stale_if_error_ttl: float = 7 * 24 * 3600.0,
+        stale_fallback_timeout: float = 5.0,
+        negative_ttl: float = 300.0,
+        store: Optional[OMIQuotationStore] = None,
+        rate_limit_per_second: float = 1 / 3,
+        rate_limit_burst: int = 1,
+        retry_attempts: int = 3,
+        retry_backoff: float = 0.5,
+        retry_max_backoff: float = 8.0,
+        circuit_failure_threshold: int = 5,
+        circuit_recovery_timeout: float = 30.0,
+        offline_dataset: Optional[OMIOfflineDataset] = None,
+        shared_state: Optional[OMISharedState] = None,
+        shared_lease_ttl: float = 30.0,
+    ):
         """
         Inizializza il client OMI.
 
         Args:
             cache_ttl: Durata della cache in secondi (default: 1 ora)
+            cache_max_entries: Numero massimo di risposte mantenute in cache
+            cache_max_bytes: Occupazione massima stimata della cache in byte
+            cache_sweep_interval: Intervallo in secondi della pulizia delle voci scadute
+            cache_stale_ttl: Secondi oltre la scadenza in cui una voce viene ancora
+                servita mentre si aggiorna in background
+            stale_if_error_ttl: Secondi oltre la scadenza in cui l'ultimo dato valido
+                viene servito (con ``stale=True``) se il servizio OMI fallisce
+            stale_fallback_timeout: Attesa massima del servizio OMI quando è
+                disponibile un ultimo dato valido da servire al suo posto
+            negative_ttl: Durata in secondi della cache dei risultati vuoti e degli
+                errori 4xx del servizio OMI
+            store: Archivio persistente opzionale, consultato dopo la cache in memoria
+            rate_limit_per_second: Richieste al secondo consentite verso il servizio OMI
+            rate_limit_burst: Numero di richieste consecutive consentite senza attesa
+            retry_attempts: Tentativi complessivi per gli errori transitori (rete, 5xx, 429)
+            retry_backoff: Base in secondi del backoff esponenziale con jitter tra i tentativi
+            retry_max_backoff: Attesa massima in secondi tra due tentativi
+            circuit_failure_threshold: Errori transitori consecutivi che aprono il circuito
+            circuit_recovery_timeout: Secondi di circuito aperto prima di una chiamata di prova
+            offline_dataset: Archivio dei file OMI ufficiali; se indicato il client
+                risponde solo da lì, senza chiamate al servizio esterno
+            shared_state: Stato condiviso tra i processi worker (budget globale di
+                richieste, lease per comune, cache negativa); i dati scaricati sono
+                condivisi tramite ``store``
+            shared_lease_ttl: Durata massima in secondi del lease con cui un solo
+                processo scarica i dati di un comune
         """
-        self._cache = OMICache(ttl_seconds=cache_ttl)
+        self._cache = OMICache(
+            ttl_seconds=cache_ttl,
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes,
+            stale_ttl_seconds=cache_stale_ttl,
+            stale_if_error_seconds=stale_if_error_ttl,
+        )
+        self._negative_cache = OMICache(
+            ttl_seconds=negative_ttl,
+            max_entries=4096,
+            sizeof=lambda _: 256,
+        )
+        self._negative_ttl = negative_ttl
+        self._stale_fallback_timeout = stale_fallback_timeout
+        self._cache_sweep_interval = cache_sweep_interval
+        self._store = store
+        self._inflight: Dict[str, _InFlight] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        self._query_counts: Counter = Counter()
+        self._comune_names: Dict[str, str] = {}
+        self._sweeper_task: Optional[asyncio.Task] = None
         self._client: Optional[httpx.AsyncClient] = None
-        self._rate_limit_delay = 3.0  # secondi tra le richieste
-        self._last_request_time: Optional[datetime] = None
+        self._rate_limiter = TokenBucketScheduler(
+            rate=rate_limit_per_second, burst=rate_limit_burst
+        )
+        self._retry_attempts = max(1, retry_attempts)
+        self._retry_backoff = retry_backoff
+        self._retry_max_backoff = retry_max_backoff
+        self._offline = offline_dataset
+        self._shared = shared_state
+        self._shared_lease_ttl = shared_lease_ttl
+        self._circuit = CircuitBreaker(
+            failure_threshold=circuit_failure_threshold,
+            recovery_timeout=circuit_recovery_timeout,
+        )
 
     async def _get_client(self) -> httpx.AsyncClient:
         """Ottiene o crea il client HTTP."""
@@ -118,13 +420,87 @@ class OMIClient:
             self._client = httpx.AsyncClient(timeout=30.0)
         return self._client
 
-    async def _wait_for_rate_limit(self) -> None:
-        """Attende per rispettare il rate limiting."""
-        if self._last_request_time:
-            elapsed = (datetime.now() - self._last_request_time).total_seconds()
-            if elapsed < self._rate_limit_delay:
-                await asyncio.sleep(self._rate_limit_delay - elapsed)
-        self._last_request_time = datetime.now()
+    def _ensure_sweeper(self) -> None:
+        """Avvia la pulizia periodica della cache sul loop corrente, se non attiva."""
+        loop = asyncio.get_running_loop()
+        task = self._sweeper_task
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._sweeper_task = loop.create_task(
+            self._cache.run_sweeper(self._cache_sweep_interval)
+        )
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Restituisce le statistiche della cache (hit, miss, espulsioni, scadenze)."""
+        stats = self._cache.stats()
+        stats["negative_entries"] = len(self._negative_cache)
+        return stats
+
+    def _load_from_store(self, cache_key: str, allow_expired: bool = False) -> Optional[QuotationTable]:
+        """Legge una risposta dall'archivio persistente, se configurato."""
+        if self._store is None:
+            return None
+        try:
+            payload = self._store.get(cache_key, allow_expired=allow_expired)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Archivio OMI non leggibile (%s): %s", self._store.path, exc)
+            return None
+        if payload is None:
+            return None
+        try:
+            return QuotationTable.from_response(OMIResponse.model_validate_json(payload))
+        except ValueError as exc:
+            logger.warning("Voce non valida nell'archivio OMI per %s: %s", cache_key, exc)
+            return None
+
+    def _save_to_store(self, cache_key: str, table: QuotationTable) -> None:
+        """Salva le quotazioni di un comune nell'archivio persistente, se configurato."""
+        if self._store is None:
+            return
+        try:
+            self._store.set(cache_key, table.to_response().model_dump_json(), fetched_at=table.timestamp)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Impossibile salvare nell'archivio OMI (%s): %s", self._store.path, exc)
+
+    @property
+    def offline(self) -> bool:
+        """True se il client risponde dall'archivio offline dei file OMI ufficiali."""
+        return self._offline is not None
+
+    @property
+    def circuit_open(self) -> bool:
+        """True se le chiamate al servizio OMI vengono rifiutate senza essere effettuate."""
+        return self._circuit.is_open
+
+    def circuit_stats(self) -> Dict[str, object]:
+        """Restituisce stato e contatori del circuit breaker."""
+        return self._circuit.stats()
+
+    def rate_limiter_stats(self) -> Dict[str, object]:
+        """Restituisce profondità delle code e tempi di attesa del rate limiter."""
+        return self._rate_limiter.stats()
+
+    async def _wait_for_rate_limit(
+        self, priority: RequestPriority = RequestPriority.INTERACTIVE
+    ) -> None:
+        """Attende il proprio turno nello scheduler del rate limiting."""
+        waited = await self._rate_limiter.acquire(priority)
+        if self._shared is not None:
+            # Budget globale: la prenotazione può richiedere di attendere i
+            # token già prenotati dagli altri processi
+            delay = await asyncio.to_thread(
+                self._shared.reserve_token, self._rate_limiter.rate, self._rate_limiter.burst
+            )
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    # Restituzione immediata: dopo l'annullamento non si attende altro
+                    self._shared.refund_token(self._rate_limiter.burst)
+                    raise
+                waited += delay
+        if waited:
+            logger.debug("Attesa rate limit OMI (%s): %.2fs", priority.name.lower(), waited)
 
     def _generate_cache_key(
         self,
@@ -222,24 +598,7 @@ class OMIClient:
     @staticmethod
     def _normalise_property_type(raw_value: Optional[str], fallback: Optional[str] = None) -> Optional[str]:
         """Normalizza il valore del tipo immobile in snake_case."""
-
-        if not raw_value:
-            return fallback
-
-        candidate = raw_value.strip()
-        if not candidate:
-            return fallback
-
-        slug = candidate.lower().replace(" ", "_")
-        if slug in PROPERTY_TYPE_VALUES:
-            return slug
-
-        # Alcune risposte usano maiuscole/misti o includono caratteri extra
-        slug = "".join(ch if ch.isalnum() else "_" for ch in candidate).lower()
-        while "__" in slug:
-            slug = slug.replace("__", "_")
-        slug = slug.strip("_")
-        return slug or fallback
+        return normalise_property_type(raw_value, fallback)
 
     def _parse_price_block(self, block: Dict[str, Union[str, int, float, Dict]]) -> Dict[str, Optional[float]]:
         """Estrae valori min/medio/max da un blocco di prezzo annidato."""
@@ -372,6 +731,88 @@ class OMIClient:
     ) -> Tuple[List[OMIQuotation], Set[str]]:
         """Estrae le quotazioni dalla struttura JSON dell'API."""
 
+        parsed = self._parse_zone_type_schema(payload, zona_omi_filter, tipo_immobile_filter)
+        if parsed is not None:
+            return parsed
+
+        return self._walk_quotations(payload, zona_omi_filter, tipo_immobile_filter)
+
+    def _parse_zone_type_schema(
+        self,
+        payload: Union[Dict, List],
+        zona_omi_filter: Optional[str],
+        tipo_immobile_filter: Optional[PropertyType],
+    ) -> Optional[Tuple[List[OMIQuotation], Set[str]]]:
+        """
+        Parser rapido per lo schema restituito da 3eurotools.
+
+        Lo schema è ``{zona: {tipo_immobile: {prezzo_acquisto_min: ..., ...}}}``
+        con i campi prezzo al primo livello. La risposta viene letta in un solo
+        passaggio con accesso diretto alle chiavi; se la struttura non
+        corrisponde restituisce None e si ricorre al parser generico.
+        """
+
+        if not isinstance(payload, dict) or not payload:
+            return None
+
+        quotations: List[OMIQuotation] = []
+        zones_found: Set[str] = set()
+        type_filter = tipo_immobile_filter.value if tipo_immobile_filter else None
+        to_float = self._to_float
+
+        for zone, types in payload.items():
+            if not isinstance(types, dict) or not types:
+                return None
+
+            for raw_type, fields in types.items():
+                if not isinstance(fields, dict) or _KNOWN_SCHEMA_FIELDS.isdisjoint(fields):
+                    return None
+
+                prices: Dict[str, Optional[float]] = {}
+                has_values = False
+                for name in _KNOWN_SCHEMA_PRICE_FIELDS:
+                    value = fields.get(name)
+                    if value is not None:
+                        if type(value) is not float:
+                            value = to_float(value)
+                        has_values = has_values or value is not None
+                    prices[name] = value
+                if not has_values:
+                    continue
+
+                zone_code = zone.strip()
+                zones_found.add(zone_code)
+                if zona_omi_filter and zone_code != zona_omi_filter:
+                    continue
+
+                property_type = (
+                    raw_type
+                    if raw_type in PROPERTY_TYPE_VALUES
+                    else self._normalise_property_type(raw_type, raw_type) or "sconosciuto"
+                )
+                if type_filter and property_type != type_filter:
+                    continue
+
+                state = fields.get(_KNOWN_SCHEMA_STATE_FIELD)
+                quotations.append(
+                    OMIQuotation(
+                        zona_omi=zone_code,
+                        property_type=property_type,
+                        stato_conservazione=state if isinstance(state, str) else None,
+                        **prices,
+                    )
+                )
+
+        return quotations, zones_found
+
+    def _walk_quotations(
+        self,
+        payload: Union[Dict, List],
+        zona_omi_filter: Optional[str],
+        tipo_immobile_filter: Optional[PropertyType],
+    ) -> Tuple[List[OMIQuotation], Set[str]]:
+        """Parser generico: visita ricorsivamente la struttura JSON cercando quotazioni."""
+
         quotations: List[OMIQuotation] = []
         zones_found: Set[str] = set()
         visited: Set[int] = set()
@@ -482,6 +923,7 @@ class OMIClient:
         zona_omi: Optional[str] = None,
         tipo_immobile: Optional[PropertyType] = None,
         use_cache: bool = True,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
     ) -> OMIResponse:
         """
         Interroga le API OMI per ottenere le quotazioni immobiliari.
@@ -492,11 +934,51 @@ class OMIClient:
             operazione: "acquisto", "affitto" o None per entrambi
             zona_omi: Zona OMI specifica (opzionale)
             tipo_immobile: Tipo di immobile (opzionale)
-            use_cache: Usa la cache se disponibile
+            use_cache: Usa la cache se disponibile (se False forza l'aggiornamento)
+            priority: Corsia del rate limiter (interattiva, background o batch)
 
         Returns:
             OMIResponse con le quotazioni
 
+        Raises:
+            ValueError: Se il comune non è trovato
+            OMIServiceError: Se il servizio OMI restituisce un errore
+        """
+        table = await self.get_quotation_table(city, use_cache=use_cache, priority=priority)
+
+        if (
+            metri_quadri == 1.0
+            and not operazione
+            and not zona_omi
+            and not tipo_immobile
+        ):
+            return table.to_response()
+
+        return table.to_response(
+            comune=city.title(),
+            metri_quadri=metri_quadri,
+            operazione=operazione,
+            zona_omi=zona_omi,
+            property_type=tipo_immobile.value if tipo_immobile else None,
+        )
+
+    async def get_quotation_table(
+        self,
+        city: str,
+        use_cache: bool = True,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
+    ) -> QuotationTable:
+        """
+        Restituisce le quotazioni indicizzate del comune senza costruire modelli Pydantic.
+
+        Args:
+            city: Nome del comune italiano
+            use_cache: Usa la cache se disponibile (se False forza l'aggiornamento)
+            priority: Corsia del rate limiter (interattiva, background o batch)
+
+        Returns:
+            QuotationTable con tutte le zone e i tipi del comune a 1 mq
+
         Raises:
             ValueError: Se il comune non è trovato
             OMIServiceError: Se il servizio OMI restituisce un errore
@@ -505,45 +987,346 @@ class OMIClient:
         if not codice_comune:
             raise ValueError(f"Codice catastale non trovato per il comune: {city}")
 
+        self._ensure_sweeper()
+        self._query_counts[codice_comune] += 1
+        self._comune_names.setdefault(codice_comune, city)
+
+        # Una sola risposta non filtrata per comune (a 1 mq) contiene tutte le
+        # zone e tutti i tipi: le varianti richieste vengono ricavate localmente
+        return await self._get_comune_dataset(city, codice_comune, use_cache, priority)
+
+    async def _get_comune_dataset(
+        self,
+        city: str,
+        codice_comune: str,
+        use_cache: bool = True,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
+    ) -> QuotationTable:
+        """
+        Restituisce le quotazioni non filtrate del comune a 1 mq.
+
+        Consulta cache in memoria e archivio persistente; in caso di mancanza
+        esegue una sola chiamata al servizio OMI condivisa tra i chiamanti.
+        """
+        cache_key = self._generate_cache_key(codice_comune, 1.0, None, None, None)
+
+        if self._offline is not None:
+            return self._load_offline(city, codice_comune, cache_key)
+
         # Controlla la cache
         if use_cache:
-            cache_key = self._generate_cache_key(
-                codice_comune, metri_quadri, operazione, zona_omi, tipo_immobile
-            )
             cached = self._cache.get(cache_key)
-            if cached:
+            if cached is not None:
                 return cached
 
-        # Prepara i parametri della richiesta
+            stored = self._load_from_store(cache_key)
+            if stored is not None:
+                self._cache.set(cache_key, stored)
+                return stored
+
+            # Stale-while-revalidate: il valore scaduto viene servito subito
+            # mentre l'aggiornamento prosegue in background
+            stale = self._cache.get_stale(cache_key)
+            if stale is None:
+                stale = self._load_from_store(cache_key, allow_expired=True)
+            if stale is not None:
+                self._schedule_refresh(city, codice_comune, cache_key)
+                return stale
+
+        # Errori 4xx e risultati vuoti recenti non tornano al servizio
+        negative = self._negative_cache.get(cache_key)
+        if negative is not None:
+            raise OMIServiceError(negative)
+        if self._shared is not None:
+            negative = await asyncio.to_thread(self._shared.get_negative, cache_key)
+            if negative is not None:
+                return self._from_shared_negative(city, codice_comune, cache_key, negative)
+
+        fallback = self._cache.get_stale(cache_key, on_error=True)
+        if fallback is None:
+            fallback = self._load_from_store(cache_key, allow_expired=True)
+
+        # Le richieste concorrenti con la stessa chiave condividono un'unica chiamata
+        fetch = self._single_flight(
+            cache_key,
+            lambda: self._fetch(
+                city=city,
+                codice_comune=codice_comune,
+                cache_key=cache_key,
+                priority=priority,
+            ),
+        )
+        if fallback is None:
+            return await fetch
+
+        # Con un ultimo dato valido disponibile non si attende oltre
+        # ``stale_fallback_timeout``: la chiamata prosegue in background
+        fetch_task = asyncio.ensure_future(fetch)
+        try:
+            done, _ = await asyncio.wait({fetch_task}, timeout=self._stale_fallback_timeout)
+        except asyncio.CancelledError:
+            fetch_task.cancel()
+            raise
+
+        if done:
+            error = fetch_task.exception()
+            if error is None:
+                return fetch_task.result()
+            if not isinstance(error, OMIServiceError):
+                raise error
+            reason = str(error) or "errore"
+        else:
+            reason = "timeout"
+            self._background_tasks.add(fetch_task)
+            fetch_task.add_done_callback(self._discard_background_task)
+        logger.warning(
+            "Servizio OMI non disponibile per %s (%s), uso l'ultimo dato valido",
+            city,
+            reason,
+        )
+        return fallback.as_stale()
+
+    def _load_offline(self, city: str, codice_comune: str, cache_key: str) -> QuotationTable:
+        """Legge le quotazioni del comune dall'archivio offline, tenendole in cache."""
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        table = self._offline.load_comune(codice_comune, comune=city.title())
+        if table is None:
+            raise OMIServiceError("Archivio OMI offline vuoto: importare i file del semestre")
+        self._cache.set(cache_key, table)
+        return table
+
+    def _discard_background_task(self, task: asyncio.Task) -> None:
+        """Rimuove un task di background concluso, marcandone l'eventuale eccezione come letta."""
+        self._background_tasks.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def _schedule_refresh(self, city: str, codice_comune: str, cache_key: str) -> None:
+        """Avvia in background l'aggiornamento di una voce scaduta, se non già in corso."""
+        if cache_key in self._inflight:
+            return
+
+        async def refresh() -> None:
+            try:
+                await self._single_flight(
+                    cache_key,
+                    lambda: self._fetch(
+                        city=city,
+                        codice_comune=codice_comune,
+                        cache_key=cache_key,
+                        priority=RequestPriority.BACKGROUND,
+                    ),
+                )
+            except OMIServiceError as exc:
+                logger.warning("Aggiornamento in background OMI fallito per %s: %s", city, exc)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._discard_background_task)
+
+    def dataset_ttl_remaining(self, codice_comune: str) -> Optional[float]:
+        """
+        Secondi di validità rimanenti per i dati del comune.
+
+        Considera sia la cache in memoria sia l'archivio persistente; None se il
+        comune non è mai stato scaricato.
+        """
+        cache_key = self._generate_cache_key(codice_comune, 1.0, None, None, None)
+        remaining = [self._cache.ttl_remaining(cache_key)]
+        if self._store is not None:
+            try:
+                expires_at = self._store.expires_at(cache_key)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Archivio OMI non leggibile (%s): %s", self._store.path, exc)
+            else:
+                if expires_at is not None:
+                    remaining.append(expires_at - time.time())
+        known = [value for value in remaining if value is not None]
+        return max(known) if known else None
+
+    async def warm_comune(self, city: str, refresh_margin: float = 600.0) -> bool:
+        """
+        Prepara in cache i dati di un comune, aggiornandoli se prossimi alla scadenza.
+
+        Args:
+            city: Nome del comune
+            refresh_margin: Secondi prima della scadenza entro cui forzare l'aggiornamento
+
+        Returns:
+            True se è stata eseguita una chiamata al servizio OMI
+        """
+        if self._offline is not None:
+            return False
+
+        codice_comune = get_cadastral_code(city)
+        if not codice_comune:
+            raise ValueError(f"Codice catastale non trovato per il comune: {city}")
+
+        remaining = self.dataset_ttl_remaining(codice_comune)
+        refresh = remaining is None or remaining < refresh_margin
+        await self._get_comune_dataset(
+            city,
+            codice_comune,
+            use_cache=not refresh,
+            priority=RequestPriority.BACKGROUND,
+        )
+        return refresh
+
+    def most_queried_cities(self, limit: int) -> List[str]:
+        """Restituisce i comuni interrogati più spesso dall'avvio del processo."""
+        return [
+            self._comune_names[codice_comune]
+            for codice_comune, _ in self._query_counts.most_common(limit)
+        ]
+
+    async def _single_flight(
+        self,
+        cache_key: str,
+        factory: Callable[[], Awaitable[QuotationTable]],
+    ) -> QuotationTable:
+        """
+        Esegue ``factory`` una sola volta per tutte le richieste concorrenti con la stessa chiave.
+
+        Gli errori vengono propagati a tutti i chiamanti in attesa. Se tutti i
+        chiamanti vengono annullati, anche la chiamata condivisa viene annullata.
+        """
+        flight = self._inflight.get(cache_key)
+        if flight is None:
+            flight = _InFlight(asyncio.get_running_loop().create_task(factory()))
+            self._inflight[cache_key] = flight
+            flight.task.add_done_callback(partial(self._finish_flight, cache_key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                # Ultimo chiamante annullato: nessuno attende più il risultato
+                if self._inflight.get(cache_key) is flight:
+                    del self._inflight[cache_key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish_flight(self, cache_key: str, flight: "_InFlight", task: asyncio.Task) -> None:
+        """Rimuove la chiamata conclusa dall'elenco di quelle in corso."""
+        if self._inflight.get(cache_key) is flight:
+            del self._inflight[cache_key]
+        if not task.cancelled():
+            # Segna l'eccezione come letta anche se nessuno la attende più
+            task.exception()
+
+    async def _fetch(
+        self,
+        city: str,
+        codice_comune: str,
+        cache_key: str,
+        priority: RequestPriority = RequestPriority.INTERACTIVE,
+    ) -> QuotationTable:
+        """
+        Scarica le quotazioni non filtrate del comune e le salva in cache.
+
+        Con lo stato condiviso un solo processo alla volta scarica un comune:
+        gli altri attendono che il risultato compaia nell'archivio persistente.
+        """
+        if self._shared is None:
+            return await self._fetch_upstream(city, codice_comune, cache_key, priority)
+
+        shared = await self._wait_for_shared_fetch(city, codice_comune, cache_key)
+        if shared is not None:
+            return shared
+        try:
+            return await self._fetch_upstream(city, codice_comune, cache_key, priority)
+        finally:
+            await asyncio.to_thread(self._shared.release_lease, cache_key)
+
+    def _from_shared_negative(
+        self, city: str, codice_comune: str, cache_key: str, detail: str
+    ) -> QuotationTable:
+        """
+        Applica una voce della cache negativa condivisa.
+
+        Returns:
+            Quotazioni vuote se il comune non ne ha
+
+        Raises:
+            OMIServiceError: Se la voce è un errore definitivo del servizio
+        """
+        if detail == _EMPTY_RESULT:
+            table = QuotationTable(codice_comune, city.title(), (), datetime.now())
+            self._cache.set(cache_key, table, ttl_seconds=self._negative_ttl)
+            return table
+        self._negative_cache.set(cache_key, detail)
+        raise OMIServiceError(detail)
+
+    async def _wait_for_shared_fetch(
+        self, city: str, codice_comune: str, cache_key: str, poll_interval: float = 0.25
+    ) -> Optional[QuotationTable]:
+        """
+        Acquisisce il lease del comune o attende il risultato di chi lo possiede.
+
+        Returns:
+            Quotazioni scaricate da un altro processo, o None se il lease è
+            stato acquisito e il download spetta al processo corrente
+        """
+        while True:
+            acquired = await asyncio.to_thread(
+                self._shared.acquire_lease, cache_key, self._shared_lease_ttl
+            )
+            # Anche con il lease acquisito si ricontrolla: il processo che lo
+            # deteneva può aver appena salvato il risultato e rilasciato il lease.
+            stored = self._load_from_store(cache_key)
+            negative = None
+            if stored is None:
+                negative = await asyncio.to_thread(self._shared.get_negative, cache_key)
+            if stored is not None or negative is not None:
+                if acquired:
+                    await asyncio.to_thread(self._shared.release_lease, cache_key)
+                if negative is not None:
+                    return self._from_shared_negative(city, codice_comune, cache_key, negative)
+                self._cache.set(cache_key, stored)
+                return stored
+            if acquired:
+                return None
+            await asyncio.sleep(poll_interval)
+
+    async def _fetch_upstream(
+        self,
+        city: str,
+        codice_comune: str,
+        cache_key: str,
+        priority: RequestPriority,
+    ) -> QuotationTable:
+        """Esegue la chiamata al servizio OMI e salva il risultato in cache e in archivio."""
         params = {
             "codice_comune": codice_comune,
-            "metri_quadri": metri_quadri,
+            "metri_quadri": 1.0,
         }
 
-        if operazione:
-            params["operazione"] = operazione
-        if zona_omi:
-            params["zona_omi"] = zona_omi
-        if tipo_immobile:
-            params["tipo_immobile"] = tipo_immobile.value
-
         try:
-            # Rispetta il rate limiting
-            await self._wait_for_rate_limit()
-
-            client = await self._get_client()
-            response = await client.get(self.BASE_URL, params=params)
-            response.raise_for_status()
+            response = await self._request_with_retry(params, priority)
+        except OMICircuitOpenError:
+            raise
         except httpx.HTTPStatusError as exc:
             message = self._extract_error_message(exc.response)
+            status_code = exc.response.status_code
             logger.warning(
                 "Errore HTTP dal servizio OMI (%s): %s",
-                exc.response.status_code,
+                status_code,
                 message,
             )
-            raise OMIServiceError(
-                message or f"Errore HTTP {exc.response.status_code} dal servizio OMI"
-            ) from exc
+            detail = message or f"Errore HTTP {status_code} dal servizio OMI"
+            if 400 <= status_code < 500 and status_code not in (408, 429):
+                self._negative_cache.set(cache_key, detail)
+                if self._shared is not None:
+                    await asyncio.to_thread(
+                        self._shared.set_negative, cache_key, detail, self._negative_ttl
+                    )
+            raise OMIServiceError(detail) from exc
         except httpx.HTTPError as exc:
             logger.warning("Errore di rete verso il servizio OMI: %s", exc)
             raise OMIServiceError(str(exc)) from exc
@@ -559,15 +1342,80 @@ class OMIClient:
             data=data,
             codice_comune=codice_comune,
             comune=city.title(),
-            metri_quadri=metri_quadri,
-            zona_omi_filter=zona_omi,
-            tipo_immobile_filter=tipo_immobile,
+            metri_quadri=1.0,
+            zona_omi_filter=None,
+            tipo_immobile_filter=None,
         )
 
-        if use_cache:
-            self._cache.set(cache_key, omi_response)
+        table = QuotationTable.from_response(omi_response)
 
-        return omi_response
+        if not table:
+            # Risultato vuoto: cache breve e nessuna persistenza fino al semestre;
+            # gli altri processi lo trovano nella cache negativa condivisa
+            self._cache.set(cache_key, table, ttl_seconds=self._negative_ttl)
+            if self._shared is not None:
+                await asyncio.to_thread(
+                    self._shared.set_negative, cache_key, _EMPTY_RESULT, self._negative_ttl
+                )
+            return table
+
+        self._cache.set(cache_key, table)
+        self._save_to_store(cache_key, table)
+
+        return table
+
+    async def _request_with_retry(
+        self,
+        params: Dict[str, object],
+        priority: RequestPriority,
+    ) -> httpx.Response:
+        """
+        Esegue la GET verso il servizio OMI ritentando gli errori transitori.
+
+        Ogni tentativo consulta il circuit breaker e prende un token dal rate
+        limiter; tra un tentativo e l'altro si attende un backoff esponenziale
+        con jitter. A circuito aperto solleva subito ``OMICircuitOpenError``.
+        """
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self._retry_attempts),
+            wait=wait_random_exponential(
+                multiplier=self._retry_backoff, max=self._retry_max_backoff
+            ),
+            retry=retry_if_exception(_is_transient_error),
+            before_sleep=lambda state: logger.info(
+                "Servizio OMI: tentativo %d fallito (%s), nuovo tentativo",
+                state.attempt_number,
+                state.outcome.exception(),
+            ),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                if not self._circuit.allow_request():
+                    raise OMICircuitOpenError(
+                        "Servizio quotazioni OMI temporaneamente sospeso dopo errori ripetuti "
+                        f"(nuovo tentativo tra {self._circuit.retry_after():.0f}s)"
+                    )
+                try:
+                    # Rispetta il rate limiting
+                    await self._wait_for_rate_limit(priority)
+
+                    client = await self._get_client()
+                    response = await client.get(self.BASE_URL, params=params)
+                    response.raise_for_status()
+                except httpx.HTTPError as exc:
+                    if _is_transient_error(exc):
+                        self._circuit.record_failure()
+                    else:
+                        self._circuit.record_success()
+                    raise
+                except BaseException:
+                    # Chiamata annullata: libera l'eventuale slot di prova senza giudicarla
+                    self._circuit.release()
+                    raise
+                self._circuit.record_success()
+                return response
+        raise AssertionError("unreachable")  # pragma: no cover
 
     async def get_purchase_price(
         self,
@@ -588,47 +1436,33 @@ class OMIClient:
         Returns:
             Dict con min, max, medio in €/mq o None
         """
-        # Richiedi con 1 mq per ottenere prezzi al mq
-        response = await self.query(
-            city=city,
-            metri_quadri=1.0,
-            operazione="acquisto",
+        # Le quotazioni in cache sono al mq: accesso diretto per zona e tipo
+        table = await self.get_quotation_table(city)
+        quotation = table.first(
             zona_omi=zona_omi,
-            tipo_immobile=tipo_immobile,
+            property_type=tipo_immobile.value if tipo_immobile else None,
+            operazione="acquisto",
         )
 
-        if not response.quotations:
+        if quotation is None:
             raise OMINoQuotationsError(
                 "Quotazioni di acquisto non disponibili per i parametri indicati"
             )
 
-        # Cerca la quotazione per il tipo richiesto o prendi la prima disponibile
-        quotation = response.quotations[0]
-        if tipo_immobile:
-            for q in response.quotations:
-                if q.property_type == tipo_immobile.value:
-                    quotation = q
-                    break
-
-        if not any(
-            (
-                quotation.prezzo_acquisto_min,
-                quotation.prezzo_acquisto_medio,
-                quotation.prezzo_acquisto_max,
-            )
-        ):
+        minimo, massimo, medio = quotation.acquisto
+        if not any((minimo, medio, massimo)):
             raise OMINoQuotationsError(
                 "Il servizio OMI non ha restituito valori di acquisto per i parametri indicati"
             )
 
         # Converti in prezzi al mq totali per i metri quadri richiesti
         return {
-            "min": (quotation.prezzo_acquisto_min or 0) * metri_quadri,
-            "max": (quotation.prezzo_acquisto_max or 0) * metri_quadri,
-            "medio": (quotation.prezzo_acquisto_medio or 0) * metri_quadri,
-            "min_mq": quotation.prezzo_acquisto_min or 0,
-            "max_mq": quotation.prezzo_acquisto_max or 0,
-            "medio_mq": quotation.prezzo_acquisto_medio or 0,
+            "min": (minimo or 0) * metri_quadri,
+            "max": (massimo or 0) * metri_quadri,
+            "medio": (medio or 0) * metri_quadri,
+            "min_mq": minimo or 0,
+            "max_mq": massimo or 0,
+            "medio_mq": medio or 0,
         }
 
     async def get_rental_price(
@@ -650,54 +1484,51 @@ class OMIClient:
         Returns:
             Dict con min, max, medio in €/mq/mese o None
         """
-        # Richiedi con 1 mq per ottenere prezzi al mq
-        response = await self.query(
-            city=city,
-            metri_quadri=1.0,
-            operazione="affitto",
+        # Le quotazioni in cache sono al mq: accesso diretto per zona e tipo
+        table = await self.get_quotation_table(city)
+        quotation = table.first(
             zona_omi=zona_omi,
-            tipo_immobile=tipo_immobile,
+            property_type=tipo_immobile.value if tipo_immobile else None,
+            operazione="affitto",
         )
 
-        if not response.quotations:
+        if quotation is None:
             raise OMINoQuotationsError(
                 "Quotazioni di affitto non disponibili per i parametri indicati"
             )
 
-        # Cerca la quotazione per il tipo richiesto o prendi la prima disponibile
-        quotation = response.quotations[0]
-        if tipo_immobile:
-            for q in response.quotations:
-                if q.property_type == tipo_immobile.value:
-                    quotation = q
-                    break
-
-        if not any(
-            (
-                quotation.prezzo_affitto_min,
-                quotation.prezzo_affitto_medio,
-                quotation.prezzo_affitto_max,
-            )
-        ):
+        minimo, massimo, medio = quotation.affitto
+        if not any((minimo, medio, massimo)):
             raise OMINoQuotationsError(
                 "Il servizio OMI non ha restituito valori di affitto per i parametri indicati"
             )
 
         # Converti in canoni mensili totali per i metri quadri richiesti
         return {
-            "min": (quotation.prezzo_affitto_min or 0) * metri_quadri,
-            "max": (quotation.prezzo_affitto_max or 0) * metri_quadri,
-            "medio": (quotation.prezzo_affitto_medio or 0) * metri_quadri,
-            "min_mq": quotation.prezzo_affitto_min or 0,
-            "max_mq": quotation.prezzo_affitto_max or 0,
-            "medio_mq": quotation.prezzo_affitto_medio or 0,
+            "min": (minimo or 0) * metri_quadri,
+            "max": (massimo or 0) * metri_quadri,
+            "medio": (medio or 0) * metri_quadri,
+            "min_mq": minimo or 0,
+            "max_mq": massimo or 0,
+            "medio_mq": medio or 0,
         }
 
     async def close(self) -> None:
-        """Chiude il client HTTP."""
+        """Chiude il client HTTP e interrompe la pulizia periodica della cache."""
+        if self._sweeper_task is not None:
+            self._sweeper_task.cancel()
+            self._sweeper_task = None
+        for task in list(self._background_tasks):
+            task.cancel()
         if self._client:
             await self._client.aclose()
             self._client = None
+        if self._store is not None:
+            self._store.close()
+        if self._offline is not None:
+            self._offline.close()
+        if self._shared is not None:
+            self._shared.close()
 
     async def __aenter__(self):
         """Context manager entry."""
@@ -721,5 +1552,58 @@ def get_omi_client() -> OMIClient:
     """
     global _omi_client
     if _omi_client is None:
-        _omi_client = OMIClient()
+        _omi_client = OMIClient(
+            store=_build_default_store(),
+            rate_limit_per_second=float(os.getenv("OMI_RATE_LIMIT_PER_SECOND", 1 / 3)),
+            rate_limit_burst=int(os.getenv("OMI_RATE_LIMIT_BURST", 1)),
+            retry_attempts=int(os.getenv("OMI_RETRY_ATTEMPTS", 3)),
+            retry_backoff=float(os.getenv("OMI_RETRY_BACKOFF", 0.5)),
+            retry_max_backoff=float(os.getenv("OMI_RETRY_MAX_BACKOFF", 8.0)),
+            circuit_failure_threshold=int(os.getenv("OMI_CIRCUIT_FAILURE_THRESHOLD", 5)),
+            circuit_recovery_timeout=float(os.getenv("OMI_CIRCUIT_RECOVERY_TIMEOUT", 30.0)),
+            offline_dataset=_build_offline_dataset(),
+            shared_state=_build_shared_state(),
+        )
     return _omi_client
+
+
+def _build_default_store() -> Optional[OMIQuotationStore]:
+    """
+    Crea l'archivio persistente indicato da ``OMI_STORE_PATH``.
+
+    Una variabile valorizzata a stringa vuota disabilita la persistenza.
+    """
+    path = os.getenv("OMI_STORE_PATH")
+    if path is None:
+        return OMIQuotationStore(DEFAULT_STORE_PATH)
+    if not path.strip():
+        return None
+    return OMIQuotationStore(path.strip())
+
+
+def _build_offline_dataset() -> Optional[OMIOfflineDataset]:
+    """
+    Crea l'archivio offline se ``OMI_MODE`` vale ``offline``.
+
+    Il percorso è ``OMI_OFFLINE_PATH`` (default ``storage/omi/offline.sqlite3``).
+    """
+    if os.getenv("OMI_MODE", "online").strip().lower() != "offline":
+        return None
+    from app.omi.importer import default_offline_path
+
+    return OMIOfflineDataset(default_offline_path())
+
+
+def _build_shared_state() -> Optional[OMISharedState]:
+    """
+    Crea lo stato condiviso tra i worker se ``OMI_SHARED_STATE_PATH`` è valorizzata.
+
+    I dati scaricati vengono condivisi tramite l'archivio persistente
+    (``OMI_STORE_PATH``), che in questa modalità deve restare abilitato.
+    """
+    path = os.getenv("OMI_SHARED_STATE_PATH", "").strip()
+    if not path:
+        return None
+    if os.getenv("OMI_STORE_PATH") is not None and not os.getenv("OMI_STORE_PATH", "").strip():
+        logger.warning("Stato OMI condiviso senza archivio persistente: i dati non saranno condivisi")
+    return SQLiteSharedState(path)
@@ -0,0 +1,333 @@
+"""
+Individuazione della zona OMI a partire dalle coordinate.
+
+I perimetri delle zone OMI pubblicati dall'Agenzia delle Entrate (KML, o
+GeoJSON dopo una conversione) vengono importati in un unico file GeoJSON con
+le proprietà ``codice_comune`` e ``zona``. All'avvio il file viene letto una
+sola volta e indicizzato su una griglia uniforme: ogni cella conosce i
+poligoni il cui rettangolo di ingombro la interseca, quindi una ricerca
+esegue il test punto-in-poligono solo su pochi candidati.
+
+Uso da riga di comando::
+
+    python -m app.omi.geo F205_zone.kml --comune F205
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.omi.importer import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Codice di zona OMI: fascia (lettera) e numero, es. "B1", "D20"
+_ZONE_CODE = re.compile(r"\b[A-Z]\d{1,2}\b")
+
+DEFAULT_ZONES_PATH = BASE_DIR / "storage" / "omi" / "zones.geojson"
+
+Ring = Tuple[array, array]  # longitudini, latitudini
+
+_ZONE_KEYS = ("zona", "zona_omi", "codzona", "cod_zona", "codice_zona", "name")
+_COMUNE_KEYS = ("codice_comune", "codcom", "comune_amm", "cod_com", "codice_catastale")
+
+
+class ZonePolygon:
+    """
+    Perimetro di una zona OMI: uno o più poligoni, ciascuno con eventuali buchi.
+
+    I vertici sono conservati in ``array('d')`` di longitudini e latitudini.
+    """
+
+    __slots__ = ("codice_comune", "zona", "polygons", "bbox")
+
+    def __init__(self, codice_comune: str, zona: str, polygons: List[List[Ring]]):
+        self.codice_comune = codice_comune
+        self.zona = zona
+        self.polygons = polygons
+        xs = [x for polygon in polygons for x in polygon[0][0]]
+        ys = [y for polygon in polygons for y in polygon[0][1]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, lon: float, lat: float) -> bool:
+        """Test punto-in-poligono (regola pari-dispari, i buchi sono esclusi)."""
+        min_x, min_y, max_x, max_y = self.bbox
+        if not (min_x <= lon <= max_x and min_y <= lat <= max_y):
+            return False
+        for polygon in self.polygons:
+            inside = False
+            for xs, ys in polygon:
+                j = len(xs) - 1
+                for i in range(len(xs)):
+                    yi, yj = ys[i], ys[j]
+                    if (yi > lat) != (yj > lat):
+                        if lon < (xs[j] - xs[i]) * (lat - yi) / (yj - yi) + xs[i]:
+                            inside = not inside
+                    j = i
+            if inside:
+                return True
+        return False
+
+    def to_feature(self) -> Dict[str, Any]:
+        """Feature GeoJSON della zona."""
+        coordinates = [
+            [[[x, y] for x, y in zip(xs, ys)] for xs, ys in polygon] for polygon in self.polygons
+        ]
+        return {
+            "type": "Feature",
+            "properties": {"codice_comune": self.codice_comune, "zona": self.zona},
+            "geometry": {"type": "MultiPolygon", "coordinates": coordinates},
+        }
+
+
+def _ring(points: Iterable[Sequence[float]]) -> Ring:
+    xs, ys = array("d"), array("d")
+    for point in points:
+        xs.append(float(point[0]))
+        ys.append(float(point[1]))
+    return xs, ys
+
+
+def _property(properties: Dict[str, Any], keys: Sequence[str]) -> Optional[str]:
+    lowered = {str(key).lower(): value for key, value in properties.items()}
+    for key in keys:
+        value = lowered.get(key)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+
+def _normalise_zone(zona: str) -> str:
+    """Codice di zona senza prefissi e descrizioni (es. "Zona B12 - Centro storico" → "B12")."""
+    zona = zona.strip().upper()
+    match = _ZONE_CODE.search(zona)
+    return match.group(0) if match else zona.split()[-1]
+
+
+def read_geojson(path: Union[str, Path], codice_comune: Optional[str] = None) -> List[ZonePolygon]:
+    """
+    Legge i perimetri delle zone da un file GeoJSON (Polygon o MultiPolygon).
+
+    Args:
+        path: File GeoJSON (FeatureCollection)
+        codice_comune: Codice catastale da usare se le feature non lo riportano
+
+    Returns:
+        Zone con codice di comune e di zona
+    """
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    zones = []
+    for feature in data.get("features", []):
+        properties = feature.get("properties") or {}
+        geometry = feature.get("geometry") or {}
+        comune = _property(properties, _COMUNE_KEYS) or codice_comune
+        zona = _property(properties, _ZONE_KEYS)
+        if not comune or not zona:
+            continue
+        if geometry.get("type") == "Polygon":
+            coordinates = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            coordinates = geometry["coordinates"]
+        else:
+            continue
+        polygons = [[_ring(ring) for ring in polygon if ring] for polygon in coordinates if polygon]
+        if polygons:
+            zones.append(ZonePolygon(comune.upper(), _normalise_zone(zona), polygons))
+    return zones
+
+
+def _kml_coordinates(element: ET.Element) -> Ring:
+    text = "".join(element.itertext())
+    return _ring(tuple(map(float, item.split(",")[:2])) for item in text.split() if "," in item)
+
+
+def read_kml(path: Union[str, Path], codice_comune: Optional[str] = None) -> List[ZonePolygon]:
+    """
+    Legge i perimetri delle zone da un file KML (Placemark con Polygon o MultiGeometry).
+
+    Il codice di zona viene cercato nei dati estesi del Placemark e, in
+    mancanza, nel suo nome.
+
+    Args:
+        path: File KML
+        codice_comune: Codice catastale da usare se il Placemark non lo riporta
+
+    Returns:
+        Zone con codice di comune e di zona
+    """
+    root = ET.parse(str(path)).getroot()
+
+    def local(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    zones = []
+    for placemark in (element for element in root.iter() if local(element.tag) == "Placemark"):
+        properties: Dict[str, Any] = {}
+        for element in placemark.iter():
+            tag = local(element.tag)
+            if tag == "name" and "name" not in properties:
+                properties["name"] = (element.text or "").strip()
+            elif tag in ("Data", "SimpleData") and element.get("name"):
+                value = element.text if tag == "SimpleData" else next(
+                    (child.text for child in element if local(child.tag) == "value"), None
+                )
+                properties[element.get("name")] = (value or "").strip()
+
+        polygons = []
+        for polygon in (element for element in placemark.iter() if local(element.tag) == "Polygon"):
+            rings = []
+            for boundary in polygon:
+                if local(boundary.tag) in ("outerBoundaryIs", "innerBoundaryIs"):
+                    for coordinates in boundary.iter():
+                        if local(coordinates.tag) == "coordinates":
+                            rings.append(_kml_coordinates(coordinates))
+            if rings and len(rings[0][0]) >= 3:
+                polygons.append(rings)
+
+        comune = _property(properties, _COMUNE_KEYS) or codice_comune
+        zona = _property(properties, _ZONE_KEYS)
+        if comune and zona and polygons:
+            zones.append(ZonePolygon(comune.upper(), _normalise_zone(zona), polygons))
+    return zones
+
+
+def read_zones(path: Union[str, Path], codice_comune: Optional[str] = None) -> List[ZonePolygon]:
+    """Legge un file KML o GeoJSON in base all'estensione."""
+    if Path(path).suffix.lower() == ".kml":
+        return read_kml(path, codice_comune)
+    return read_geojson(path, codice_comune)
+
+
+def write_geojson(zones: Iterable[ZonePolygon], path: Union[str, Path]) -> int:
+    """Scrive le zone in un file GeoJSON; restituisce il numero di zone scritte."""
+    features = [zone.to_feature() for zone in zones]
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(
+        json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":")),
+        encoding="utf-8",
+    )
+    return len(features)
+
+
+class OMIZoneIndex:
+    """
+    Indice spaziale delle zone OMI su griglia uniforme.
+
+    Args:
+        zones: Perimetri delle zone
+        cell_size: Lato delle celle in gradi (default 0,02°, circa 2 km)
+    """
+
+    def __init__(self, zones: Iterable[ZonePolygon], cell_size: float = 0.02):
+        self._cell_size = cell_size
+        self._zones: List[ZonePolygon] = list(zones)
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for position, zone in enumerate(self._zones):
+            min_x, min_y, max_x, max_y = zone.bbox
+            for cx in range(self._cell(min_x), self._cell(max_x) + 1):
+                for cy in range(self._cell(min_y), self._cell(max_y) + 1):
+                    self._grid.setdefault((cx, cy), []).append(position)
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self._cell_size)
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    def comuni(self) -> List[str]:
+        """Comuni con almeno una zona nell'indice."""
+        return sorted({zone.codice_comune for zone in self._zones})
+
+    def locate(
+        self, latitude: float, longitude: float, codice_comune: Optional[str] = None
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Zona OMI che contiene il punto.
+
+        Args:
+            latitude: Latitudine WGS84
+            longitude: Longitudine WGS84
+            codice_comune: Se indicato, considera solo le zone di quel comune
+
+        Returns:
+            Coppia ``(codice_comune, zona)`` o None se il punto non ricade in nessuna zona
+        """
+        candidates = self._grid.get((self._cell(longitude), self._cell(latitude)), ())
+        for position in candidates:
+            zone = self._zones[position]
+            if codice_comune and zone.codice_comune != codice_comune:
+                continue
+            if zone.contains(longitude, latitude):
+                return zone.codice_comune, zone.zona
+        return None
+
+
+def default_zones_path() -> Path:
+    """Percorso del file delle zone da ``OMI_ZONES_PATH`` o quello predefinito."""
+    path = os.getenv("OMI_ZONES_PATH", "").strip()
+    return Path(path) if path else DEFAULT_ZONES_PATH
+
+
+_zone_index: Optional[OMIZoneIndex] = None
+_zone_index_lock = threading.Lock()
+
+
+def get_zone_index() -> OMIZoneIndex:
+    """
+    Ottiene l'indice singleton delle zone OMI.
+
+    Il file indicato da ``OMI_ZONES_PATH`` viene letto al primo utilizzo; se
+    non esiste l'indice è vuoto e le ricerche restituiscono None.
+    """
+    global _zone_index
+    if _zone_index is None:
+        with _zone_index_lock:
+            if _zone_index is None:
+                path = default_zones_path()
+                zones: List[ZonePolygon] = []
+                if path.exists():
+                    try:
+                        zones = read_geojson(path)
+                    except (OSError, ValueError) as exc:
+                        logger.warning("Perimetri delle zone OMI non leggibili (%s): %s", path, exc)
+                _zone_index = OMIZoneIndex(zones)
+                logger.info("Indice delle zone OMI: %d zone da %s", len(zones), path)
+    return _zone_index
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Importa perimetri KML/GeoJSON nel file delle zone, sostituendo i comuni importati."""
+    parser = argparse.ArgumentParser(description="Importa i perimetri delle zone OMI (KML o GeoJSON).")
+    parser.add_argument("files", type=Path, nargs="+", help="File KML o GeoJSON delle zone")
+    parser.add_argument("--comune", help="Codice catastale, se i file non lo riportano")
+    parser.add_argument("--output", type=Path, default=None, help="File GeoJSON di destinazione")
+    args = parser.parse_args(argv)
+
+    output = args.output or default_zones_path()
+    try:
+        imported = [zone for path in args.files for zone in read_zones(path, args.comune)]
+        replaced = {zone.codice_comune for zone in imported}
+        existing = read_geojson(output) if output.exists() else []
+    except (OSError, ValueError, ET.ParseError) as exc:
+        print(f"Importazione non riuscita: {exc}", file=sys.stderr)
+        return 1
+
+    kept = [zone for zone in existing if zone.codice_comune not in replaced]
+    count = write_geojson(kept + imported, output)
+    print(f"{len(imported)} zone importate per {len(replaced)} comuni, {count} zone totali -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
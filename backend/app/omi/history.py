@@ -0,0 +1,198 @@
+"""
+Serie storiche semestrali delle quotazioni OMI.
+
+Le serie vengono costruite dall'archivio dei file ufficiali importati
+(``OMIOfflineDataset``): per ogni comune si legge una sola volta l'intera
+storia e la si conserva in forma colonnare, indicizzata per (zona, tipo).
+"""
+
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.omi.importer import default_offline_path
+from app.omi.offline import OMIOfflineDataset
+from app.omi.semesters import parse_semester
+
+_NAN = float("nan")
+
+
+def _semester_ordinal(semestre: str) -> int:
+    """Numero progressivo del semestre (due per anno), per misurare le distanze."""
+    start = parse_semester(semestre)
+    return start.year * 2 + (0 if start.month == 1 else 1)
+
+
+def _value(column: array, position: int) -> Optional[float]:
+    value = column[position]
+    return None if math.isnan(value) else value
+
+
+class PriceSeries:
+    """
+    Serie semestrale di una zona e di un tipo di immobile.
+
+    I prezzi al mq sono conservati in ``array('d')`` paralleli ai semestri,
+    con NaN per i valori mancanti.
+    """
+
+    __slots__ = ("semesters", "compr_min", "compr_max", "loc_min", "loc_max")
+
+    def __init__(self) -> None:
+        self.semesters: List[str] = []
+        self.compr_min = array("d")
+        self.compr_max = array("d")
+        self.loc_min = array("d")
+        self.loc_max = array("d")
+
+    def append(
+        self,
+        semestre: str,
+        compr_min: Optional[float],
+        compr_max: Optional[float],
+        loc_min: Optional[float],
+        loc_max: Optional[float],
+    ) -> None:
+        self.semesters.append(semestre)
+        self.compr_min.append(_NAN if compr_min is None else compr_min)
+        self.compr_max.append(_NAN if compr_max is None else compr_max)
+        self.loc_min.append(_NAN if loc_min is None else loc_min)
+        self.loc_max.append(_NAN if loc_max is None else loc_max)
+
+    def __len__(self) -> int:
+        return len(self.semesters)
+
+    def points(self, operazione: str = "acquisto") -> List[Dict[str, Optional[float]]]:
+        """
+        Punti della serie con min, max e medio (centro dell'intervallo) al mq.
+
+        Args:
+            operazione: "acquisto" (€/mq) o "affitto" (€/mq/mese)
+        """
+        low, high = (
+            (self.loc_min, self.loc_max) if operazione == "affitto" else (self.compr_min, self.compr_max)
+        )
+        points = []
+        for position, semestre in enumerate(self.semesters):
+            minimo, massimo = _value(low, position), _value(high, position)
+            if minimo is None and massimo is None:
+                continue
+            if minimo is None or massimo is None:
+                medio = minimo if massimo is None else massimo
+            else:
+                medio = (minimo + massimo) / 2
+            points.append({"semestre": semestre, "min": minimo, "max": massimo, "medio": medio})
+        return points
+
+
+def growth_rates(points: List[Dict[str, Optional[float]]]) -> Dict[str, object]:
+    """
+    Variazioni percentuali del valore medio di una serie.
+
+    Returns:
+        ``variazioni`` semestre su semestre (None per il primo punto), variazione
+        totale e tasso annuo composto tra il primo e l'ultimo punto
+    """
+    variazioni: List[Optional[float]] = []
+    previous: Optional[float] = None
+    for point in points:
+        current = point["medio"]
+        if previous and current is not None:
+            variazioni.append(round((current / previous - 1) * 100, 2))
+        else:
+            variazioni.append(None)
+        previous = current
+
+    totale = annua = None
+    if len(points) >= 2 and points[0]["medio"] and points[-1]["medio"] is not None:
+        ratio = points[-1]["medio"] / points[0]["medio"]
+        totale = round((ratio - 1) * 100, 2)
+        years = (_semester_ordinal(points[-1]["semestre"]) - _semester_ordinal(points[0]["semestre"])) / 2
+        if years > 0 and ratio > 0:
+            annua = round((ratio ** (1 / years) - 1) * 100, 2)
+
+    return {
+        "variazioni": variazioni,
+        "variazione_totale_pct": totale,
+        "variazione_annua_pct": annua,
+    }
+
+
+class OMIPriceHistory:
+    """
+    Storico semestrale delle quotazioni OMI per comune, zona e tipo.
+
+    Le serie di un comune vengono costruite alla prima richiesta e tenute in
+    una cache LRU, invalidata quando nell'archivio viene importato un nuovo
+    semestre.
+    """
+
+    def __init__(self, dataset: OMIOfflineDataset, max_comuni: int = 256):
+        self._dataset = dataset
+        self._max_comuni = max_comuni
+        self._comuni: "OrderedDict[str, Dict[Tuple[str, str], PriceSeries]]" = OrderedDict()
+        self._version: Optional[Tuple[int, float]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def dataset(self) -> OMIOfflineDataset:
+        return self._dataset
+
+    def semesters(self) -> List[str]:
+        """Semestri disponibili nell'archivio."""
+        return self._dataset.semesters()
+
+    def series(self, codice_comune: str, zona_omi: str, property_type: str) -> Optional[PriceSeries]:
+        """Serie della zona e del tipo indicati, o None se assente."""
+        return self._comune_series(codice_comune).get((zona_omi.upper(), property_type))
+
+    def zones(self, codice_comune: str) -> List[str]:
+        """Zone del comune presenti nello storico."""
+        return sorted({zona for zona, _ in self._comune_series(codice_comune)})
+
+    def _comune_series(self, codice_comune: str) -> Dict[Tuple[str, str], PriceSeries]:
+        version = self._dataset.version()
+        with self._lock:
+            if version != self._version:
+                self._comuni.clear()
+                self._version = version
+            cached = self._comuni.get(codice_comune)
+            if cached is not None:
+                self._comuni.move_to_end(codice_comune)
+                return cached
+
+        series: Dict[Tuple[str, str], PriceSeries] = {}
+        for zona, property_type, semestre, compr_min, compr_max, loc_min, loc_max in (
+            self._dataset.history_rows(codice_comune)
+        ):
+            entry = series.get((zona, property_type))
+            if entry is None:
+                entry = series[(zona, property_type)] = PriceSeries()
+            entry.append(semestre, compr_min, compr_max, loc_min, loc_max)
+
+        with self._lock:
+            self._comuni[codice_comune] = series
+            while len(self._comuni) > self._max_comuni:
+                self._comuni.popitem(last=False)
+        return series
+
+    def close(self) -> None:
+        self._dataset.close()
+
+
+# Istanza singleton dello storico
+_omi_history: Optional[OMIPriceHistory] = None
+
+
+def get_omi_history() -> OMIPriceHistory:
+    """
+    Ottiene l'istanza singleton dello storico OMI.
+
+    Usa l'archivio dei file ufficiali indicato da ``OMI_OFFLINE_PATH``.
+    """
+    global _omi_history
+    if _omi_history is None:
+        _omi_history = OMIPriceHistory(OMIOfflineDataset(default_offline_path()))
+    return _omi_history
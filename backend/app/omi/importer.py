@@ -0,0 +1,257 @@
+"""
+Importazione dei file semestrali OMI pubblicati dall'Agenzia delle Entrate.
+
+I file VALORI e ZONE sono CSV separati da punto e virgola, con una riga di
+titolo prima dell'intestazione e la virgola come separatore decimale. Le righe
+vengono normalizzate e salvate in un ``OMIOfflineDataset``.
+
+Uso da riga di comando::
+
+    python -m app.omi.importer QI_..._VALORI.csv --zone QI_..._ZONE.csv --semestre 2024-S1
+"""
+
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from app.omi.offline import ComuneRow, OMIOfflineDataset, ValoriRow, ZoneRow
+from app.omi.property_types import normalise_property_type
+from app.omi.semesters import parse_semester
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_OFFLINE_PATH = BASE_DIR / "storage" / "omi" / "offline.sqlite3"
+
+_FILENAME_SEMESTER = re.compile(r"(?:^|[_\-])((?:19|20)\d{2})([12])(?:[_\-.]|$)")
+_TITLE_SEMESTER = (
+    re.compile(r"((?:19|20)\d{2})\D{0,20}?semestre\s*([12])", re.IGNORECASE),
+    re.compile(r"([12])\s*[°^]?\s*semestre\D{0,20}?((?:19|20)\d{2})", re.IGNORECASE),
+)
+
+
+def parse_decimal(value: Optional[str]) -> Optional[float]:
+    """Converte un numero in formato italiano (es. ``"1.250,50"``) in float."""
+    if value is None:
+        return None
+    text = value.strip()
+    if not text:
+        return None
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _read_text(path: Path) -> str:
+    raw = path.read_bytes()
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def read_omi_csv(path: Union[str, Path], required: Sequence[str]) -> Tuple[Optional[str], List[Dict[str, str]]]:
+    """
+    Legge un file OMI saltando le righe che precedono l'intestazione.
+
+    Args:
+        path: Percorso del file CSV
+        required: Colonne che identificano la riga di intestazione
+
+    Returns:
+        Titolo del file (se presente) e righe come dizionari
+
+    Raises:
+        ValueError: Se l'intestazione non viene trovata
+    """
+    lines = _read_text(Path(path)).splitlines()
+    for position, line in enumerate(lines):
+        columns = [column.strip() for column in line.split(";")]
+        if all(name in columns for name in required):
+            title = lines[0].strip().strip(";") if position else None
+            reader = csv.DictReader(io.StringIO("\n".join(lines[position:])), delimiter=";")
+            reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+            rows = [
+                {key: (value or "").strip() for key, value in row.items() if key}
+                for row in reader
+            ]
+            return title, rows
+    raise ValueError(f"Intestazione OMI non trovata in {path} (colonne attese: {', '.join(required)})")
+
+
+def detect_semester(path: Union[str, Path], title: Optional[str] = None) -> Optional[str]:
+    """
+    Ricava il semestre dal nome del file (es. ``QI_123_1_20241_VALORI.csv``) o dal titolo.
+
+    Returns:
+        Etichetta ``AAAA-S1``/``AAAA-S2`` o None se non riconoscibile
+    """
+    match = _FILENAME_SEMESTER.search(Path(path).stem)
+    if match:
+        return f"{match.group(1)}-S{match.group(2)}"
+    if title:
+        for pattern in _TITLE_SEMESTER:
+            match = pattern.search(title)
+            if match:
+                year, half = match.groups() if len(match.group(1)) == 4 else match.groups()[::-1]
+                return f"{year}-S{half}"
+    return None
+
+
+_VALORI_COLUMNS = ("Comune_amm", "Zona", "Descr_Tipologia", "Compr_min", "Compr_max")
+_ZONE_COLUMNS = ("Comune_amm", "Zona", "Zona_Descr")
+
+
+def parse_valori(rows: Sequence[Dict[str, str]]) -> Tuple[List[ValoriRow], Dict[str, ComuneRow]]:
+    """Normalizza le righe della tabella VALORI."""
+    valori: List[ValoriRow] = []
+    comuni: Dict[str, ComuneRow] = {}
+    for row in rows:
+        codice_comune = row.get("Comune_amm", "").upper()
+        zona = row.get("Zona", "").upper()
+        property_type = normalise_property_type(row.get("Descr_Tipologia"))
+        if not codice_comune or not zona or not property_type:
+            continue
+
+        prices = tuple(
+            parse_decimal(row.get(column))
+            for column in ("Compr_min", "Compr_max", "Loc_min", "Loc_max")
+        )
+        if not any(prices):
+            continue
+
+        valori.append(
+            (
+                codice_comune,
+                zona,
+                property_type,
+                row.get("Stato", "").upper(),
+                1 if row.get("Stato_prev", "").upper() == "P" else 0,
+                *prices,
+            )
+        )
+        if codice_comune not in comuni and row.get("Comune_descrizione"):
+            comuni[codice_comune] = (
+                codice_comune,
+                row["Comune_descrizione"].title(),
+                row.get("Prov") or None,
+                row.get("Regione") or None,
+                row.get("Comune_ISTAT") or None,
+            )
+    return valori, comuni
+
+
+def parse_zone(rows: Sequence[Dict[str, str]]) -> List[ZoneRow]:
+    """Normalizza le righe della tabella ZONE."""
+    zone: List[ZoneRow] = []
+    for row in rows:
+        codice_comune = row.get("Comune_amm", "").upper()
+        zona = row.get("Zona", "").upper()
+        if not codice_comune or not zona:
+            continue
+        zone.append(
+            (
+                codice_comune,
+                zona,
+                row.get("Fascia") or None,
+                row.get("Zona_Descr") or None,
+                row.get("LinkZona") or None,
+            )
+        )
+    return zone
+
+
+def import_semester(
+    dataset: OMIOfflineDataset,
+    valori_path: Union[str, Path],
+    zone_path: Optional[Union[str, Path]] = None,
+    semestre: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Importa i file di un semestre nell'archivio offline, sostituendo quelli già presenti.
+
+    Args:
+        dataset: Archivio di destinazione
+        valori_path: File VALORI (quotazioni)
+        zone_path: File ZONE (descrizione delle zone), opzionale
+        semestre: Semestre ``AAAA-S1``/``AAAA-S2`` (default: ricavato dal file)
+
+    Returns:
+        Riepilogo con semestre, quotazioni, zone e comuni importati
+
+    Raises:
+        ValueError: Se il semestre non è indicato né ricavabile o i file non sono validi
+    """
+    title, valori_rows = read_omi_csv(valori_path, _VALORI_COLUMNS)
+    semestre = semestre or detect_semester(valori_path, title)
+    if not semestre:
+        raise ValueError(f"Semestre non riconoscibile per {valori_path}: indicarlo esplicitamente")
+    parse_semester(semestre)
+
+    valori, comuni = parse_valori(valori_rows)
+    zone: List[ZoneRow] = []
+    if zone_path is not None:
+        _, zone_rows = read_omi_csv(zone_path, _ZONE_COLUMNS)
+        zone = parse_zone(zone_rows)
+
+    valori_count, zone_count = dataset.replace_semester(semestre, valori, zone, comuni.values())
+    logger.info(
+        "Importato semestre OMI %s: %d quotazioni, %d zone, %d comuni",
+        semestre,
+        valori_count,
+        zone_count,
+        len(comuni),
+    )
+    return {
+        "semestre": semestre,
+        "valori": valori_count,
+        "zone": zone_count,
+        "comuni": len(comuni),
+    }
+
+
+def default_offline_path() -> Path:
+    """Percorso dell'archivio offline da ``OMI_OFFLINE_PATH`` o quello predefinito."""
+    path = os.getenv("OMI_OFFLINE_PATH", "").strip()
+    return Path(path) if path else DEFAULT_OFFLINE_PATH
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Punto di ingresso da riga di comando."""
+    parser = argparse.ArgumentParser(
+        description="Importa i file semestrali OMI (VALORI e ZONE) nell'archivio offline."
+    )
+    parser.add_argument("valori", type=Path, help="File VALORI del semestre")
+    parser.add_argument("--zone", type=Path, help="File ZONE del semestre")
+    parser.add_argument("--semestre", help="Semestre AAAA-S1 o AAAA-S2 (default: dal nome del file)")
+    parser.add_argument("--db", type=Path, default=None, help="Archivio SQLite di destinazione")
+    args = parser.parse_args(argv)
+
+    dataset = OMIOfflineDataset(args.db or default_offline_path())
+    try:
+        summary = import_semester(dataset, args.valori, args.zone, args.semestre)
+    except (OSError, ValueError) as exc:
+        print(f"Importazione non riuscita: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        dataset.close()
+
+    print(
+        f"Semestre {summary['semestre']}: {summary['valori']} quotazioni, "
+        f"{summary['zone']} zone, {summary['comuni']} comuni -> {dataset.path}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""
+Archivio locale delle quotazioni OMI ufficiali dell'Agenzia delle Entrate.
+
+Le tabelle semestrali (VALORI e ZONE) importate con ``app.omi.importer`` sono
+conservate in SQLite e indicizzate per comune, zona e tipo di immobile: il
+client OMI in modalità offline risponde da qui senza chiamate di rete.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from app.omi.quotations import QuotationRecord, QuotationTable
+from app.omi.semesters import parse_semester
+
+logger = logging.getLogger(__name__)
+
+ValoriRow = Tuple[
+    str,  # codice_comune
+    str,  # zona
+    str,  # property_type
+    str,  # stato
+    int,  # prevalente
+    Optional[float],  # compr_min
+    Optional[float],  # compr_max
+    Optional[float],  # loc_min
+    Optional[float],  # loc_max
+]
+ZoneRow = Tuple[
+    str,  # codice_comune
+    str,  # zona
+    Optional[str],  # fascia
+    Optional[str],  # descrizione
+    Optional[str],  # link_zona
+]
+ComuneRow = Tuple[
+    str,  # codice_comune
+    str,  # comune
+    Optional[str],  # provincia
+    Optional[str],  # regione
+    Optional[str],  # codice_istat
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS omi_semestri (
+    semestre TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL,
+    valori INTEGER NOT NULL,
+    zone INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS omi_valori (
+    semestre TEXT NOT NULL,
+    codice_comune TEXT NOT NULL,
+    zona TEXT NOT NULL,
+    property_type TEXT NOT NULL,
+    stato TEXT NOT NULL DEFAULT '',
+    prevalente INTEGER NOT NULL DEFAULT 0,
+    compr_min REAL,
+    compr_max REAL,
+    loc_min REAL,
+    loc_max REAL,
+    PRIMARY KEY (semestre, codice_comune, zona, property_type, stato)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS omi_zone (
+    semestre TEXT NOT NULL,
+    codice_comune TEXT NOT NULL,
+    zona TEXT NOT NULL,
+    fascia TEXT,
+    descrizione TEXT,
+    link_zona TEXT,
+    PRIMARY KEY (semestre, codice_comune, zona)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS omi_comuni (
+    codice_comune TEXT PRIMARY KEY,
+    comune TEXT NOT NULL,
+    provincia TEXT,
+    regione TEXT,
+    codice_istat TEXT
+) WITHOUT ROWID;
+"""
+
+
+def _midpoint(low: Optional[float], high: Optional[float]) -> Optional[float]:
+    """Valore centrale dell'intervallo OMI (le tabelle ufficiali riportano solo min e max)."""
+    if low is None or high is None:
+        return low if high is None else high
+    return (low + high) / 2
+
+
+class OMIOfflineDataset:
+    """
+    Quotazioni OMI semestrali importate dai file ufficiali.
+
+    Ogni semestre viene sostituito per intero a ogni importazione; le letture
+    usano per default il semestre più recente. Il database viene aperto solo
+    al primo accesso.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._latest: Optional[Tuple[Tuple[int, float], Optional[str]]] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def replace_semester(
+        self,
+        semestre: str,
+        valori: Iterable[ValoriRow],
+        zone: Iterable[ZoneRow] = (),
+        comuni: Iterable[ComuneRow] = (),
+    ) -> Tuple[int, int]:
+        """
+        Sostituisce in un'unica transazione i dati di un semestre.
+
+        Args:
+            semestre: Etichetta ``AAAA-S1``/``AAAA-S2``
+            valori: Righe della tabella VALORI già normalizzate
+            zone: Righe della tabella ZONE già normalizzate
+            comuni: Anagrafica dei comuni presenti nei file
+
+        Returns:
+            Numero di quotazioni e di zone salvate
+        """
+        parse_semester(semestre)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM omi_valori WHERE semestre = ?", (semestre,))
+                conn.execute("DELETE FROM omi_zone WHERE semestre = ?", (semestre,))
+                valori_count = conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO omi_valori (
+                        semestre, codice_comune, zona, property_type, stato, prevalente,
+                        compr_min, compr_max, loc_min, loc_max
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    ((semestre, *row) for row in valori),
+                ).rowcount
+                zone_count = conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO omi_zone (
+                        semestre, codice_comune, zona, fascia, descrizione, link_zona
+                    ) VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    ((semestre, *row) for row in zone),
+                ).rowcount
+                conn.executemany(
+                    """
+                    INSERT OR REPLACE INTO omi_comuni (
+                        codice_comune, comune, provincia, regione, codice_istat
+                    ) VALUES (?, ?, ?, ?, ?)
+                    """,
+                    comuni,
+                )
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO omi_semestri (semestre, imported_at, valori, zone)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (semestre, time.time(), valori_count, zone_count),
+                )
+        return valori_count, zone_count
+
+    def semesters(self) -> List[str]:
+        """Semestri importati, dal più vecchio al più recente."""
+        with self._lock:
+            rows = self._connect().execute("SELECT semestre FROM omi_semestri").fetchall()
+        return sorted((row[0] for row in rows), key=parse_semester)
+
+    def latest_semester(self) -> Optional[str]:
+        """
+        Semestre più recente importato, o None se l'archivio è vuoto.
+
+        Il risultato è memorizzato insieme alla versione dell'archivio, così
+        anche le importazioni di altri processi lo invalidano.
+        """
+        version = self.version()
+        if self._latest is None or self._latest[0] != version:
+            semesters = self.semesters()
+            self._latest = (version, semesters[-1] if semesters else None)
+        return self._latest[1]
+
+    def comune_name(self, codice_comune: str) -> Optional[str]:
+        """Denominazione del comune come riportata nei file OMI."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT comune FROM omi_comuni WHERE codice_comune = ?", (codice_comune,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_comune(
+        self,
+        codice_comune: str,
+        semestre: Optional[str] = None,
+        comune: Optional[str] = None,
+    ) -> Optional[QuotationTable]:
+        """
+        Restituisce le quotazioni al mq di un comune per un semestre.
+
+        Per ogni coppia (zona, tipo) lo stato di conservazione prevalente
+        precede gli altri; il valore medio è il centro dell'intervallo OMI.
+
+        Args:
+            codice_comune: Codice catastale del comune
+            semestre: Semestre richiesto (default: il più recente)
+            comune: Nome del comune da riportare nella risposta
+
+        Returns:
+            QuotationTable o None se il semestre non è stato importato
+        """
+        semestre = semestre or self.latest_semester()
+        if semestre is None:
+            return None
+
+        with self._lock:
+            rows = self._connect().execute(
+                """
+                SELECT zona, property_type, stato, compr_min, compr_max, loc_min, loc_max
+                FROM omi_valori
+                WHERE semestre = ? AND codice_comune = ?
+                ORDER BY zona, property_type, prevalente DESC, stato
+                """,
+                (semestre, codice_comune),
+            ).fetchall()
+
+        records = tuple(
+            QuotationRecord(
+                zona_omi=zona,
+                property_type=property_type,
+                stato_conservazione=stato.lower() or None,
+                acquisto=(compr_min, compr_max, _midpoint(compr_min, compr_max)),
+                affitto=(loc_min, loc_max, _midpoint(loc_min, loc_max)),
+            )
+            for zona, property_type, stato, compr_min, compr_max, loc_min, loc_max in rows
+        )
+        return QuotationTable(
+            codice_comune=codice_comune,
+            comune=comune or self.comune_name(codice_comune) or codice_comune,
+            records=records,
+            timestamp=parse_semester(semestre),
+            zone_count=len({record.zona_omi for record in records}),
+            semestre=semestre,
+        )
+
+    def version(self) -> Tuple[int, float]:
+        """Numero di semestri e ultima importazione: cambia a ogni nuova importazione."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(MAX(imported_at), 0) FROM omi_semestri"
+            ).fetchone()
+        return row[0], row[1]
+
+    def history_rows(
+        self, codice_comune: str
+    ) -> List[Tuple[str, str, str, Optional[float], Optional[float], Optional[float], Optional[float]]]:
+        """
+        Quotazioni di tutti i semestri importati per un comune.
+
+        Per ogni semestre, zona e tipo viene restituita una sola riga, quella
+        dello stato di conservazione prevalente.
+
+        Returns:
+            Righe ``(zona, property_type, semestre, compr_min, compr_max, loc_min, loc_max)``
+            ordinate per zona, tipo e semestre
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                """
+                SELECT zona, property_type, semestre, compr_min, compr_max, loc_min, loc_max
+                FROM omi_valori
+                WHERE codice_comune = ?
+                ORDER BY zona, property_type, semestre, prevalente DESC, stato
+                """,
+                (codice_comune,),
+            ).fetchall()
+
+        result = []
+        previous = None
+        for row in rows:
+            key = row[:3]
+            if key != previous:
+                result.append(row)
+                previous = key
+        result.sort(key=lambda row: (row[0], row[1], parse_semester(row[2])))
+        return result
+
+    def purchase_midpoints(
+        self, property_type: str, semestre: Optional[str] = None
+    ) -> List[Tuple[str, Optional[str], str, float]]:
+        """
+        Valori medi di compravendita al mq di tutte le zone per un tipo di immobile.
+
+        Per ogni zona viene usato lo stato di conservazione prevalente.
+
+        Args:
+            property_type: Tipo di immobile (es. "abitazioni_civili")
+            semestre: Semestre richiesto (default: il più recente)
+
+        Returns:
+            Righe ``(codice_comune, provincia, zona, valore_medio)`` ordinate per comune e zona
+        """
+        semestre = semestre or self.latest_semester()
+        if semestre is None:
+            return []
+        with self._lock:
+            rows = self._connect().execute(
+                """
+                SELECT v.codice_comune, c.provincia, v.zona, v.compr_min, v.compr_max
+                FROM omi_valori AS v
+                LEFT JOIN omi_comuni AS c ON c.codice_comune = v.codice_comune
+                WHERE v.semestre = ? AND v.property_type = ?
+                ORDER BY v.codice_comune, v.zona, v.prevalente DESC, v.stato
+                """,
+                (semestre, property_type),
+            ).fetchall()
+
+        result = []
+        previous = None
+        for codice_comune, provincia, zona, compr_min, compr_max in rows:
+            if (codice_comune, zona) == previous:
+                continue
+            previous = (codice_comune, zona)
+            medio = _midpoint(compr_min, compr_max)
+            if medio:
+                result.append((codice_comune, provincia, zona, medio))
+        return result
+
+    def zones(self, codice_comune: str, semestre: Optional[str] = None) -> Dict[str, Dict[str, Optional[str]]]:
+        """Zone OMI del comune con fascia, descrizione e codice LinkZona."""
+        semestre = semestre or self.latest_semester()
+        if semestre is None:
+            return {}
+        with self._lock:
+            rows = self._connect().execute(
+                """
+                SELECT zona, fascia, descrizione, link_zona
+                FROM omi_zone
+                WHERE semestre = ? AND codice_comune = ?
+                ORDER BY zona
+                """,
+                (semestre, codice_comune),
+            ).fetchall()
+        return {
+            zona: {"fascia": fascia, "descrizione": descrizione, "link_zona": link_zona}
+            for zona, fascia, descrizione, link_zona in rows
+        }
+
+    def close(self) -> None:
+        """Chiude la connessione al database, se aperta."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
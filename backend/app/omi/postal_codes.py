@@ -0,0 +1,183 @@
+"""
+Indice CAP → comune.
+
+I CAP sono conservati in ``data/cap.csv`` (``codice;cap``), con intervalli
+(``20121-20162``) per le città che ne hanno più di uno. Il file viene letto al
+primo accesso e trasformato in un dizionario CAP → codici catastali; un CAP
+può appartenere a più comuni.
+
+Il file si rigenera da un elenco dei comuni in JSON con i campi
+``codiceCatastale`` e ``cap`` (es. il dataset open data ``comuni.json``)::
+
+    python -m app.omi.postal_codes comuni.json
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from app.omi.cadastral_codes import get_cadastral_code, get_city_province, search_city_by_code
+from app.omi.city_index import normalize_city_name
+
+logger = logging.getLogger(__name__)
+
+DATA_PATH = Path(__file__).resolve().parent / "data" / "cap.csv"
+
+_CAP = re.compile(r"\b(\d{5})\b")
+
+_index: Optional[Dict[str, Tuple[str, ...]]] = None
+_index_lock = threading.Lock()
+
+
+def _parse(text: str) -> Dict[str, Tuple[str, ...]]:
+    """Costruisce il dizionario CAP → codici dal contenuto di ``cap.csv``."""
+    index: Dict[str, Tuple[str, ...]] = {}
+    for line in text.splitlines()[1:]:
+        if not line:
+            continue
+        code, caps = line.split(";", 1)
+        for item in caps.split(","):
+            first, _, last = item.partition("-")
+            for value in range(int(first), int(last or first) + 1):
+                cap = f"{value:05d}"
+                if code not in index.get(cap, ()):
+                    index[cap] = index.get(cap, ()) + (code,)
+    return index
+
+
+def _caps() -> Dict[str, Tuple[str, ...]]:
+    """Indice dei CAP, caricato dal file dati al primo utilizzo."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = _parse(DATA_PATH.read_text(encoding="utf-8"))
+                logger.debug("Caricati %d CAP da %s", len(_index), DATA_PATH)
+    return _index
+
+
+def extract_postal_code(text: Optional[str]) -> Optional[str]:
+    """Primo CAP (cinque cifre) presente nel testo."""
+    if not text:
+        return None
+    match = _CAP.search(text)
+    return match.group(1) if match else None
+
+
+def get_codes_by_postal_code(postal_code: Optional[str]) -> Tuple[str, ...]:
+    """
+    Codici catastali dei comuni serviti da un CAP.
+
+    Args:
+        postal_code: CAP di cinque cifre (spazi ignorati)
+
+    Returns:
+        Codici catastali, vuoto se il CAP non è noto
+    """
+    if not postal_code:
+        return ()
+    return _caps().get(postal_code.strip(), ())
+
+
+def resolve_comune(
+    city: Optional[str],
+    postal_code: Optional[str] = None,
+    province: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Codice catastale del comune a partire dal nome e, se serve, dal CAP.
+
+    Il nome ha la precedenza; se non corrisponde a nessun comune si usa il CAP.
+    Quando il CAP è condiviso da più comuni si sceglie quello il cui nome
+    compare nel testo della città o, in alternativa, quello della provincia
+    indicata; altrimenti il comune resta non risolto.
+
+    Args:
+        city: Nome del comune (anche approssimato o con CAP e provincia)
+        postal_code: CAP dell'immobile; se assente viene cercato nel testo della città
+        province: Sigla della provincia (es. "MI")
+
+    Returns:
+        Codice catastale o None
+    """
+    if city:
+        code = get_cadastral_code(city)
+        if code:
+            return code
+
+    candidates = get_codes_by_postal_code(postal_code or extract_postal_code(city))
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+
+    text = normalize_city_name(city or "")
+    named = [
+        code for code in candidates
+        if text and normalize_city_name(search_city_by_code(code) or "") in text
+    ]
+    if len(named) == 1:
+        return named[0]
+    if province:
+        in_province = [code for code in candidates if get_city_province(code) == province.upper()]
+        if len(in_province) == 1:
+            return in_province[0]
+    return None
+
+
+def write_cap_file(rows: Iterable[Tuple[str, Sequence[str]]], path: Union[str, Path] = DATA_PATH) -> int:
+    """
+    Scrive l'indice dei CAP nel formato di ``cap.csv``, comprimendo gli intervalli.
+
+    Args:
+        rows: Coppie ``(codice_catastale, elenco dei CAP)``
+        path: File di destinazione
+
+    Returns:
+        Numero di comuni scritti
+    """
+    lines = ["codice;cap"]
+    for code, caps in sorted(rows):
+        values = sorted({int(cap) for cap in caps if _CAP.fullmatch(cap.strip())})
+        if not values:
+            continue
+        ranges: List[List[int]] = []
+        for value in values:
+            if ranges and value == ranges[-1][1] + 1:
+                ranges[-1][1] = value
+            else:
+                ranges.append([value, value])
+        lines.append(
+            code + ";" + ",".join(
+                f"{low:05d}" if low == high else f"{low:05d}-{high:05d}" for low, high in ranges
+            )
+        )
+    Path(path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return len(lines) - 1
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Rigenera ``cap.csv`` da un elenco dei comuni in JSON."""
+    parser = argparse.ArgumentParser(description="Rigenera l'indice CAP → comune")
+    parser.add_argument("source", type=Path, help="File JSON con codiceCatastale e cap per comune")
+    parser.add_argument("--output", type=Path, default=DATA_PATH, help="File di destinazione")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    comuni = json.loads(args.source.read_text(encoding="utf-8"))
+    rows = []
+    for comune in comuni:
+        code = (comune.get("codiceCatastale") or "").strip().upper()
+        caps = comune.get("cap") or []
+        if code:
+            rows.append((code, [caps] if isinstance(caps, str) else caps))
+    count = write_cap_file(rows, args.output)
+    logger.info("Scritti i CAP di %d comuni in %s", count, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
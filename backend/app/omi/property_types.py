@@ -3,7 +3,7 @@ Tipi di immobili supportati dalle API OMI.
 """
 
 from enum import Enum
-from typing import Dict
+from typing import Dict, Optional
 
 
 class PropertyType(str, Enum):
@@ -117,3 +117,36 @@ def get_property_type_display_name(property_type: PropertyType) -> str:
         PropertyType.LABORATORI: "Laboratori",
     }
     return display_names.get(property_type, property_type.value)
+
+
+def normalise_property_type(raw_value: Optional[str], fallback: Optional[str] = None) -> Optional[str]:
+    """
+    Normalizza il nome di un tipo di immobile OMI in snake_case.
+
+    Args:
+        raw_value: Nome del tipo (es. "Abitazioni civili", "Ville e Villini")
+        fallback: Valore restituito se il nome è vuoto
+
+    Returns:
+        Slug del tipo (es. "abitazioni_civili") o ``fallback``
+    """
+    if not raw_value:
+        return fallback
+
+    candidate = raw_value.strip()
+    if not candidate:
+        return fallback
+
+    slug = candidate.lower().replace(" ", "_")
+    if slug in _PROPERTY_TYPE_VALUES:
+        return slug
+
+    # Alcune risposte usano maiuscole/misti o includono caratteri extra
+    slug = "".join(ch if ch.isalnum() else "_" for ch in candidate).lower()
+    while "__" in slug:
+        slug = slug.replace("__", "_")
+    slug = slug.strip("_")
+    return slug or fallback
+
+
+_PROPERTY_TYPE_VALUES = frozenset(prop_type.value for prop_type in PropertyType)
@@ -0,0 +1,249 @@
+"""
+Rappresentazione compatta e indicizzata delle quotazioni OMI di un comune.
+
+La cache del client conserva per ogni comune una ``QuotationTable``: record con
+``__slots__`` indicizzati per zona, tipo di immobile e coppia (zona, tipo). I
+modelli Pydantic (``OMIQuotation``/``OMIResponse``) vengono costruiti solo
+quando una risposta esce dal client.
+"""
+
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from app.omi.client import OMIQuotation, OMIResponse
+
+PriceTriple = Tuple[Optional[float], Optional[float], Optional[float]]
+
+_NO_PRICES: PriceTriple = (None, None, None)
+
+
+class QuotationRecord:
+    """Quotazione al mq di un tipo di immobile in una zona (min, max, medio per operazione)."""
+
+    __slots__ = ("zona_omi", "property_type", "stato_conservazione", "acquisto", "affitto")
+
+    def __init__(
+        self,
+        zona_omi: str,
+        property_type: str,
+        stato_conservazione: Optional[str],
+        acquisto: PriceTriple,
+        affitto: PriceTriple,
+    ):
+        self.zona_omi = zona_omi
+        self.property_type = property_type
+        self.stato_conservazione = stato_conservazione
+        self.acquisto = acquisto
+        self.affitto = affitto
+
+    def prices(self, operazione: Optional[str]) -> Tuple[PriceTriple, PriceTriple]:
+        """Prezzi (acquisto, affitto) visibili per l'operazione richiesta."""
+        return (
+            self.acquisto if operazione != "affitto" else _NO_PRICES,
+            self.affitto if operazione != "acquisto" else _NO_PRICES,
+        )
+
+    def has_values(self, operazione: Optional[str]) -> bool:
+        """True se il record ha almeno un valore per l'operazione richiesta."""
+        acquisto, affitto = self.prices(operazione)
+        return any(acquisto) or any(affitto)
+
+    def to_dict(self, metri_quadri: float = 1.0, operazione: Optional[str] = None) -> Dict[str, object]:
+        """Campi di ``OMIQuotation`` senza i valori nulli, scalati per ``metri_quadri``."""
+        acquisto, affitto = self.prices(operazione)
+        data: Dict[str, object] = {
+            "zona_omi": self.zona_omi,
+            "property_type": self.property_type,
+        }
+        if self.stato_conservazione is not None:
+            data["stato_conservazione"] = self.stato_conservazione
+        for prefix, values in (("prezzo_acquisto", acquisto), ("prezzo_affitto", affitto)):
+            for suffix, value in zip(("min", "max", "medio"), values):
+                if value is not None:
+                    data[f"{prefix}_{suffix}"] = value * metri_quadri
+        return data
+
+    def to_model(self, metri_quadri: float = 1.0, operazione: Optional[str] = None) -> "OMIQuotation":
+        """Costruisce il modello Pydantic della quotazione."""
+        from app.omi.client import OMIQuotation
+
+        acquisto, affitto = self.prices(operazione)
+        if metri_quadri != 1.0:
+            acquisto = tuple(v * metri_quadri if v is not None else None for v in acquisto)
+            affitto = tuple(v * metri_quadri if v is not None else None for v in affitto)
+        return OMIQuotation(
+            zona_omi=self.zona_omi,
+            property_type=self.property_type,
+            stato_conservazione=self.stato_conservazione,
+            prezzo_acquisto_min=acquisto[0],
+            prezzo_acquisto_max=acquisto[1],
+            prezzo_acquisto_medio=acquisto[2],
+            prezzo_affitto_min=affitto[0],
+            prezzo_affitto_max=affitto[1],
+            prezzo_affitto_medio=affitto[2],
+        )
+
+
+class QuotationTable:
+    """
+    Quotazioni non filtrate di un comune a 1 mq, indicizzate per zona e tipo.
+
+    Le ricerche per (zona, tipo) sono accessi diretti a dizionario; quelle per
+    sola zona o solo tipo restituiscono gli indici precalcolati nell'ordine
+    originale della risposta OMI.
+    """
+
+    __slots__ = (
+        "codice_comune",
+        "comune",
+        "timestamp",
+        "zone_count",
+        "stale",
+        "semestre",
+        "_records",
+        "_by_key",
+        "_by_zone",
+        "_by_type",
+    )
+
+    def __init__(
+        self,
+        codice_comune: str,
+        comune: str,
+        records: Tuple[QuotationRecord, ...],
+        timestamp: datetime,
+        zone_count: int = 0,
+        stale: bool = False,
+        semestre: Optional[str] = None,
+    ):
+        self.codice_comune = codice_comune
+        self.comune = comune
+        self.timestamp = timestamp
+        self.zone_count = zone_count
+        self.stale = stale
+        self.semestre = semestre
+        self._records = records
+
+        by_key: Dict[Tuple[str, str], List[int]] = {}
+        by_zone: Dict[str, List[int]] = {}
+        by_type: Dict[str, List[int]] = {}
+        for position, record in enumerate(records):
+            by_key.setdefault((record.zona_omi, record.property_type), []).append(position)
+            by_zone.setdefault(record.zona_omi, []).append(position)
+            by_type.setdefault(record.property_type, []).append(position)
+        self._by_key = {key: tuple(value) for key, value in by_key.items()}
+        self._by_zone = {key: tuple(value) for key, value in by_zone.items()}
+        self._by_type = {key: tuple(value) for key, value in by_type.items()}
+
+    @classmethod
+    def from_response(cls, response: "OMIResponse") -> "QuotationTable":
+        """Converte una risposta OMI a 1 mq nella forma compatta."""
+        records = tuple(
+            QuotationRecord(
+                zona_omi=q.zona_omi,
+                property_type=q.property_type,
+                stato_conservazione=q.stato_conservazione,
+                acquisto=(q.prezzo_acquisto_min, q.prezzo_acquisto_max, q.prezzo_acquisto_medio),
+                affitto=(q.prezzo_affitto_min, q.prezzo_affitto_max, q.prezzo_affitto_medio),
+            )
+            for q in response.quotations
+        )
+        return cls(
+            codice_comune=response.codice_comune,
+            comune=response.comune,
+            records=records,
+            timestamp=response.timestamp,
+            zone_count=response.zone_count,
+            stale=response.stale,
+            semestre=response.semestre,
+        )
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[QuotationRecord]:
+        return iter(self._records)
+
+    def estimated_size(self) -> int:
+        """Stima dell'occupazione in memoria, usata dai limiti della cache."""
+        return 512 + 320 * len(self._records)
+
+    def as_stale(self) -> "QuotationTable":
+        """Copia marcata come ultimo dato valido, che condivide record e indici."""
+        copy = object.__new__(QuotationTable)
+        for name in QuotationTable.__slots__:
+            setattr(copy, name, getattr(self, name))
+        copy.stale = True
+        return copy
+
+    def get(self, zona_omi: str, property_type: str) -> Optional[QuotationRecord]:
+        """Quotazione per la coppia (zona, tipo), se presente."""
+        positions = self._by_key.get((zona_omi, property_type))
+        return self._records[positions[0]] if positions else None
+
+    def select(
+        self,
+        zona_omi: Optional[str] = None,
+        property_type: Optional[str] = None,
+        operazione: Optional[str] = None,
+    ) -> List[QuotationRecord]:
+        """
+        Quotazioni filtrate per zona e tipo, nell'ordine della risposta OMI.
+
+        Con ``operazione`` vengono escluse, come fa il servizio OMI, le
+        quotazioni prive di valori per quell'operazione.
+        """
+        if zona_omi and property_type:
+            positions = self._by_key.get((zona_omi, property_type), ())
+        elif zona_omi:
+            positions = self._by_zone.get(zona_omi, ())
+        elif property_type:
+            positions = self._by_type.get(property_type, ())
+        else:
+            positions = range(len(self._records))
+
+        records = [self._records[position] for position in positions]
+        if operazione:
+            records = [record for record in records if record.has_values(operazione)]
+        return records
+
+    def first(
+        self,
+        zona_omi: Optional[str] = None,
+        property_type: Optional[str] = None,
+        operazione: Optional[str] = None,
+    ) -> Optional[QuotationRecord]:
+        """Prima quotazione che soddisfa i filtri (accesso diretto con zona e tipo)."""
+        if zona_omi and property_type:
+            record = self.get(zona_omi, property_type)
+            if record is not None and (not operazione or record.has_values(operazione)):
+                return record
+        records = self.select(zona_omi, property_type, operazione)
+        return records[0] if records else None
+
+    def to_response(
+        self,
+        comune: Optional[str] = None,
+        metri_quadri: float = 1.0,
+        operazione: Optional[str] = None,
+        zona_omi: Optional[str] = None,
+        property_type: Optional[str] = None,
+    ) -> "OMIResponse":
+        """Costruisce la risposta Pydantic filtrata e scalata per ``metri_quadri``."""
+        from app.omi.client import OMIResponse
+
+        return OMIResponse(
+            codice_comune=self.codice_comune,
+            comune=comune or self.comune,
+            metri_quadri=metri_quadri,
+            zona_omi_filter=zona_omi,
+            quotations=[
+                record.to_model(metri_quadri, operazione)
+                for record in self.select(zona_omi, property_type, operazione)
+            ],
+            timestamp=self.timestamp,
+            zone_count=self.zone_count,
+            stale=self.stale,
+            semestre=self.semestre,
+        )
@@ -0,0 +1,181 @@
+"""
+Scheduler a token bucket per le chiamate verso il servizio OMI.
+
+Tutte le richieste passano da un'unica coda asyncio: nessuna coroutine può
+calcolare la propria attesa in parallelo alle altre, quindi il limite verso il
+servizio esterno viene rispettato anche sotto carico concorrente.
+"""
+
+import asyncio
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Callable, Deque, Dict, Optional
+
+
+class RequestPriority(IntEnum):
+    """Corsie di priorità: valori più bassi vengono serviti per primi."""
+
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    BATCH = 2
+
+
+class _LaneStats:
+    __slots__ = ("acquired", "total_wait", "max_wait")
+
+    def __init__(self) -> None:
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class TokenBucketScheduler:
+    """
+    Token bucket con corsie di priorità e ordine FIFO all'interno di ogni corsia.
+
+    I token si ricaricano a ``rate`` al secondo fino a un massimo di ``burst``.
+    Una richiesta prende un token subito solo se nessun'altra è già in coda;
+    altrimenti attende il proprio turno, servita prima per priorità e poi per
+    ordine di arrivo.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if rate <= 0:
+            raise ValueError("rate deve essere positivo")
+        if burst < 1:
+            raise ValueError("burst deve essere almeno 1")
+
+        self._rate = float(rate)
+        self._burst = int(burst)
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lanes: Dict[RequestPriority, Deque[asyncio.Future]] = {
+            priority: deque() for priority in RequestPriority
+        }
+        self._lane_stats: Dict[RequestPriority, _LaneStats] = {
+            priority: _LaneStats() for priority in RequestPriority
+        }
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def burst(self) -> int:
+        return self._burst
+
+    async def acquire(self, priority: RequestPriority = RequestPriority.INTERACTIVE) -> float:
+        """
+        Attende un token nella corsia indicata.
+
+        Args:
+            priority: Corsia di priorità della richiesta
+
+        Returns:
+            Secondi trascorsi in coda
+        """
+        self._refill()
+        if self._tokens >= 1 and not self.queue_depth():
+            self._tokens -= 1
+            self._record(priority, 0.0)
+            return 0.0
+
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        enqueued_at = self._clock()
+        self._lanes[priority].append(future)
+        self._ensure_dispatcher(loop)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Il token era già stato assegnato: lo restituiamo al bucket
+                self._tokens = min(float(self._burst), self._tokens + 1)
+            raise
+
+        waited = self._clock() - enqueued_at
+        self._record(priority, waited)
+        return waited
+
+    def queue_depth(self, priority: Optional[RequestPriority] = None) -> int:
+        """Numero di richieste in attesa, in totale o per una singola corsia."""
+        if priority is not None:
+            return sum(1 for future in self._lanes[priority] if not future.done())
+        return sum(self.queue_depth(lane) for lane in RequestPriority)
+
+    def stats(self) -> Dict[str, object]:
+        """Restituisce configurazione, profondità delle code e tempi di attesa per corsia."""
+        self._refill()
+        lanes = {}
+        for priority in RequestPriority:
+            lane_stats = self._lane_stats[priority]
+            lanes[priority.name.lower()] = {
+                "queue_depth": self.queue_depth(priority),
+                "acquired": lane_stats.acquired,
+                "avg_wait_seconds": (
+                    round(lane_stats.total_wait / lane_stats.acquired, 4)
+                    if lane_stats.acquired
+                    else 0.0
+                ),
+                "max_wait_seconds": round(lane_stats.max_wait, 4),
+            }
+        return {
+            "rate_per_second": self._rate,
+            "burst": self._burst,
+            "tokens_available": round(self._tokens, 4),
+            "queue_depth": self.queue_depth(),
+            "lanes": lanes,
+        }
+
+    def _refill(self) -> None:
+        now = self._clock()
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(float(self._burst), self._tokens + elapsed * self._rate)
+        self._updated = now
+
+    def _record(self, priority: RequestPriority, waited: float) -> None:
+        lane_stats = self._lane_stats[priority]
+        lane_stats.acquired += 1
+        lane_stats.total_wait += waited
+        lane_stats.max_wait = max(lane_stats.max_wait, waited)
+
+    def _next_waiter(self, loop: asyncio.AbstractEventLoop) -> Optional[asyncio.Future]:
+        for priority in RequestPriority:
+            lane = self._lanes[priority]
+            while lane:
+                future = lane.popleft()
+                # Salta le richieste annullate e quelle di un event loop non più attivo
+                if not future.done() and future.get_loop() is loop:
+                    return future
+        return None
+
+    def _ensure_dispatcher(self, loop: asyncio.AbstractEventLoop) -> None:
+        task = self._dispatcher
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self.queue_depth():
+            self._refill()
+            while self._tokens >= 1:
+                future = self._next_waiter(loop)
+                if future is None:
+                    break
+                self._tokens -= 1
+                future.set_result(None)
+
+            if not self.queue_depth():
+                break
+            await asyncio.sleep(max(0.0, (1 - self._tokens) / self._rate))
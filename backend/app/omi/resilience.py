@@ -0,0 +1,131 @@
+"""
+Circuit breaker per il servizio OMI esterno.
+
+Dopo una serie di errori consecutivi il circuito si apre e le chiamate
+falliscono subito, senza attendere il timeout HTTP; trascorso
+``recovery_timeout`` viene lasciata passare una chiamata di prova (half-open)
+che decide se richiudere il circuito o riaprirlo.
+"""
+
+import time
+from enum import Enum
+from typing import Callable, Dict, Optional
+
+
+class CircuitState(str, Enum):
+    """Stati del circuit breaker."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker con stati closed, open e half-open su orologio monotono."""
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Inizializza il circuit breaker.
+
+        Args:
+            failure_threshold: Errori consecutivi dopo i quali il circuito si apre
+            recovery_timeout: Secondi di apertura prima di consentire una chiamata di prova
+            half_open_max_calls: Chiamate di prova contemporanee consentite in half-open
+            clock: Orologio monotono (sostituibile nei test)
+        """
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._half_open_max_calls = half_open_max_calls
+        self._clock = clock
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """Stato corrente; un circuito aperto passa a half-open dopo ``recovery_timeout``."""
+        if (
+            self._state is CircuitState.OPEN
+            and self._opened_at is not None
+            and self._clock() - self._opened_at >= self._recovery_timeout
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True se le chiamate verrebbero rifiutate senza contattare il servizio."""
+        return not self._can_pass()
+
+    def retry_after(self) -> float:
+        """Secondi mancanti alla prossima chiamata di prova (0 se il circuito non è aperto)."""
+        if self.state is not CircuitState.OPEN or self._opened_at is None:
+            return 0.0
+        return max(0.0, self._recovery_timeout - (self._clock() - self._opened_at))
+
+    def allow_request(self) -> bool:
+        """
+        Indica se una chiamata può procedere, riservando uno slot di prova in half-open.
+
+        Ogni chiamata consentita va conclusa con ``record_success``, ``record_failure``
+        o ``release``.
+        """
+        if not self._can_pass():
+            self._rejected += 1
+            return False
+        if self._state is CircuitState.HALF_OPEN:
+            self._half_open_calls += 1
+        return True
+
+    def record_success(self) -> None:
+        """Registra una chiamata riuscita e richiude il circuito."""
+        self._consecutive_failures = 0
+        self._state = CircuitState.CLOSED
+        self._opened_at = None
+        self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        """Registra una chiamata fallita, aprendo il circuito oltre la soglia."""
+        self._consecutive_failures += 1
+        if (
+            self.state is CircuitState.HALF_OPEN
+            or self._consecutive_failures >= self._failure_threshold
+        ):
+            if self._state is not CircuitState.OPEN:
+                self._times_opened += 1
+            self._state = CircuitState.OPEN
+            self._opened_at = self._clock()
+            self._half_open_calls = 0
+
+    def release(self) -> None:
+        """Libera lo slot di una chiamata consentita ma conclusa senza esito (es. annullata)."""
+        if self._state is CircuitState.HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def stats(self) -> Dict[str, object]:
+        """Restituisce stato e contatori del circuito."""
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self._times_opened,
+            "rejected": self._rejected,
+            "retry_after_seconds": round(self.retry_after(), 3),
+        }
+
+    def _can_pass(self) -> bool:
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN:
+            return self._half_open_calls < self._half_open_max_calls
+        return False
@@ -0,0 +1,58 @@
+"""
+Utilità per i semestri OMI.
+
+L'Agenzia delle Entrate pubblica le quotazioni OMI due volte l'anno: il primo
+semestre copre gennaio-giugno, il secondo luglio-dicembre.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+
+def semester_of(moment: Optional[datetime] = None) -> str:
+    """
+    Restituisce l'etichetta del semestre che contiene la data indicata.
+
+    Args:
+        moment: Data di riferimento (default: adesso)
+
+    Returns:
+        Etichetta nel formato ``AAAA-S1`` o ``AAAA-S2``
+    """
+    moment = moment or datetime.now()
+    return f"{moment.year}-S{1 if moment.month <= 6 else 2}"
+
+
+def semester_start(moment: Optional[datetime] = None) -> datetime:
+    """Restituisce l'inizio del semestre che contiene la data indicata."""
+    moment = moment or datetime.now()
+    return datetime(moment.year, 1 if moment.month <= 6 else 7, 1)
+
+
+def next_semester_boundary(moment: Optional[datetime] = None) -> datetime:
+    """
+    Restituisce l'inizio del semestre successivo a quello della data indicata.
+
+    Args:
+        moment: Data di riferimento (default: adesso)
+
+    Returns:
+        1 luglio dello stesso anno o 1 gennaio dell'anno successivo
+    """
+    moment = moment or datetime.now()
+    if moment.month <= 6:
+        return datetime(moment.year, 7, 1)
+    return datetime(moment.year + 1, 1, 1)
+
+
+def parse_semester(label: str) -> datetime:
+    """
+    Restituisce l'inizio del semestre indicato da un'etichetta ``AAAA-S1``/``AAAA-S2``.
+
+    Raises:
+        ValueError: Se l'etichetta non è nel formato atteso
+    """
+    year, _, half = label.strip().upper().partition("-S")
+    if not year.isdigit() or half not in ("1", "2"):
+        raise ValueError(f"Semestre OMI non valido: {label}")
+    return datetime(int(year), 1 if half == "1" else 7, 1)
@@ -0,0 +1,248 @@
+"""
+Stato condiviso tra i processi worker che usano il client OMI.
+
+Con più worker uvicorn ogni processo ha la propria cache e il proprio rate
+limiter. Lo stato condiviso fornisce a tutti i processi dello stesso host:
+
+- un budget globale di richieste verso il servizio OMI (token bucket);
+- lease per comune, così un solo processo scarica i dati mentre gli altri
+  attendono di trovarli nell'archivio persistente comune;
+- la cache negativa degli errori 4xx e dei comuni senza quotazioni.
+
+``SQLiteSharedState`` usa un file SQLite in modalità WAL; ``InMemorySharedState``
+ha la stessa interfaccia ed è utile nei test o con un solo processo.
+"""
+
+import abc
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, Union
+
+
+class OMISharedState(abc.ABC):
+    """Interfaccia dello stato condiviso; le implementazioni sono intercambiabili."""
+
+    @abc.abstractmethod
+    def reserve_token(self, rate: float, burst: int) -> float:
+        """
+        Prenota una richiesta nel budget globale.
+
+        Il token viene sempre assegnato: se il bucket è vuoto la prenotazione
+        va "a debito" e il chiamante deve attendere il ritardo restituito.
+
+        Returns:
+            Secondi da attendere prima di effettuare la richiesta
+        """
+
+    @abc.abstractmethod
+    def refund_token(self, burst: int) -> None:
+        """Restituisce una prenotazione non utilizzata (es. richiesta annullata)."""
+
+    @abc.abstractmethod
+    def acquire_lease(self, key: str, ttl_seconds: float) -> bool:
+        """Prova ad acquisire il lease della chiave; False se già di un altro processo."""
+
+    @abc.abstractmethod
+    def release_lease(self, key: str) -> None:
+        """Rilascia il lease della chiave, se posseduto da questo processo."""
+
+    @abc.abstractmethod
+    def get_negative(self, key: str) -> Optional[str]:
+        """Messaggio d'errore memorizzato per la chiave, se non scaduto."""
+
+    @abc.abstractmethod
+    def set_negative(self, key: str, detail: str, ttl_seconds: float) -> None:
+        """Memorizza un errore definitivo (4xx) o un risultato vuoto per ``ttl_seconds``."""
+
+    def close(self) -> None:
+        """Libera le risorse dello stato condiviso."""
+
+
+def _bucket_reserve(
+    tokens: float, updated: float, now: float, rate: float, burst: int
+) -> Tuple[float, float]:
+    """Ricarica il bucket e preleva un token; restituisce (token rimasti, attesa)."""
+    tokens = min(float(burst), tokens + max(0.0, now - updated) * rate) - 1
+    return tokens, (-tokens / rate if tokens < 0 else 0.0)
+
+
+class InMemorySharedState(OMISharedState):
+    """Stato condiviso nel solo processo corrente, con la stessa semantica di quello SQLite."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._bucket: Optional[Tuple[float, float]] = None
+        self._leases: Dict[str, float] = {}
+        self._negative: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve_token(self, rate: float, burst: int) -> float:
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._bucket or (float(burst), now)
+            tokens, delay = _bucket_reserve(tokens, updated, now, rate, burst)
+            self._bucket = (tokens, now)
+        return delay
+
+    def refund_token(self, burst: int) -> None:
+        with self._lock:
+            if self._bucket is not None:
+                tokens, updated = self._bucket
+                self._bucket = (min(float(burst), tokens + 1), updated)
+
+    def acquire_lease(self, key: str, ttl_seconds: float) -> bool:
+        with self._lock:
+            now = self._clock()
+            if self._leases.get(key, 0.0) > now:
+                return False
+            self._leases[key] = now + ttl_seconds
+            return True
+
+    def release_lease(self, key: str) -> None:
+        with self._lock:
+            self._leases.pop(key, None)
+
+    def get_negative(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._negative.get(key)
+            if entry is None or entry[1] <= self._clock():
+                return None
+            return entry[0]
+
+    def set_negative(self, key: str, detail: str, ttl_seconds: float) -> None:
+        with self._lock:
+            self._negative[key] = (detail, self._clock() + ttl_seconds)
+
+
+class SQLiteSharedState(OMISharedState):
+    """
+    Stato condiviso su un file SQLite in modalità WAL.
+
+    Ogni operazione è una breve transazione ``BEGIN IMMEDIATE``: SQLite
+    serializza le scritture tra processi con il proprio lock sul file, quindi
+    il budget globale resta coerente con qualunque numero di worker.
+    """
+
+    def __init__(self, path: Union[str, Path], clock: Callable[[], float] = time.time):
+        self._path = Path(path)
+        self._clock = clock
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(
+                str(self._path), timeout=10.0, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS omi_rate_bucket (
+                    name TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS omi_leases (
+                    cache_key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS omi_negative (
+                    cache_key TEXT PRIMARY KEY,
+                    detail TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, operation: Callable[[sqlite3.Connection, float], object]) -> object:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(conn, self._clock())
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def reserve_token(self, rate: float, burst: int) -> float:
+        def reserve(conn: sqlite3.Connection, now: float) -> float:
+            row = conn.execute(
+                "SELECT tokens, updated FROM omi_rate_bucket WHERE name = 'omi'"
+            ).fetchone()
+            tokens, updated = row if row else (float(burst), now)
+            tokens, delay = _bucket_reserve(tokens, updated, now, rate, burst)
+            conn.execute(
+                "INSERT OR REPLACE INTO omi_rate_bucket (name, tokens, updated) VALUES ('omi', ?, ?)",
+                (tokens, now),
+            )
+            return delay
+
+        return self._transaction(reserve)
+
+    def refund_token(self, burst: int) -> None:
+        self._transaction(
+            lambda conn, now: conn.execute(
+                "UPDATE omi_rate_bucket SET tokens = MIN(?, tokens + 1) WHERE name = 'omi'",
+                (float(burst),),
+            )
+        )
+
+    def acquire_lease(self, key: str, ttl_seconds: float) -> bool:
+        def acquire(conn: sqlite3.Connection, now: float) -> bool:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM omi_leases WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row and row[0] != self._owner and row[1] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO omi_leases (cache_key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self._owner, now + ttl_seconds),
+            )
+            return True
+
+        return self._transaction(acquire)
+
+    def release_lease(self, key: str) -> None:
+        self._transaction(
+            lambda conn, now: conn.execute(
+                "DELETE FROM omi_leases WHERE cache_key = ? AND owner = ?", (key, self._owner)
+            )
+        )
+
+    def get_negative(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT detail FROM omi_negative WHERE cache_key = ? AND expires_at > ?",
+                (key, self._clock()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_negative(self, key: str, detail: str, ttl_seconds: float) -> None:
+        self._transaction(
+            lambda conn, now: conn.execute(
+                "INSERT OR REPLACE INTO omi_negative (cache_key, detail, expires_at) VALUES (?, ?, ?)",
+                (key, detail, now + ttl_seconds),
+            )
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,136 @@
+"""
+Archivio persistente su SQLite delle risposte OMI.
+
+Le quotazioni OMI cambiano solo a ogni semestre: conservarle su disco evita di
+ripetere le chiamate (e l'attesa del rate limiting) dopo ogni riavvio.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Union
+
+from app.omi.semesters import next_semester_boundary, semester_of
+
+logger = logging.getLogger(__name__)
+
+
+class OMIQuotationStore:
+    """
+    Archivio chiave/valore delle risposte OMI serializzate in JSON.
+
+    Le chiavi sono quelle generate da ``OMIClient._generate_cache_key``; ogni
+    voce scade all'inizio del semestre OMI successivo a quello in cui è stata
+    salvata. Il database viene aperto solo alla prima lettura o scrittura.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS omi_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    semestre TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(
+        self,
+        key: str,
+        now: Optional[float] = None,
+        allow_expired: bool = False,
+    ) -> Optional[str]:
+        """
+        Restituisce il JSON salvato per la chiave se non ancora scaduto.
+
+        Args:
+            key: Chiave di cache OMI
+            now: Timestamp UNIX di riferimento (default: adesso)
+            allow_expired: Restituisce anche voci scadute (ultimo valore noto)
+
+        Returns:
+            Payload JSON o None se assente o scaduto
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT payload, expires_at FROM omi_responses WHERE cache_key = ?",
+                (key,),
+            ).fetchone()
+        if row is None or (row[1] <= now and not allow_expired):
+            return None
+        return row[0]
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """Restituisce il timestamp UNIX di scadenza della voce, se presente."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT expires_at FROM omi_responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, payload: str, fetched_at: Optional[datetime] = None) -> None:
+        """
+        Salva il JSON di una risposta con scadenza al prossimo semestre OMI.
+
+        Args:
+            key: Chiave di cache OMI
+            payload: Risposta serializzata in JSON
+            fetched_at: Momento del recupero dei dati (default: adesso)
+        """
+        fetched_at = fetched_at or datetime.now()
+        expires_at = next_semester_boundary(fetched_at).timestamp()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                """
+                INSERT INTO omi_responses (cache_key, payload, semestre, fetched_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    payload = excluded.payload,
+                    semestre = excluded.semestre,
+                    fetched_at = excluded.fetched_at,
+                    expires_at = excluded.expires_at
+                """,
+                (key, payload, semester_of(fetched_at), fetched_at.timestamp(), expires_at),
+            )
+            conn.commit()
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Elimina le voci scadute e restituisce quante ne sono state rimosse."""
+        now = time.time() if now is None else now
+        with self._lock:
+            conn = self._connect()
+            cursor = conn.execute("DELETE FROM omi_responses WHERE expires_at <= ?", (now,))
+            conn.commit()
+        return cursor.rowcount
+
+    def close(self) -> None:
+        """Chiude la connessione al database, se aperta."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,29 +1,78 @@
 """
 Logica per suggerire automaticamente tipo immobile e zona OMI in base all'indirizzo.
+
+Le parole chiave sono compilate una sola volta, all'importazione del modulo,
+in un'unica espressione regolare per gruppo (``KeywordMatcher``): le
+corrispondenze rispettano i confini di parola ("casa" non riconosce
+"Casalmaggiore") e, tra parole chiave sovrapposte, vince la più lunga
+("centro commerciale" prima di "centro").
+
+Le zone suggerite provengono, in ordine, dai perimetri delle zone (con le
+coordinate), dalle descrizioni delle zone del comune (``zone_index``) e
+infine dalle parole chiave della fascia.
 """
 
+import logging
 import re
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
 
-from app.omi.client import get_omi_client
 from app.omi.property_types import PropertyType
+from app.omi.zone_index import ComuneZoneIndex, get_zone_description_index
 
+logger = logging.getLogger(__name__)
 
-def suggest_property_type(address: str, description: Optional[str] = None) -> Optional[str]:
+KeywordSpec = Mapping[str, Sequence[str]]
+
+
+class KeywordMatcher:
     """
-    Suggerisce il tipo di immobile OMI in base all'indirizzo e alla descrizione.
+    Classificatore a parole chiave pesate, compilato in una sola regex.
 
-    Args:
-        address: Indirizzo completo dell'immobile
-        description: Descrizione opzionale dell'immobile
+    Ogni parola chiave pesa quanto il numero delle sue parole: le frasi
+    specifiche ("ufficio direzionale") contano più dei termini generici. Ogni
+    parola chiave viene contata una sola volta per testo.
 
-    Returns:
-        Valore del PropertyType suggerito o None
+    Args:
+        keywords: Mappa {etichetta: parole chiave}; l'ordine delle etichette
+            risolve i pareggi
     """
-    text = f"{address.lower()} {description.lower() if description else ''}"
 
-    # Parole chiave per identificare il tipo di immobile
-    keywords = {
+    __slots__ = ("_pattern", "_targets", "_order")
+
+    def __init__(self, keywords: KeywordSpec):
+        self._targets: Dict[str, Tuple[str, float]] = {}
+        self._order: Dict[str, int] = {}
+        for position, (label, words) in enumerate(keywords.items()):
+            self._order[label] = position
+            for word in words:
+                key = " ".join(word.lower().split())
+                self._targets.setdefault(key, (label, float(len(key.split()))))
+
+        alternatives = sorted(self._targets, key=len, reverse=True)
+        # Gli spazi delle frasi accettano qualunque sequenza di spazi nel testo
+        body = "|".join(re.escape(word).replace(r"\ ", r"\s+") for word in alternatives)
+        self._pattern = re.compile(rf"(?<!\w)(?:{body})(?!\w)", re.IGNORECASE)
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Punteggio di ogni etichetta con almeno una parola chiave nel testo."""
+        matched = {" ".join(match.group().lower().split()) for match in self._pattern.finditer(text)}
+        scores: Dict[str, float] = {}
+        for word in matched:
+            label, weight = self._targets[word]
+            scores[label] = scores.get(label, 0.0) + weight
+        return scores
+
+    def best(self, text: str) -> Optional[str]:
+        """Etichetta con il punteggio più alto, o None se nessuna parola chiave compare."""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        return min(scores, key=lambda label: (-scores[label], self._order[label]))
+
+
+# Parole chiave per identificare il tipo di immobile
+_PROPERTY_TYPE_MATCHER = KeywordMatcher(
+    {
         PropertyType.ABITAZIONI_CIVILI.value: [
             "appartamento", "bilocale", "trilocale", "quadrilocale",
             "residenziale", "abitazione", "casa"
@@ -37,7 +86,8 @@ def suggest_property_type(address: str, description: Optional[str] = None) -> Op
             "pregio", "corso", "centro storico"
         ],
         PropertyType.ABITAZIONI_ECONOMICHE.value: [
-            "economico", "popolare", "edilizi", "periferia"
+            "economico", "economica", "popolare", "popolari",
+            "edilizia popolare", "edilizia economica", "periferia"
         ],
         PropertyType.NEGOZI.value: [
             "negozio", "locale commerciale", "commerciale", "vetrina",
@@ -57,69 +107,162 @@ def suggest_property_type(address: str, description: Optional[str] = None) -> Op
             "box", "garage", "posto auto", "autorimessa", "parcheggio"
         ],
     }
+)
+
+# Mappatura euristica delle fasce di zona in base alle parole chiave
+_ZONE_MATCHER = KeywordMatcher(
+    {
+        "B": ["centro", "corso", "piazza", "centrale", "duomo"],
+        "C": ["semicentro", "zona residenziale", "viale", "via principale"],
+        "D": ["periferia", "quartiere", "zona", "località"],
+        "E": ["estrema periferia", "frazione", "campagna", "rurale"],
+    }
+)
+
+
+def suggest_property_type(address: str, description: Optional[str] = None) -> Optional[str]:
+    """
+    Suggerisce il tipo di immobile OMI in base all'indirizzo e alla descrizione.
 
-    # Conteggio occorrenze per ogni tipo
-    scores = {}
-    for property_type, words in keywords.items():
-        score = sum(1 for word in words if word in text)
-        if score > 0:
-            scores[property_type] = score
+    Args:
+        address: Indirizzo completo dell'immobile
+        description: Descrizione opzionale dell'immobile
 
-    # Ritorna il tipo con il punteggio più alto
-    if scores:
-        return max(scores.items(), key=lambda x: x[1])[0]
+    Returns:
+        Valore del PropertyType suggerito o None
+    """
+    text = f"{address} {description or ''}"
 
     # Default: abitazioni civili (il più comune)
-    return PropertyType.ABITAZIONI_CIVILI.value
+    return _PROPERTY_TYPE_MATCHER.best(text) or PropertyType.ABITAZIONI_CIVILI.value
 
 
-async def suggest_omi_zone(city: str, address: str) -> Optional[str]:
+def _zone_index(codice_comune: str) -> Optional[ComuneZoneIndex]:
+    """Indice delle descrizioni di zona del comune, se l'archivio è leggibile."""
+    try:
+        return get_zone_description_index().comune(codice_comune)
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Descrizioni delle zone OMI non disponibili per %s: %s", codice_comune, exc)
+        return None
+
+
+def _suggest_zone(address: str, codice_comune: Optional[str] = None) -> str:
+    """
+    Zona suggerita per l'indirizzo.
+
+    Usa le descrizioni delle zone del comune se l'indirizzo ne cita vie o
+    località; altrimenti stima la fascia dalle parole chiave (es. B per il
+    centro) e restituisce la prima zona esistente di quella fascia.
+    """
+    fascia = _ZONE_MATCHER.best(address) or "C"
+    index = _zone_index(codice_comune) if codice_comune else None
+    if index is not None:
+        matches = index.match(address, limit=1)
+        if matches:
+            return matches[0][0]
+        existing = [zona for zona in index.zones() if zona.startswith(fascia)]
+        if existing:
+            return existing[0]
+    # Ritorna la prima zona della fascia; senza indicatori il semicentro (C1)
+    return f"{fascia}1"
+
+
+def suggest_zone_matches(city: str, address: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """
+    Zone del comune citate dall'indirizzo, in ordine di punteggio.
+
+    Args:
+        city: Nome del comune
+        address: Indirizzo completo
+        limit: Numero massimo di zone
+
+    Returns:
+        Lista di ``{"zona", "score", "descrizione"}``; vuota se il comune non è
+        riconosciuto o le sue zone non sono state importate
+    """
+    from app.omi.cadastral_codes import get_cadastral_code
+
+    codice_comune = get_cadastral_code(city)
+    index = _zone_index(codice_comune) if codice_comune else None
+    if index is None:
+        return []
+    return [
+        {"zona": zona, "score": score, "descrizione": index.descriptions.get(zona)}
+        for zona, score in index.match(address, limit)
+    ]
+
+
+async def suggest_omi_zone(
+    city: str,
+    address: str,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+) -> Optional[str]:
     """
     Suggerisce la zona OMI in base alla città e all'indirizzo.
 
+    Con le coordinate, se i perimetri delle zone del comune sono stati
+    importati, restituisce la zona che contiene il punto.
+
     Args:
         city: Nome del comune
         address: Indirizzo completo
+        latitude: Latitudine dell'immobile (opzionale)
+        longitude: Longitudine dell'immobile (opzionale)
 
     Returns:
         Zona OMI suggerita o None
     """
     try:
-        omi_client = get_omi_client()
-
-        # Ottieni le zone disponibili per la città
-        # Questo richiederà una query OMI per ottenere le zone
         from app.omi.cadastral_codes import get_cadastral_code
+        from app.omi.geo import get_zone_index
 
-        if not get_cadastral_code(city):
+        codice_comune = get_cadastral_code(city)
+        if not codice_comune:
             return None
 
-        # Estrai indicatori di zona dall'indirizzo
-        address_lower = address.lower()
-
-        # Mappatura euristica delle zone in base alle parole chiave
-        zone_indicators = {
-            "B": ["centro", "corso", "piazza", "centrale", "duomo"],
-            "C": ["semicentro", "zona residenziale", "viale", "via principale"],
-            "D": ["periferia", "quartiere", "zona", "località"],
-            "E": ["estrema periferia", "frazione", "campagna", "rurale"]
-        }
+        if latitude is not None and longitude is not None:
+            located = get_zone_index().locate(latitude, longitude, codice_comune)
+            if located:
+                return located[1]
 
-        # Trova la zona più probabile
-        for zone_prefix, keywords in zone_indicators.items():
-            if any(keyword in address_lower for keyword in keywords):
-                # Ritorna la prima zona con questo prefisso
-                # Es: se zona B, ritorna B1 come default
-                return f"{zone_prefix}1"
-
-        # Se non troviamo indicatori, suggerisci zona C (semicentro) come default
-        return "C1"
+        return _suggest_zone(address, codice_comune)
 
     except Exception:
         # In caso di errore, ritorna None
         return None
 
 
+def suggest_batch(
+    items: Iterable[Tuple[Optional[str], str, Optional[str]]]
+) -> List[Dict[str, Optional[str]]]:
+    """
+    Suggerisce tipo immobile e zona OMI per molti immobili in una sola chiamata.
+
+    Args:
+        items: Terne ``(città, indirizzo, descrizione)``
+
+    Returns:
+        Per ogni immobile, nello stesso ordine, ``suggested_property_type`` e
+        ``suggested_zone`` (None se il comune non è riconosciuto)
+    """
+    from app.omi.cadastral_codes import get_cadastral_code
+
+    known_cities: Dict[Optional[str], Optional[str]] = {}
+    results = []
+    for city, address, description in items:
+        if city not in known_cities:
+            known_cities[city] = get_cadastral_code(city) if city else None
+        codice_comune = known_cities[city]
+        results.append(
+            {
+                "suggested_property_type": suggest_property_type(address, description),
+                "suggested_zone": _suggest_zone(address, codice_comune) if codice_comune else None,
+            }
+        )
+    return results
+
+
 def get_zone_description(zone: str) -> str:
     """
     Fornisce una descrizione della zona OMI.
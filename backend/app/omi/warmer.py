@@ -0,0 +1,129 @@
+"""
+Pre-caricamento periodico della cache OMI.
+
+Il warmer tiene in cache i comuni configurati e quelli interrogati più spesso,
+aggiornandoli poco prima della scadenza: la prima valutazione dopo l'avvio (o
+dopo la scadenza) non paga così la latenza del servizio esterno.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Iterable, List, Optional
+
+from app.omi.cadastral_codes import CADASTRAL_CODES
+from app.omi.client import OMIClient, OMIServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class OMICacheWarmer:
+    """Task di background che mantiene calda la cache OMI."""
+
+    def __init__(
+        self,
+        client: OMIClient,
+        cities: Iterable[str] = (),
+        top_n: int = 0,
+        interval_seconds: float = 300.0,
+        refresh_margin_seconds: float = 600.0,
+    ):
+        """
+        Inizializza il warmer.
+
+        Args:
+            client: Client OMI da mantenere in cache
+            cities: Comuni (chiavi di ``CADASTRAL_CODES``) da pre-caricare sempre
+            top_n: Numero di comuni più interrogati da aggiungere ai configurati
+            interval_seconds: Intervallo tra due passaggi del warmer
+            refresh_margin_seconds: Anticipo sulla scadenza con cui aggiornare i dati
+        """
+        self._client = client
+        self._cities: List[str] = []
+        for city in cities:
+            key = city.strip().lower()
+            if not key:
+                continue
+            if key not in CADASTRAL_CODES:
+                logger.warning("Warmer OMI: comune sconosciuto ignorato: %s", city)
+                continue
+            if key not in self._cities:
+                self._cities.append(key)
+        self._top_n = top_n
+        self._interval = interval_seconds
+        self._refresh_margin = refresh_margin_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, client: OMIClient) -> "OMICacheWarmer":
+        """
+        Crea il warmer dalle variabili d'ambiente.
+
+        ``OMI_WARM_CITIES`` (elenco separato da virgole), ``OMI_WARM_TOP_N``,
+        ``OMI_WARM_INTERVAL`` e ``OMI_WARM_REFRESH_MARGIN`` (in secondi).
+        """
+        return cls(
+            client,
+            cities=os.getenv("OMI_WARM_CITIES", "").split(","),
+            top_n=int(os.getenv("OMI_WARM_TOP_N", 10)),
+            interval_seconds=float(os.getenv("OMI_WARM_INTERVAL", 300)),
+            refresh_margin_seconds=float(os.getenv("OMI_WARM_REFRESH_MARGIN", 600)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._cities) or self._top_n > 0
+
+    def targets(self) -> List[str]:
+        """Comuni da mantenere in cache nel prossimo passaggio."""
+        targets = list(self._cities)
+        if self._top_n > 0:
+            for city in self._client.most_queried_cities(self._top_n):
+                key = city.strip().lower()
+                if key not in targets:
+                    targets.append(key)
+        return targets
+
+    async def run_once(self) -> int:
+        """
+        Esegue un passaggio sui comuni target.
+
+        Returns:
+            Numero di comuni aggiornati dal servizio OMI
+        """
+        refreshed = 0
+        for city in self.targets():
+            try:
+                if await self._client.warm_comune(city, self._refresh_margin):
+                    refreshed += 1
+            except (OMIServiceError, ValueError) as exc:
+                logger.warning("Warmer OMI: aggiornamento fallito per %s: %s", city, exc)
+        return refreshed
+
+    async def run(self) -> None:
+        """Esegue ``run_once`` a intervalli regolari finché il task non viene annullato."""
+        while True:
+            try:
+                refreshed = await self.run_once()
+            except Exception:  # noqa: BLE001
+                logger.exception("Warmer OMI: errore imprevisto")
+            else:
+                if refreshed:
+                    logger.info("Warmer OMI: aggiornati %d comuni", refreshed)
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        """Avvia il task di background sul loop corrente, se il warmer è abilitato."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        """Interrompe il task di background."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
@@ -0,0 +1,142 @@
+"""
+Indice vie/località → zone OMI di un comune.
+
+Le descrizioni delle zone dei file ufficiali (``Zona_Descr``, es. "BRERA, VIA
+SOLFERINO, CORSO GARIBALDI") vengono scomposte in parole e indicizzate per
+comune: ogni parola rimanda alle zone che la citano. Un indirizzo viene
+confrontato con l'indice pesando le parole per rarità (IDF), così le zone
+suggerite esistono sempre nel comune e non servono chiamate al servizio OMI.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.omi.city_index import normalize_city_name
+from app.omi.offline import OMIOfflineDataset
+
+# Tipi di strada e parole generiche che non distinguono una zona dall'altra
+_IGNORED = frozenset(
+    {
+        "via", "viale", "vle", "corso", "piazza", "piazzale", "pza", "largo", "vicolo",
+        "strada", "str", "contrada", "localita", "frazione", "lungo", "zona", "zone",
+        "quartiere", "area", "parte", "tra", "fino", "dal", "dalla", "alla", "del",
+        "della", "delle", "dei", "degli", "nel", "nella", "sul", "sulla", "per", "con",
+        "civico", "civici", "snc", "comune",
+    }
+)
+
+
+def address_tokens(text: str) -> List[str]:
+    """Parole significative di un indirizzo o di una descrizione di zona."""
+    return [
+        token
+        for token in normalize_city_name(text).split()
+        if len(token) >= 3 and not token.isdigit() and token not in _IGNORED
+    ]
+
+
+class ComuneZoneIndex:
+    """
+    Indice invertito parola → zone per un singolo comune.
+
+    Args:
+        descriptions: Mappa {zona: descrizione}
+    """
+
+    __slots__ = ("descriptions", "_postings", "_idf")
+
+    def __init__(self, descriptions: Dict[str, Optional[str]]):
+        self.descriptions = descriptions
+        self._postings: Dict[str, Tuple[str, ...]] = {}
+        postings: Dict[str, List[str]] = {}
+        for zona, descrizione in descriptions.items():
+            for token in set(address_tokens(descrizione or "")):
+                postings.setdefault(token, []).append(zona)
+        self._postings = {token: tuple(sorted(zones)) for token, zones in postings.items()}
+        total = max(1, len(descriptions))
+        self._idf = {
+            token: math.log(1 + total / len(zones)) for token, zones in self._postings.items()
+        }
+
+    def zones(self) -> List[str]:
+        """Zone del comune."""
+        return sorted(self.descriptions)
+
+    def match(self, address: str, limit: int = 3) -> List[Tuple[str, float]]:
+        """
+        Zone citate dalle parole dell'indirizzo, in ordine di punteggio.
+
+        Il punteggio è la somma degli IDF delle parole in comune con la
+        descrizione della zona: una via citata da una sola zona pesa più di
+        un nome presente in molte descrizioni.
+
+        Returns:
+            Coppie ``(zona, punteggio)``
+        """
+        scores: Dict[str, float] = {}
+        for token in set(address_tokens(address)):
+            for zona in self._postings.get(token, ()):
+                scores[zona] = scores.get(zona, 0.0) + self._idf[token]
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(zona, round(score, 3)) for zona, score in ranked[:limit]]
+
+
+class OMIZoneDescriptionIndex:
+    """
+    Indici delle descrizioni di zona per comune, dall'archivio dei file ufficiali.
+
+    Gli indici vengono costruiti alla prima richiesta per comune e tenuti in una
+    cache LRU, invalidata quando nell'archivio viene importato un nuovo semestre.
+    """
+
+    def __init__(self, dataset: OMIOfflineDataset, max_comuni: int = 512):
+        self._dataset = dataset
+        self._max_comuni = max_comuni
+        self._comuni: "OrderedDict[str, ComuneZoneIndex]" = OrderedDict()
+        self._version: Optional[Tuple[int, float]] = None
+        self._lock = threading.Lock()
+
+    def comune(self, codice_comune: str) -> ComuneZoneIndex:
+        """Indice del comune (vuoto se le zone non sono state importate)."""
+        version = self._dataset.version()
+        with self._lock:
+            if version != self._version:
+                self._comuni.clear()
+                self._version = version
+            cached = self._comuni.get(codice_comune)
+            if cached is not None:
+                self._comuni.move_to_end(codice_comune)
+                return cached
+
+        index = ComuneZoneIndex(
+            {zona: info["descrizione"] for zona, info in self._dataset.zones(codice_comune).items()}
+        )
+        with self._lock:
+            self._comuni[codice_comune] = index
+            while len(self._comuni) > self._max_comuni:
+                self._comuni.popitem(last=False)
+        return index
+
+    def match(self, codice_comune: str, address: str, limit: int = 3) -> List[Tuple[str, float]]:
+        """Zone del comune citate dall'indirizzo, in ordine di punteggio."""
+        return self.comune(codice_comune).match(address, limit)
+
+
+# Istanza singleton dell'indice
+_zone_description_index: Optional[OMIZoneDescriptionIndex] = None
+
+
+def get_zone_description_index() -> OMIZoneDescriptionIndex:
+    """
+    Ottiene l'indice singleton delle descrizioni di zona.
+
+    Condivide l'archivio dei file ufficiali con lo storico (``get_omi_history``).
+    """
+    global _zone_description_index
+    if _zone_description_index is None:
+        from app.omi.history import get_omi_history
+
+        _zone_description_index = OMIZoneDescriptionIndex(get_omi_history().dataset)
+    return _zone_description_index
@@ -0,0 +1,546 @@
+"""
+Archivio degli annunci analizzati e ricerca dei comparabili.
+
+Gli annunci restituiti da ``/api/scraper/parse-url`` vengono salvati in
+SQLite (``ListingsStore``). Quelli in vendita (contratto letto dalla pagina)
+con coordinate e prezzo al mq plausibile sono indicizzati in memoria
+(``ListingIndex``) su una griglia uniforme di latitudine e longitudine: le
+colonne NumPy sono ordinate per cella, quindi le celle vicine a un punto sono
+intervalli contigui trovati con una ricerca binaria. Le distanze (haversine) e i punteggi di similarità sono
+calcolati in blocco sui soli candidati delle celle vicine.
+
+Gli annunci salvati dopo la costruzione dell'indice finiscono in un piccolo
+blocco aggiuntivo, esaminato per intero a ogni ricerca e fuso con l'indice
+quando supera ``ListingIndex.MERGE_THRESHOLD`` annunci.
+"""
+
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from app.omi.property_types import PropertyType, get_property_type
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+DEFAULT_LISTINGS_PATH = BASE_DIR / "storage" / "listings" / "listings.sqlite3"
+
+EARTH_RADIUS_M = 6_371_000.0
+
+# Prezzo al mq minimo di un annuncio in vendita: sotto questa soglia il prezzo
+# è quasi certamente un canone mensile o un errore di lettura della pagina
+MIN_SALE_PRICE_PER_SQM = 300.0
+
+_PROPERTY_TYPES = list(PropertyType)
+
+# Riga dell'indice: id, latitudine, longitudine, superficie, prezzo, tipo
+IndexRow = Tuple[int, float, float, float, float, int]
+
+
+def property_type_code(description: Optional[str]) -> int:
+    """Posizione del tipo OMI corrispondente alla descrizione (default abitazioni civili)."""
+    return _PROPERTY_TYPES.index(get_property_type(description or ""))
+
+
+def haversine_m(
+    latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray
+) -> np.ndarray:
+    """Distanze in metri tra un punto e una colonna di punti (gradi WGS84)."""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def is_sale_listing(listing: Mapping[str, Any]) -> bool:
+    """
+    True se l'annuncio è in vendita secondo il contratto letto dalla pagina.
+
+    Gli affitti (prezzi mensili) e gli annunci di contratto sconosciuto non
+    sono comparabili di vendita.
+    """
+    return listing.get("contractType") == "vendita"
+
+
+def _plausible_sale_price(price: Any, surface: Any) -> bool:
+    """True se prezzo e superficie danno un prezzo al mq plausibile per una vendita."""
+    return bool(price and surface) and price / surface >= MIN_SALE_PRICE_PER_SQM
+
+
+class ComparableListing(NamedTuple):
+    """Annuncio comparabile con distanza in metri e similarità 0-100."""
+
+    id: int
+    url: str
+    address: Optional[str]
+    price: float
+    surface: float
+    distance: float
+    similarity: float
+
+
+class ListingsStore:
+    """
+    Archivio SQLite degli annunci, uno per URL (l'ultima analisi sostituisce la precedente).
+
+    Il database viene aperto solo al primo accesso.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self._path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self._path), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS listings (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    source TEXT,
+                    address TEXT,
+                    city TEXT,
+                    price REAL,
+                    surface REAL,
+                    property_type INTEGER NOT NULL,
+                    latitude REAL,
+                    longitude REAL,
+                    for_sale INTEGER NOT NULL,
+                    scraped_at REAL NOT NULL,
+                    payload TEXT NOT NULL
+                )
+                """
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def save(self, listing: Mapping[str, Any], scraped_at: Optional[float] = None) -> int:
+        """
+        Salva o aggiorna un annuncio (campi di ``PropertyData``).
+
+        Returns:
+            Id dell'annuncio, stabile tra un aggiornamento e l'altro
+        """
+        url = listing["url"]
+        values = (
+            listing.get("source"),
+            listing.get("address"),
+            listing.get("city"),
+            listing.get("price"),
+            listing.get("surface"),
+            property_type_code(listing.get("propertyType")),
+            listing.get("latitude"),
+            listing.get("longitude"),
+            int(is_sale_listing(listing)),
+            time.time() if scraped_at is None else scraped_at,
+            json.dumps(listing, ensure_ascii=False, default=str),
+        )
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                """
+                INSERT INTO listings (
+                    url, source, address, city, price, surface, property_type,
+                    latitude, longitude, for_sale, scraped_at, payload
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    source = excluded.source,
+                    address = excluded.address,
+                    city = excluded.city,
+                    price = excluded.price,
+                    surface = excluded.surface,
+                    property_type = excluded.property_type,
+                    latitude = excluded.latitude,
+                    longitude = excluded.longitude,
+                    for_sale = excluded.for_sale,
+                    scraped_at = excluded.scraped_at,
+                    payload = excluded.payload
+                """,
+                (url, *values),
+            )
+            conn.commit()
+            row = conn.execute("SELECT id FROM listings WHERE url = ?", (url,)).fetchone()
+        return row[0]
+
+    def index_rows(self) -> List[IndexRow]:
+        """Annunci in vendita con coordinate e prezzo al mq plausibile, per l'indice."""
+        with self._lock:
+            return self._connect().execute(
+                """
+                SELECT id, latitude, longitude, surface, price, property_type
+                FROM listings
+                WHERE for_sale = 1 AND latitude IS NOT NULL AND longitude IS NOT NULL
+                    AND price > 0 AND surface > 0 AND price / surface >= ?
+                """,
+                (MIN_SALE_PRICE_PER_SQM,),
+            ).fetchall()
+
+    def details(self, ids: Sequence[int]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """URL e indirizzo degli annunci indicati."""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT id, url, address FROM listings WHERE id IN ({placeholders})",
+                tuple(int(listing_id) for listing_id in ids),
+            ).fetchall()
+        return {listing_id: (url, address) for listing_id, url, address in rows}
+
+    def count(self) -> int:
+        """Numero di annunci archiviati."""
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def close(self) -> None:
+        """Chiude la connessione al database, se aperta."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class _Columns(NamedTuple):
+    ids: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    surface: np.ndarray
+    price: np.ndarray
+    property_type: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[IndexRow]) -> "_Columns":
+        table = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        return cls(
+            table[:, 0].astype(np.int64),
+            np.ascontiguousarray(table[:, 1]),
+            np.ascontiguousarray(table[:, 2]),
+            np.ascontiguousarray(table[:, 3]),
+            np.ascontiguousarray(table[:, 4]),
+            table[:, 5].astype(np.int16),
+        )
+
+    def take(self, positions: np.ndarray) -> "_Columns":
+        return _Columns(*(column[positions] for column in self))
+
+
+class ListingIndex:
+    """
+    Indice spaziale degli annunci su griglia uniforme.
+
+    Args:
+        rows: Righe ``(id, latitudine, longitudine, superficie, prezzo, tipo)``
+        cell_size: Lato delle celle in gradi (default 0,005°, circa 500 m)
+    """
+
+    MERGE_THRESHOLD = 4096
+
+    def __init__(self, rows: Sequence[IndexRow] = (), cell_size: float = 0.005):
+        self._cell_size = cell_size
+        self._lock = threading.Lock()
+        self._pending: Dict[int, IndexRow] = {}
+        self._pending_columns: Optional[_Columns] = None
+        self._build(list(rows))
+
+    def _cells(self, latitudes: np.ndarray, longitudes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return (
+            np.floor(latitudes / self._cell_size).astype(np.int64),
+            np.floor(longitudes / self._cell_size).astype(np.int64),
+        )
+
+    @staticmethod
+    def _keys(cell_y: np.ndarray, cell_x: np.ndarray) -> np.ndarray:
+        return (cell_y << 32) + (cell_x + (1 << 31))
+
+    def _build(self, rows: List[IndexRow]) -> None:
+        columns = _Columns.from_rows(rows)
+        keys = self._keys(*self._cells(columns.latitude, columns.longitude))
+        order = np.argsort(keys, kind="stable")
+        self._columns = columns.take(order)
+        self._keys_sorted = keys[order]
+        self._alive = np.ones(len(order), dtype=bool)
+        # Posizione di ogni id, per invalidare gli annunci aggiornati
+        self._id_order = np.argsort(self._columns.ids, kind="stable")
+        self._ids_sorted = self._columns.ids[self._id_order]
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self._pending)
+
+    def add(self, row: IndexRow) -> None:
+        """Aggiunge o sostituisce un annuncio."""
+        with self._lock:
+            self._discard(row[0])
+            self._pending[row[0]] = row
+            self._pending_columns = None
+            if len(self._pending) >= self.MERGE_THRESHOLD:
+                self._merge()
+
+    def remove(self, listing_id: int) -> None:
+        """Toglie un annuncio dall'indice (es. diventato un affitto o senza coordinate)."""
+        with self._lock:
+            self._discard(listing_id)
+            if self._pending.pop(listing_id, None) is not None:
+                self._pending_columns = None
+
+    def _discard(self, listing_id: int) -> None:
+        position = np.searchsorted(self._ids_sorted, listing_id)
+        if position < len(self._ids_sorted) and self._ids_sorted[position] == listing_id:
+            self._alive[self._id_order[position]] = False
+
+    def _merge(self) -> None:
+        live = self._columns.take(np.flatnonzero(self._alive))
+        rows = list(
+            zip(
+                live.ids.tolist(),
+                live.latitude.tolist(),
+                live.longitude.tolist(),
+                live.surface.tolist(),
+                live.price.tolist(),
+                live.property_type.tolist(),
+            )
+        )
+        self._build(rows + list(self._pending.values()))
+        self._pending = {}
+        self._pending_columns = None
+
+    def _candidates(self, latitude: float, longitude: float, radius: int) -> np.ndarray:
+        """Posizioni degli annunci nelle celle entro ``radius`` celle dal punto."""
+        cell_y, cell_x = (int(value) for value in self._cells(np.array(latitude), np.array(longitude)))
+        offsets = np.arange(-radius, radius + 1, dtype=np.int64)
+        # Le righe di celle sono intervalli contigui di chiavi: una ricerca per riga
+        rows = cell_y + offsets
+        starts = np.searchsorted(self._keys_sorted, self._keys(rows, np.full_like(rows, cell_x - radius)))
+        ends = np.searchsorted(
+            self._keys_sorted, self._keys(rows, np.full_like(rows, cell_x + radius)), side="right"
+        )
+        ranges = [np.arange(start, end) for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+        if not ranges:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate(ranges)
+        return positions[self._alive[positions]]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 3,
+        surface: Optional[float] = None,
+        property_type: Optional[int] = None,
+        max_distance: float = 3000.0,
+        pool: int = 32,
+    ) -> List[Tuple[int, float, float, float, float]]:
+        """
+        Annunci più simili tra i più vicini al punto.
+
+        Si raccolgono i ``pool`` annunci più vicini entro ``max_distance`` metri
+        e li si ordina per similarità: vicinanza (scala di 500 m), superficie
+        (rapporto logaritmico) e tipo di immobile.
+
+        Returns:
+            Tuple ``(id, distanza_m, similarità, prezzo, superficie)``
+        """
+        with self._lock:
+            # Lato minimo di una cella in metri (in longitudine si restringe col coseno)
+            cell_m = self._cell_size * 111_320.0 * max(math.cos(math.radians(latitude)), 0.1)
+            max_radius = max(1, math.ceil(max_distance / cell_m))
+            radius = 1
+            positions = self._candidates(latitude, longitude, radius)
+            while len(positions) < pool and radius < max_radius:
+                radius = min(max_radius, radius * 2)
+                positions = self._candidates(latitude, longitude, radius)
+            columns = self._columns.take(positions)
+            distances = haversine_m(latitude, longitude, columns.latitude, columns.longitude)
+
+            # Gli annunci fuori dal quadrato raccolto distano almeno radius * cell_m:
+            # se il pool arriva più lontano, si allarga la ricerca fin lì
+            if len(positions) >= pool and radius < max_radius:
+                reach = float(np.partition(distances, pool - 1)[pool - 1])
+                needed = min(max_radius, math.ceil(reach / cell_m))
+                if needed > radius:
+                    positions = self._candidates(latitude, longitude, needed)
+                    columns = self._columns.take(positions)
+                    distances = haversine_m(latitude, longitude, columns.latitude, columns.longitude)
+
+            if self._pending:
+                if self._pending_columns is None:
+                    self._pending_columns = _Columns.from_rows(list(self._pending.values()))
+                pending = self._pending_columns
+                columns = _Columns(*(np.concatenate(pair) for pair in zip(columns, pending)))
+                distances = np.concatenate(
+                    [distances, haversine_m(latitude, longitude, pending.latitude, pending.longitude)]
+                )
+
+        within = np.flatnonzero(distances <= max_distance)
+        if len(within) > pool:
+            within = within[np.argpartition(distances[within], pool - 1)[:pool]]
+        if not len(within):
+            return []
+
+        distances = distances[within]
+        proximity = np.exp(-distances / 500.0)
+        if surface and surface > 0:
+            size = 1.0 - np.minimum(np.abs(np.log(columns.surface[within] / surface)), 1.0)
+        else:
+            size = np.full(len(within), 0.5)
+        if property_type is not None:
+            same_type = (columns.property_type[within] == property_type).astype(np.float64)
+        else:
+            same_type = np.ones(len(within))
+        similarity = 100.0 * (0.5 * proximity + 0.35 * size + 0.15 * same_type)
+
+        best = np.argsort(-similarity, kind="stable")[:k]
+        return [
+            (
+                int(columns.ids[within[i]]),
+                float(distances[i]),
+                float(similarity[i]),
+                float(columns.price[within[i]]),
+                float(columns.surface[within[i]]),
+            )
+            for i in best
+        ]
+
+
+class ComparablesEngine:
+    """
+    Archivio degli annunci con il relativo indice spaziale, costruito al primo utilizzo.
+
+    Args:
+        store: Archivio SQLite degli annunci
+    """
+
+    def __init__(self, store: ListingsStore):
+        self._store = store
+        self._index: Optional[ListingIndex] = None
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> ListingsStore:
+        return self._store
+
+    def index(self) -> ListingIndex:
+        """Indice spaziale, letto dall'archivio alla prima richiesta."""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    started = time.perf_counter()
+                    self._index = ListingIndex(self._store.index_rows())
+                    logger.info(
+                        "Indice degli annunci: %d annunci in %.0f ms",
+                        len(self._index),
+                        (time.perf_counter() - started) * 1000,
+                    )
+        return self._index
+
+    def save(self, listing: Mapping[str, Any]) -> int:
+        """Salva un annuncio e aggiorna l'indice, se già costruito."""
+        listing_id = self._store.save(listing)
+        if self._index is not None:
+            latitude, longitude = listing.get("latitude"), listing.get("longitude")
+            price, surface = listing.get("price"), listing.get("surface")
+            if (
+                is_sale_listing(listing)
+                and latitude is not None
+                and longitude is not None
+                and _plausible_sale_price(price, surface)
+            ):
+                self._index.add(
+                    (
+                        listing_id,
+                        float(latitude),
+                        float(longitude),
+                        float(surface),
+                        float(price),
+                        property_type_code(listing.get("propertyType")),
+                    )
+                )
+            else:
+                self._index.remove(listing_id)
+        return listing_id
+
+    def find(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 3,
+        surface: Optional[float] = None,
+        property_type: Optional[str] = None,
+        max_distance: float = 3000.0,
+    ) -> List[ComparableListing]:
+        """
+        Annunci reali comparabili con l'immobile.
+
+        Args:
+            latitude: Latitudine dell'immobile
+            longitude: Longitudine dell'immobile
+            k: Numero di comparabili
+            surface: Superficie dell'immobile in mq
+            property_type: Tipo di immobile (es. "appartamento")
+            max_distance: Distanza massima in metri
+
+        Returns:
+            Comparabili dal più simile al meno simile
+        """
+        matches = self.index().nearest(
+            latitude,
+            longitude,
+            k=k,
+            surface=surface,
+            property_type=property_type_code(property_type) if property_type else None,
+            max_distance=max_distance,
+        )
+        details = self._store.details([match[0] for match in matches])
+        return [
+            ComparableListing(
+                id=listing_id,
+                url=details[listing_id][0],
+                address=details[listing_id][1],
+                price=price,
+                surface=listing_surface,
+                distance=distance,
+                similarity=similarity,
+            )
+            for listing_id, distance, similarity, price, listing_surface in matches
+            if listing_id in details
+        ]
+
+
+def default_listings_path() -> Path:
+    """Percorso dell'archivio da ``LISTINGS_STORE_PATH`` o quello predefinito."""
+    path = os.getenv("LISTINGS_STORE_PATH", "").strip()
+    return Path(path) if path else DEFAULT_LISTINGS_PATH
+
+
+# Istanza singleton del motore dei comparabili
+_comparables_engine: Optional[ComparablesEngine] = None
+_comparables_engine_lock = threading.Lock()
+
+
+def get_comparables_engine() -> ComparablesEngine:
+    """Ottiene il motore singleton dei comparabili sull'archivio ``LISTINGS_STORE_PATH``."""
+    global _comparables_engine
+    if _comparables_engine is None:
+        with _comparables_engine_lock:
+            if _comparables_engine is None:
+                _comparables_engine = ComparablesEngine(ListingsStore(default_listings_path()))
+    return _comparables_engine
@@ -0,0 +1,128 @@
+"""
+Motore di calcolo vettoriale delle valutazioni.
+
+Applica a colonne di immobili (array NumPy) le stesse correzioni della
+valutazione singola (``_adjust_price_per_sqm`` e ``_calculate_confidence`` in
+``app.api.valuation``), con lo stesso ordine delle moltiplicazioni: i risultati
+coincidono con il percorso scalare. L'ampiezza dell'intervallo di stima
+(``estimate_spread``) è la stessa funzione per i due percorsi.
+
+I campi opzionali assenti sono rappresentati da ``NaN``; come nel percorso
+scalare, zero e assente equivalgono a "non indicato" dove il codice scalare
+controlla la veridicità del valore (es. ``if property_data.price``).
+"""
+
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class PricingColumns(NamedTuple):
+    """Colonne degli immobili da valutare, una riga per immobile (``float64``)."""
+
+    base_price: np.ndarray  # prezzo base al mq del comune o della provincia
+    surface: np.ndarray
+    floor: np.ndarray
+    rooms: np.ndarray
+    bedrooms: np.ndarray
+    bathrooms: np.ndarray
+    price: np.ndarray  # prezzo richiesto
+    latitude: np.ndarray
+    longitude: np.ndarray
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[Optional[float]]]) -> "PricingColumns":
+        """
+        Costruisce le colonne da righe nell'ordine dei campi (None diventa NaN).
+
+        Args:
+            rows: Righe ``(base_price, surface, floor, rooms, bedrooms, bathrooms,
+                price, latitude, longitude)``
+        """
+        # Con dtype float64 NumPy converte None in NaN
+        table = np.array(list(rows), dtype=np.float64).reshape(-1, len(cls._fields))
+        return cls(*np.ascontiguousarray(table.T))
+
+
+def _given(values: np.ndarray) -> np.ndarray:
+    """Valori indicati e diversi da zero (la veridicità del percorso scalare)."""
+    return ~np.isnan(values) & (values != 0)
+
+
+def adjust_price_per_sqm(columns: PricingColumns) -> np.ndarray:
+    """
+    Prezzo al mq corretto per superficie, piano, densità dei locali, bagni e
+    prezzo richiesto.
+
+    Args:
+        columns: Colonne degli immobili
+
+    Returns:
+        Prezzo al mq per ogni immobile
+    """
+    price = columns.base_price.copy()
+    surface = np.maximum(columns.surface, 1)
+
+    # Come nel percorso scalare vale il primo ramo vero: oltre i 150 mq si
+    # applica sempre 0,92 (il ramo "> 200" non viene mai raggiunto)
+    surface_factor = np.select(
+        [surface < 55, surface < 85, surface > 150, surface > 200],
+        [1.12, 1.05, 0.92, 0.85],
+        default=1.0,
+    )
+    price = np.where(surface_factor != 1.0, price * surface_factor, price)
+
+    floor = columns.floor
+    price = np.where(floor <= 0, price * 0.97, np.where(floor >= 4, price * 1.05, price))
+
+    rooms_given = _given(columns.rooms)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        density = columns.rooms / surface
+        price = np.where(
+            rooms_given & (density > 0.045),
+            price * 1.03,
+            np.where(rooms_given & (density < 0.02), price * 0.96, price),
+        )
+
+        bedroom_ratio = columns.bedrooms / columns.rooms
+    price = np.where(
+        _given(columns.bedrooms) & rooms_given & (bedroom_ratio >= 0.75), price * 1.02, price
+    )
+
+    bathrooms = columns.bathrooms
+    price = np.where(bathrooms >= 2, price * 1.04, price)
+    price = np.where(bathrooms >= 3, price * 1.02, price)
+
+    listed = _given(columns.price)
+    with np.errstate(invalid="ignore"):
+        listed_price_per_sqm = np.maximum(columns.price / surface, 500)
+        ratio = np.minimum(np.maximum(listed_price_per_sqm / price, 0.6), 1.6)
+        weight = 0.45 + (0.15 * (1 - np.abs(1 - ratio)))
+        blended = price * (1 - weight) + listed_price_per_sqm * weight
+    return np.where(listed, blended, price)
+
+
+def calculate_confidence(columns: PricingColumns) -> np.ndarray:
+    """
+    Punteggio di confidenza (45-92) in base ai dati disponibili.
+
+    Returns:
+        Punteggio intero per ogni immobile
+    """
+    score = np.full(len(columns.surface), 58, dtype=np.int64)
+    score += np.where(_given(columns.price), 10, 0)
+    score += np.where(_given(columns.rooms), 5, 0)
+    score += np.where(_given(columns.bedrooms), 4, 0)
+    score += np.where(_given(columns.bathrooms), 4, 0)
+    score += np.where(~np.isnan(columns.floor), 3, 0)
+    score += np.where(_given(columns.latitude) & _given(columns.longitude), 4, 0)
+    return np.clip(score, 45, 92)
+
+
+def estimate_spread(confidence: np.ndarray) -> np.ndarray:
+    """
+    Ampiezza relativa dell'intervallo di stima: più confidenza, intervallo più stretto.
+
+    Accetta anche un singolo punteggio (valutazione singola).
+    """
+    return np.maximum(0.08, 0.18 - (confidence - 55) * 0.002)
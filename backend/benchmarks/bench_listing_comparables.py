@@ -0,0 +1,87 @@
+"""
+Micro-benchmark della ricerca dei comparabili sull'indice degli annunci.
+
+Costruisce un ``ListingIndex`` con un milione di annunci sintetici
+concentrati in alcune città e misura il tempo di costruzione e la latenza
+delle ricerche dei comparabili (k = 3), confrontandola con il calcolo delle
+distanze su tutti gli annunci.
+
+Uso:
+    python benchmarks/bench_listing_comparables.py [--count 1000000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.valuation.listings import ListingIndex, haversine_m  # noqa: E402
+
+# Milano, Roma, Napoli, Torino, Bologna, Firenze
+CENTRES = np.array(
+    [(45.464, 9.190), (41.902, 12.496), (40.852, 14.268), (45.070, 7.686), (44.494, 11.343), (43.770, 11.255)]
+)
+
+
+def synthetic_rows(count: int, seed: int = 42) -> list:
+    """Annunci raggruppati attorno ai capoluoghi (deviazione di circa 5 km)."""
+    rng = np.random.default_rng(seed)
+    centres = CENTRES[rng.integers(0, len(CENTRES), count)]
+    latitudes = centres[:, 0] + rng.normal(0, 0.045, count)
+    longitudes = centres[:, 1] + rng.normal(0, 0.06, count)
+    surfaces = rng.uniform(30, 250, count)
+    prices = surfaces * rng.uniform(1500, 7000, count)
+    types = rng.integers(0, 3, count)
+    return list(
+        zip(
+            range(1, count + 1),
+            latitudes.tolist(),
+            longitudes.tolist(),
+            surfaces.tolist(),
+            prices.tolist(),
+            types.tolist(),
+        )
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    rows = synthetic_rows(args.count)
+    start = time.perf_counter()
+    index = ListingIndex(rows)
+    build = time.perf_counter() - start
+
+    rng = np.random.default_rng(7)
+    centres = CENTRES[rng.integers(0, len(CENTRES), args.queries)]
+    points = centres + rng.normal(0, 0.03, (args.queries, 2))
+    surfaces = rng.uniform(40, 200, args.queries)
+
+    latencies = []
+    for (latitude, longitude), surface in zip(points.tolist(), surfaces.tolist()):
+        start = time.perf_counter()
+        index.nearest(latitude, longitude, k=3, surface=surface, property_type=0)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+
+    table = np.array(rows)
+    start = time.perf_counter()
+    for latitude, longitude in points[:20].tolist():
+        np.argpartition(haversine_m(latitude, longitude, table[:, 1], table[:, 2]), 32)
+    full_scan = (time.perf_counter() - start) / 20 * 1000
+
+    print(f"{args.count} annunci, indice costruito in {build * 1000:.0f} ms")
+    print(f"  ricerca k=3: mediana {np.median(latencies_ms):.2f} ms, p99 {np.percentile(latencies_ms, 99):.2f} ms")
+    print(f"  scansione completa: {full_scan:.1f} ms per ricerca")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Micro-benchmark del parsing delle risposte OMI.
+
+Confronta il parser rapido per lo schema {zona: {tipo: {...}}} di 3eurotools
+con il parser generico ricorsivo sulle risposte salvate in
+``omi_response_debug.json`` e ``omi_response_specific.json``. Il parser
+generico non riconosce le zone usate come chiavi, quindi viene misurato sugli
+stessi dati riscritti nella forma annidata che sa interpretare.
+
+Uso:
+    python benchmarks/bench_omi_parser.py
+"""
+
+import json
+import sys
+import timeit
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.omi.client import OMIClient  # noqa: E402
+
+FIXTURES = ("omi_response_debug.json", "omi_response_specific.json")
+
+
+def to_generic_shape(payload: dict) -> dict:
+    """Riscrive lo schema {zona: {tipo: {...}}} in liste annidate con chiavi esplicite."""
+    return {
+        "zones": [
+            {
+                "zona_omi": zone,
+                "categorie": [{"categoria": prop_type, **fields} for prop_type, fields in types.items()],
+            }
+            for zone, types in payload.items()
+        ]
+    }
+
+
+def main(number: int = 200) -> None:
+    client = OMIClient()
+
+    for fixture in FIXTURES:
+        payload = json.loads((BASE_DIR / fixture).read_text(encoding="utf-8"))
+        generic_payload = to_generic_shape(payload)
+
+        fast_quotations, _ = client._collect_quotations(payload, None, None)
+        generic_quotations, _ = client._walk_quotations(generic_payload, None, None)
+        assert fast_quotations == generic_quotations
+
+        fast = timeit.timeit(lambda: client._collect_quotations(payload, None, None), number=number)
+        generic = timeit.timeit(
+            lambda: client._walk_quotations(generic_payload, None, None), number=number
+        )
+
+        print(f"{fixture} ({len(fast_quotations)} quotazioni):")
+        print(f"  parser rapido:   {fast / number * 1000:8.3f} ms")
+        print(f"  parser generico: {generic / number * 1000:8.3f} ms")
+        print(f"  speedup:         {generic / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark del motore di valutazione vettoriale.
+
+Confronta ``_adjust_price_per_sqm`` e ``_calculate_confidence`` (un immobile
+alla volta) con ``app.valuation.pricing`` su colonne NumPy, per 100.000
+immobili sintetici, e verifica che i risultati coincidano.
+
+Uso:
+    python benchmarks/bench_valuation_pricing.py [--count 100000]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.api.valuation import (  # noqa: E402
+    PropertyInput,
+    _adjust_price_per_sqm,
+    _calculate_confidence,
+    _pricing_columns,
+)
+from app.valuation.pricing import adjust_price_per_sqm, calculate_confidence  # noqa: E402
+
+CITIES = ("Milano", "Roma", "Torino", "Lesa", "Comune Sconosciuto")
+
+
+def synthetic_properties(count: int, seed: int = 42) -> list:
+    """Immobili sintetici con circa un quarto dei campi opzionali assenti."""
+    rng = np.random.default_rng(seed)
+    missing = rng.random((6, count)) < 0.25
+    surfaces = rng.uniform(20, 320, count)
+    prices = surfaces * rng.uniform(1200, 6500, count)
+    rooms = rng.integers(1, 8, count)
+    bedrooms = np.minimum(rooms, rng.integers(0, 5, count))
+    bathrooms = rng.integers(1, 4, count)
+    floors = rng.integers(-1, 10, count)
+    cities = rng.integers(0, len(CITIES), count)
+
+    def optional(values, row, position):
+        return None if missing[row, position] else values[position].item()
+
+    return [
+        PropertyInput(
+            address="Via Roma 1",
+            city=CITIES[cities[i]],
+            surface=surfaces[i].item(),
+            price=optional(prices, 0, i),
+            rooms=optional(rooms, 1, i),
+            bedrooms=optional(bedrooms, 2, i),
+            bathrooms=optional(bathrooms, 3, i),
+            floor=optional(floors, 4, i),
+            latitude=None if missing[5, i] else 45.46,
+            longitude=None if missing[5, i] else 9.19,
+        )
+        for i in range(count)
+    ]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    properties = synthetic_properties(args.count)
+
+    start = time.perf_counter()
+    scalar_prices = [_adjust_price_per_sqm(p) for p in properties]
+    scalar_confidence = [_calculate_confidence(p) for p in properties]
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    columns = _pricing_columns(properties)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prices = adjust_price_per_sqm(columns)
+    confidence = calculate_confidence(columns)
+    vectorized = time.perf_counter() - start
+
+    np.testing.assert_allclose(prices, scalar_prices, rtol=1e-12)
+    assert confidence.tolist() == scalar_confidence
+
+    print(f"{args.count} immobili:")
+    print(f"  scalare:             {scalar * 1000:9.1f} ms  ({args.count / scalar:12,.0f} immobili/s)")
+    print(f"  colonne (da modelli):{build * 1000:9.1f} ms")
+    print(f"  vettoriale:          {vectorized * 1000:9.1f} ms  ({args.count / vectorized:12,.0f} immobili/s)")
+    print(f"  speedup (solo calcolo): {scalar / vectorized:6.1f}x")
+    print(f"  speedup (con colonne):  {scalar / (build + vectorized):6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
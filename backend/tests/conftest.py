@@ -0,0 +1,19 @@
+import pytest
+
+
+class FakeClock:
+    """Orologio manuale per cache, circuit breaker e stato condiviso: si avanza con ``now``."""
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock() -> FakeClock:
+    return FakeClock()
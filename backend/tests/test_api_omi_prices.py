@@ -1,8 +1,10 @@
+import json
 import sys
 from pathlib import Path
 
 import httpx
 import pytest
+from bs4 import BeautifulSoup
 from fastapi.testclient import TestClient
 
 import types
@@ -54,15 +56,40 @@ sys.modules.setdefault("webdriver_manager.microsoft", webdriver_manager_microsof
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
+from app.api import scraper as scraper_module
+from app.api import valuation as valuation_module
 from app.main import app
+from app.omi import base_prices as omi_base_prices_module
 from app.omi import client as omi_client_module
+from app.omi import geo as omi_geo_module
+from app.omi import history as omi_history_module
+from app.omi import zone_index as omi_zone_index_module
+from app.omi.importer import import_semester
+from app.omi.offline import OMIOfflineDataset
+from app.valuation import listings as listings_module
 
 
 @pytest.fixture(autouse=True)
-def reset_omi_client():
+def reset_omi_client(monkeypatch, tmp_path):
+    monkeypatch.setenv("OMI_STORE_PATH", str(tmp_path / "omi.sqlite3"))
+    monkeypatch.setenv("OMI_RATE_LIMIT_PER_SECOND", "100")
+    monkeypatch.setenv("OMI_RETRY_BACKOFF", "0")
+    monkeypatch.setenv("OMI_OFFLINE_PATH", str(tmp_path / "offline.sqlite3"))
+    monkeypatch.setenv("OMI_ZONES_PATH", str(tmp_path / "zones.geojson"))
+    monkeypatch.setenv("LISTINGS_STORE_PATH", str(tmp_path / "listings.sqlite3"))
     omi_client_module._omi_client = None
+    omi_history_module._omi_history = None
+    omi_geo_module._zone_index = None
+    omi_zone_index_module._zone_description_index = None
+    omi_base_prices_module._base_price_table = None
+    listings_module._comparables_engine = None
     yield
     omi_client_module._omi_client = None
+    omi_history_module._omi_history = None
+    omi_geo_module._zone_index = None
+    omi_zone_index_module._zone_description_index = None
+    omi_base_prices_module._base_price_table = None
+    listings_module._comparables_engine = None
 
 SAMPLE_API_RESPONSE = {
     "success": True,
@@ -195,3 +222,387 @@ def test_rental_price_endpoint_returns_404_when_no_quotes(monkeypatch):
     assert response.status_code == 404
     detail = response.json()["detail"]
     assert "Quotazioni di affitto non disponibili" in detail
+
+
+def test_batch_query_streams_ndjson_with_one_upstream_call_per_comune(monkeypatch):
+    client = build_client()
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    items = [
+        {"city": "Milano", "metri_quadri": 100, "operazione": "acquisto", "zona_omi": "B1"},
+        {"city": "Milano", "metri_quadri": 50, "operazione": "affitto"},
+        {"city": "Atlantide"},
+        {"city": "Milano", "operazione": "permuta"},
+    ]
+    response = client.post("/api/omi/batch-query", json={"items": items})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+
+    assert len(lines) == len(items)
+    assert calls == ["F205"]
+    assert by_index[0]["status"] == "ok"
+    assert by_index[0]["result"]["quotations"][0]["prezzo_acquisto_medio"] == pytest.approx(280000)
+    assert by_index[1]["result"]["quotations"][0]["prezzo_affitto_max"] == pytest.approx(950)
+    assert by_index[2]["status"] == "error" and by_index[2]["status_code"] == 400
+    assert by_index[3]["status"] == "error" and by_index[3]["status_code"] == 400
+
+
+def test_trend_endpoint_reads_the_local_history(tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    import_semester(dataset, fixtures / "QI_1_20232_VALORI.csv")
+    import_semester(dataset, fixtures / "QI_1_20241_VALORI.csv")
+    dataset.close()
+
+    client = build_client()
+    response = client.get("/api/omi/trend", params={"city": "Milano", "zona_omi": "D20"})
+    assert response.status_code == 200
+    trend = response.json()
+    assert [point["semestre"] for point in trend["series"]] == ["2023-S2", "2024-S1"]
+    assert trend["series"][1]["variazione_pct"] == pytest.approx(3.23)
+    assert trend["variazione_annua_pct"] == pytest.approx(6.56)
+
+    missing = client.get("/api/omi/trend", params={"city": "Milano", "zona_omi": "Z99"})
+    assert missing.status_code == 404
+
+
+def test_cities_search_endpoint_autocompletes_names():
+    client = build_client()
+    response = client.get("/api/omi/cities/search", params={"q": "cant"})
+    assert response.status_code == 200
+    assert response.json()[0] == {"city": "Cantù", "code": "B639"}
+
+    inner = client.get("/api/omi/cities/search", params={"q": "GIOV", "limit": 1}).json()
+    assert inner == [{"city": "Sesto San Giovanni", "code": "I687"}]
+    assert client.get("/api/omi/cities/search", params={"q": "zzz"}).json() == []
+
+
+def test_valuation_resolves_comune_from_postal_code(monkeypatch):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    client = build_client()
+    response = client.post(
+        "/api/valuation/evaluate",
+        json={"address": "Via Tortona 10", "city": "Navigli", "postal_code": "20144", "surface": 80},
+    )
+
+    assert response.status_code == 200
+    assert calls == ["F205"]
+    assert response.json()["omiData"]["comune"] == "Milano"
+    assert response.json()["omiData"]["valoreNormale"] == pytest.approx(2800)
+
+
+def test_batch_valuation_makes_one_omi_lookup_per_group(monkeypatch):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    lookups = []
+    lookup_omi = valuation_module._lookup_omi
+
+    async def counting_lookup(property_data, **kwargs):
+        lookups.append(valuation_module._lookup_key(property_data))
+        return await lookup_omi(property_data, **kwargs)
+
+    monkeypatch.setattr(valuation_module, "_lookup_omi", counting_lookup)
+
+    items = [
+        {"address": "Via Tortona 10", "city": "Milano", "surface": 80},
+        {"address": "Via Padova 3", "city": "milano", "surface": 120, "price": 300000},
+        {"address": "Via Tortona 12", "city": "Navigli", "postal_code": "20144", "surface": 60},
+        {"address": "Corso Como 1", "city": "Milano", "surface": 90, "zona_omi": "b1"},
+        {"address": "Via Roma 1", "city": "Atlantide", "surface": 70},
+    ]
+    response = build_client().post("/api/valuation/evaluate-batch", json={"items": items})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line["result"] for line in lines if line["status"] == "ok"}
+
+    assert sorted(by_index) == list(range(len(items)))
+    assert sorted(lookups, key=str) == sorted(
+        [("atlantide", None, None, False), ("milano", None, None, False), ("milano", None, "B1", False)],
+        key=str,
+    )
+    assert calls == ["F205"]
+    assert by_index[2]["omiData"]["valoreNormale"] == pytest.approx(2800)
+    assert by_index[3]["omiData"]["zona"] == "B1"
+    assert by_index[4]["omiData"]["fonte"] == "Algoritmo proprietario"
+    assert len({result["id"] for result in by_index.values()}) == len(items)
+
+    single = build_client().post("/api/valuation/evaluate", json=items[1]).json()
+    assert single["estimatedValue"] == by_index[1]["estimatedValue"]
+    assert single["estimatedValueMin"] == by_index[1]["estimatedValueMin"]
+    assert single["estimatedValueMax"] == by_index[1]["estimatedValueMax"]
+
+
+def test_batch_valuation_reports_every_item_when_group_lookup_fails(monkeypatch):
+    lookup_omi = valuation_module._lookup_omi
+
+    async def failing_lookup(property_data, **kwargs):
+        if property_data.city.lower() == "milano":
+            raise RuntimeError("lookup non disponibile")
+        return await lookup_omi(property_data, **kwargs)
+
+    monkeypatch.setattr(valuation_module, "_lookup_omi", failing_lookup)
+
+    items = [
+        {"address": "Via Tortona 10", "city": "Milano", "surface": 80},
+        {"address": "Via Roma 1", "city": "Atlantide", "surface": 70},
+        {"address": "Via Padova 3", "city": "milano", "surface": 120},
+    ]
+    response = build_client().post("/api/valuation/evaluate-batch", json={"items": items})
+
+    assert response.status_code == 200
+    lines = {line["index"]: line for line in map(json.loads, response.text.splitlines())}
+    assert sorted(lines) == [0, 1, 2]
+    assert lines[0]["status"] == lines[2]["status"] == "error"
+    assert lines[0]["status_code"] == 500
+    assert lines[1]["status"] == "ok"
+
+
+def test_read_only_endpoints_support_conditional_requests(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+    client = build_client()
+
+    cities = client.get("/api/omi/cities")
+    assert cities.status_code == 200
+    assert cities.headers["cache-control"].startswith("public, max-age=")
+    assert {"city": "Milano", "code": "F205"} in cities.json()
+    revalidated = client.get("/api/omi/cities", headers={"If-None-Match": cities.headers["etag"]})
+    assert revalidated.status_code == 304 and revalidated.content == b""
+
+    types = client.get("/api/omi/property-types")
+    assert client.get(
+        "/api/omi/property-types", headers={"If-None-Match": f'W/{types.headers["etag"]}'}
+    ).status_code == 304
+
+    params = {"city": "Milano", "metri_quadri": 100, "tipo_immobile": "appartamento"}
+    prices = client.get("/api/omi/purchase-price", params=params)
+    assert prices.status_code == 200
+    etag = prices.headers["etag"]
+    assert client.get(
+        "/api/omi/purchase-price", params=params, headers={"If-None-Match": etag}
+    ).status_code == 304
+    rental = client.get("/api/omi/rental-price", params=params, headers={"If-None-Match": etag})
+    assert rental.status_code == 200 and rental.headers["etag"] != etag
+    assert calls == ["F205"]
+
+    monkeypatch.chdir(tmp_path)
+    analysis_dir = tmp_path / "storage" / "analysis"
+    analysis_dir.mkdir(parents=True)
+    (analysis_dir / "listing-1.json").write_text(
+        json.dumps({"label": "buono", "score": 0.8, "confidence": 0.9, "reasoning": "Finiture curate"}), encoding="utf-8"
+    )
+    saved = client.get("/api/analysis/get-analysis/listing-1")
+    assert saved.status_code == 200, saved.text
+    assert saved.headers["cache-control"] == "private, no-cache"
+    assert client.get(
+        "/api/analysis/get-analysis/listing-1", headers={"If-None-Match": saved.headers["etag"]}
+    ).status_code == 304
+    assert client.get("/api/analysis/get-analysis/missing").status_code == 404
+
+
+def test_valuation_resolves_zone_from_coordinates(monkeypatch, tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    zones = omi_geo_module.read_kml(fixtures / "zone_F205.kml", codice_comune="F205")
+    omi_geo_module.write_geojson(zones, tmp_path / "zones.geojson")
+
+    two_zones = json.loads(json.dumps(SAMPLE_API_RESPONSE))
+    periphery = json.loads(json.dumps(two_zones["data"]["zones"][0]))
+    periphery["zona_omi"] = "D20"
+    periphery["categorie"][0]["prezzo"]["acquisto"] = {"minimo": 1800, "massimo": 2200, "mediano": 2000}
+    two_zones["data"]["zones"].append(periphery)
+
+    async def fake_get(self, url, params=None, **kwargs):
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=two_zones)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    client = build_client()
+    response = client.post(
+        "/api/valuation/evaluate",
+        json={"address": "Via Padova 200", "city": "Milano", "surface": 80, "latitude": 45.50, "longitude": 9.25},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["omiData"]["zona"] == "D20"
+    assert response.json()["omiData"]["valoreNormale"] == pytest.approx(2000)
+
+    suggestion = client.get(
+        "/api/omi/suggest",
+        params={"address": "Piazza del Duomo", "city": "Milano", "latitude": 45.50, "longitude": 9.25},
+    )
+    assert suggestion.json()["suggested_zone"] == "D20"
+
+
+
+def test_valuation_ignores_located_zone_without_quotations(monkeypatch, tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    zones = omi_geo_module.read_kml(fixtures / "zone_F205.kml", codice_comune="F205")
+    omi_geo_module.write_geojson(zones, tmp_path / "zones.geojson")
+
+    async def fake_get(self, url, params=None, **kwargs):
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    # Le coordinate cadono in D20, assente dalle quotazioni del comune
+    response = build_client().post(
+        "/api/valuation/evaluate",
+        json={"address": "Via Padova 200", "city": "Milano", "surface": 80, "latitude": 45.50, "longitude": 9.25},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["omiData"]["zona"] == "B1"
+    assert response.json()["omiData"]["valoreNormale"] == pytest.approx(2800)
+
+
+def test_batch_keeps_given_and_located_zones_in_separate_groups(monkeypatch, tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    zones = omi_geo_module.read_kml(fixtures / "zone_F205.kml", codice_comune="F205")
+    omi_geo_module.write_geojson(zones, tmp_path / "zones.geojson")
+
+    async def fake_get(self, url, params=None, **kwargs):
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    # Entrambi in D20, non quotata: solo quella individuata ripiega sul comune
+    items = [
+        {"address": "Via Padova 200", "city": "Milano", "surface": 80, "zona_omi": "D20"},
+        {"address": "Via Padova 202", "city": "Milano", "surface": 80, "latitude": 45.50, "longitude": 9.25},
+    ]
+    response = build_client().post("/api/valuation/evaluate-batch", json={"items": items})
+
+    results = {line["index"]: line["result"] for line in map(json.loads, response.text.splitlines())}
+    assert results[0]["omiData"]["fonte"] == "Algoritmo proprietario"
+    assert results[1]["omiData"]["zona"] == "B1"
+
+def test_suggest_ranks_zones_from_imported_descriptions(tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    import_semester(dataset, fixtures / "QI_1_20241_VALORI.csv", fixtures / "QI_1_20241_ZONE.csv")
+    dataset.close()
+
+    response = build_client().get(
+        "/api/omi/suggest", params={"address": "Corso Garibaldi 3", "city": "Milano"}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["suggested_zone"] == "B12"
+    assert body["confidence"] == "high"
+    assert body["zone_matches"][0]["zona"] == "B12"
+
+
+def test_base_prices_come_from_imported_omi_medians(tmp_path):
+    fixtures = Path(__file__).resolve().parent / "fixtures" / "omi"
+    assert valuation_module._city_base_price("Milano", None) == 4700
+
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    import_semester(dataset, fixtures / "QI_1_20241_VALORI.csv")
+    dataset.close()
+    omi_base_prices_module.get_base_price_table().reload()
+
+    assert valuation_module._city_base_price("Milano", None) == pytest.approx(5100)
+    assert valuation_module._city_base_price("Cinisello", "MI") == pytest.approx(5100)
+    # Comuni e province senza quotazioni archiviate: valori di riserva
+    assert valuation_module._city_base_price("Lesa", "NO") == 2800
+    assert valuation_module._city_base_price("Cinisello", "VB") == 2100
+    assert build_client().get("/api/valuation/health").json()["base_prices"].startswith("2024-S1#1@")
+
+
+def test_valuation_returns_nearest_scraped_listings_as_comparables(monkeypatch):
+    async def fake_get(self, url, params=None, **kwargs):
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    engine = listings_module.get_comparables_engine()
+    listings = [
+        ("vendita/1", "Via Vicina 1", 45.4645, 9.1905, 80, 320000),
+        ("vendita/2", "Via Vicina 2", 45.4660, 9.1890, 85, 330000),
+        ("vendita/3", "Via Lontana 3", 45.4900, 9.2300, 80, 280000),
+        ("affitto/4", "Via Vicina 4", 45.4643, 9.1902, 80, 1500),
+        ("vendita/5", "Via Senza Coordinate", None, None, 80, 300000),
+        ("vendita/7", "Via Vicina 7", 45.4644, 9.1903, 80, 1200),
+    ]
+    for path, address, latitude, longitude, surface, price in listings:
+        engine.save(
+            {
+                "url": f"https://www.immobiliare.it/{path}",
+                "address": address,
+                "latitude": latitude,
+                "longitude": longitude,
+                "surface": surface,
+                "price": price,
+                "propertyType": "appartamento",
+                "contractType": path.split("/")[0],
+            }
+        )
+
+    # Affitto su Idealista: l'URL non indica il contratto, lo dice la pagina
+    rental_page = BeautifulSoup(
+        "<html><head><title>Bilocale in affitto in Via Vicina 6, Milano</title></head><body>"
+        '<h1 class="main-info__title-main">Bilocale in affitto in Via Vicina 6</h1>'
+        '<span class="info-data-price">1.400 €/mese</span>'
+        '<div class="info-features"><span>80 m²</span></div>'
+        "</body></html>",
+        "html.parser",
+    )
+    rental = scraper_module.parse_idealista(rental_page, "https://www.idealista.it/immobile/12345678/")
+    assert rental.contractType == "affitto"
+    rental.latitude, rental.longitude = 45.4644, 9.1901
+    scraper_module.record_listing(rental)
+
+    client = build_client()
+    response = client.post(
+        "/api/valuation/evaluate",
+        json={"address": "Via Dante 1", "city": "Milano", "surface": 80, "latitude": 45.4642, "longitude": 9.19},
+    )
+
+    assert response.status_code == 200
+    comparables = response.json()["comparables"]
+    # Oltre 3 km, affitti, prezzi al mq implausibili e annunci senza coordinate sono esclusi
+    assert [c["address"] for c in comparables] == ["Via Vicina 1", "Via Vicina 2"]
+    assert comparables[0]["distance"] < 100
+    assert comparables[0]["priceM2"] == 4000
+
+    # Senza coordinate restano i comparabili indicativi
+    response = client.post("/api/valuation/evaluate", json={"address": "Via Dante 1", "city": "Milano", "surface": 80})
+    assert response.json()["comparables"][0]["id"] == "comp_1"
@@ -0,0 +1,104 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi import cadastral_codes
+from app.omi.cadastral_codes import (
+    CADASTRAL_CODES,
+    ComuniIndex,
+    get_all_cities,
+    get_cadastral_code,
+    read_istat_file,
+    search_cities,
+    search_city_by_code,
+    write_comuni_file,
+)
+
+ISTAT_SAMPLE = (
+    "Codice Regione;Codice Comune formato alfanumerico;Denominazione (Italiana e straniera);"
+    "Denominazione in italiano;Denominazione altra lingua;Sigla automobilistica;"
+    "Codice Catastale del comune\n"
+    "03;015146;Milano;Milano;;MI;F205\n"
+    "04;021008;Bolzano/Bozen;Bolzano;Bozen;BZ;A952\n"
+    "13;066049;L'Aquila;L'Aquila;;AQ;A345\n"
+)
+
+
+def test_forward_and_reverse_lookups():
+    assert get_cadastral_code("  MILANO ") == "F205"
+    assert get_cadastral_code("sesto  san giovanni") == "I687"
+    assert get_cadastral_code("città_inesistente") is None
+    assert search_city_by_code(" h501") == "Roma"
+    assert search_city_by_code("Z999") is None
+
+    assert CADASTRAL_CODES["torino"] == "L219"
+    assert "roma" in CADASTRAL_CODES
+    assert len(get_all_cities()) == len(CADASTRAL_CODES)
+
+
+def test_istat_file_is_converted_to_bundled_format(tmp_path, monkeypatch):
+    source = tmp_path / "Elenco-comuni-italiani.csv"
+    source.write_bytes(ISTAT_SAMPLE.encode("cp1252"))
+    output = tmp_path / "comuni.csv"
+
+    rows = read_istat_file(source)
+    assert ("A952", "Bozen", "BZ", "021008") in rows
+    assert write_comuni_file(rows, output, aliases={"laquila": "A345", "atlantide": "Z000"}) == 3
+
+    index = ComuniIndex.from_text(output.read_text(encoding="utf-8"))
+    assert index.by_name["bozen"] == index.by_name["bolzano"] == "A952"
+    assert index.by_name["laquila"] == "A345"
+    assert "atlantide" not in index.by_name
+    assert index.by_code["A952"] == "Bolzano"
+    assert index.provinces["F205"] == "MI"
+
+    monkeypatch.setattr(cadastral_codes, "DATA_PATH", output)
+    monkeypatch.setattr(cadastral_codes, "_index", None)
+    monkeypatch.setattr(cadastral_codes, "_search_index", None)
+    assert search_city_by_code("A345") == "L'Aquila"
+    assert cadastral_codes.get_city_province("A952") == "BZ"
+    assert get_cadastral_code("roma") is None
+
+
+@pytest.mark.parametrize(
+    "name, code",
+    [
+        ("Cantu", "B639"),
+        ("Sesto S. Giovanni", "I687"),
+        ("S. Donato Milanese", "H827"),
+        ("L'Aquila", "A345"),
+        ("Reggio nell'Emilia", "H223"),
+        ("Torinoo", "L219"),
+    ],
+)
+def test_tolerant_resolution(name, code):
+    assert get_cadastral_code(name) == code
+
+
+def test_tolerant_resolution_rejects_unrelated_names():
+    assert get_cadastral_code("Milano Marittima") is None
+    assert get_cadastral_code("Torinoo", fuzzy=False) is None
+    # Un comune assente non viene confuso con uno che ne condivide il suffisso
+    assert get_cadastral_code("Agrate Brianza") is None
+    assert get_cadastral_code("Agrate") is None
+    assert search_cities("sesto")[0] == ("Sesto Calende", "I688")
+
+
+def test_repeated_code_for_another_comune_is_rejected():
+    with pytest.raises(ValueError, match="F704"):
+        ComuniIndex.from_text(
+            "codice;denominazione;sigla_provincia;codice_istat\n"
+            "F704;Monza;MB;\nI688;Sesto Calende;VA;\nF704;Monvalle;VA;\n"
+        )
+
+
+def test_bundled_table_has_distinct_codes_and_provinces():
+    assert search_cities("monv") == [("Monvalle", "F703")]
+    assert search_cities("mandello") == [("Mandello Del Lario", "E879")]
+    assert search_city_by_code("E884") == "Manerbio"
+    assert cadastral_codes.get_city_province("B729") == "MB"
+    comuni = cadastral_codes._comuni()
+    assert all(comuni.provinces.get(code) for code in comuni.by_code)
@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.base_prices import BasePriceTable
+from app.omi.importer import import_semester
+from app.omi.offline import OMIOfflineDataset
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "omi"
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    yield dataset
+    dataset.close()
+
+
+def test_prices_are_zone_medians_per_comune_and_province(dataset):
+    import_semester(dataset, FIXTURES / "QI_1_20241_VALORI.csv")
+    snapshot = BasePriceTable(dataset).snapshot()
+
+    # Milano: B12 (stato prevalente 5800-8200) e D20 (2800-3600)
+    assert snapshot.semestre == "2024-S1"
+    assert dict(snapshot.comuni) == {"F205": 5100.0, "L219": 3700.0}
+    assert dict(snapshot.province) == {"MI": 5100.0, "TO": 3700.0}
+
+
+def test_table_reloads_when_a_new_semester_is_imported(dataset):
+    table = BasePriceTable(dataset, check_interval=0)
+    empty = table.snapshot()
+    assert len(empty) == 0 and empty.semestre is None
+    assert table.comune_price("Milano") is None
+
+    import_semester(dataset, FIXTURES / "QI_1_20232_VALORI.csv")
+    older = table.snapshot()
+    assert older.semestre == "2023-S2"
+    assert table.comune_price("Milano") == 4800.0
+
+    import_semester(dataset, FIXTURES / "QI_1_20241_VALORI.csv")
+    assert table.comune_price("milano") == 5100.0
+    assert table.province_price("Comune Ignoto", "mi") == 5100.0
+    assert table.snapshot().version != older.version
+    # L'istantanea precedente resta valida per chi la sta usando
+    assert older.comuni["F205"] == 4800.0
+
+
+def test_version_is_checked_at_most_once_per_interval(dataset):
+    table = BasePriceTable(dataset, check_interval=3600)
+    assert table.snapshot().semestre is None
+
+    import_semester(dataset, FIXTURES / "QI_1_20241_VALORI.csv")
+    assert table.snapshot().semestre is None
+    assert table.reload().semestre == "2024-S1"
@@ -0,0 +1,60 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.client import OMICache, OMIResponse
+
+
+def make_response(code: str = "F205") -> OMIResponse:
+    return OMIResponse(codice_comune=code, comune="Milano", metri_quadri=1.0)
+
+
+def test_cache_expires_entries_with_monotonic_clock(fake_clock):
+    cache = OMICache(ttl_seconds=10, clock=fake_clock)
+    cache.set("a", make_response())
+
+    assert cache.get("a") is not None
+    fake_clock.advance(11)
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+    assert stats["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used_entry():
+    cache = OMICache(ttl_seconds=60, max_entries=2)
+    cache.set("a", make_response("A"))
+    cache.set("b", make_response("B"))
+    cache.get("a")
+    cache.set("c", make_response("C"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_respects_byte_budget():
+    cache = OMICache(ttl_seconds=60, max_entries=100, max_bytes=250, sizeof=lambda _: 100)
+    for key in ("a", "b", "c"):
+        cache.set(key, make_response())
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 200
+    assert "a" not in cache
+
+
+def test_sweep_removes_expired_entries_without_lookups(fake_clock):
+    cache = OMICache(ttl_seconds=5, clock=fake_clock)
+    cache.set("a", make_response())
+    cache.set("b", make_response(), ttl_seconds=60)
+    fake_clock.advance(10)
+
+    assert cache.sweep() == 1
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 1
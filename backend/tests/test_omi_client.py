@@ -0,0 +1,325 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.client import (
+    OMICircuitOpenError,
+    OMIClient,
+    OMINoQuotationsError,
+    OMIServiceError,
+)
+from app.omi.property_types import PropertyType
+from app.omi.warmer import OMICacheWarmer
+
+SAMPLE_API_RESPONSE = {
+    "success": True,
+    "data": {
+        "zones": [
+            {
+                "zona_omi": "B1",
+                "categorie": [
+                    {
+                        "categoria": "Abitazioni civili",
+                        "prezzo": {
+                            "acquisto": {"minimo": 2400, "massimo": 3200, "mediano": 2800},
+                            "affitto": {"minimo": 14.0, "massimo": 19.0, "mediano": 16.5},
+                        },
+                    }
+                ],
+            }
+        ],
+    },
+}
+
+
+def patch_upstream(monkeypatch, handler):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(dict(params or {}))
+        return await handler(httpx.Request("GET", url, params=params))
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+    return calls
+
+
+def test_concurrent_identical_queries_share_one_upstream_call(monkeypatch):
+    async def slow_ok(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    calls = patch_upstream(monkeypatch, slow_ok)
+
+    async def scenario():
+        async with OMIClient() as client:
+            results = await asyncio.gather(*(client.query("Milano") for _ in range(5)))
+            assert not client._inflight
+            return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
+
+
+def test_single_flight_failure_reaches_every_waiter(monkeypatch):
+    async def failing(request):
+        await asyncio.sleep(0.05)
+        response = httpx.Response(500, request=request, json={"error": "boom"})
+        raise httpx.HTTPStatusError("error", request=request, response=response)
+
+    calls = patch_upstream(monkeypatch, failing)
+
+    async def scenario():
+        async with OMIClient(retry_attempts=1) as client:
+            results = await asyncio.gather(
+                *(client.query("Milano") for _ in range(3)), return_exceptions=True
+            )
+            assert not client._inflight
+            return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(result, OMIServiceError) for result in results)
+
+
+def test_cancelled_waiters_do_not_leak_inflight_calls(monkeypatch):
+    started = []
+
+    async def hanging(request):
+        started.append(request)
+        await asyncio.sleep(10)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    patch_upstream(monkeypatch, hanging)
+
+    async def scenario():
+        async with OMIClient() as client:
+            first = asyncio.create_task(client.query("Milano"))
+            second = asyncio.create_task(client.query("Milano"))
+            await asyncio.sleep(0.01)
+            flight = client._inflight[next(iter(client._inflight))]
+
+            first.cancel()
+            await asyncio.sleep(0)
+            assert not flight.task.cancelled()
+
+            second.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await second
+            await asyncio.sleep(0)
+            assert flight.task.cancelled()
+            assert not client._inflight
+
+    asyncio.run(scenario())
+    assert len(started) == 1
+
+
+SUPERSET_API_RESPONSE = {
+    "success": True,
+    "data": {
+        "zones": [
+            {
+                "zona_omi": "B1",
+                "categorie": [
+                    {
+                        "categoria": "Abitazioni civili",
+                        "prezzo": {
+                            "acquisto": {"minimo": 2400, "massimo": 3200, "mediano": 2800},
+                            "affitto": {"minimo": 14.0, "massimo": 19.0, "mediano": 16.5},
+                        },
+                    },
+                    {
+                        "categoria": "Box",
+                        "prezzo": {"acquisto": {"minimo": 1500, "massimo": 1900, "mediano": 1700}},
+                    },
+                ],
+            },
+            {
+                "zona_omi": "C2",
+                "categorie": [
+                    {
+                        "categoria": "Abitazioni civili",
+                        "prezzo": {
+                            "acquisto": {"minimo": 1800, "massimo": 2400, "mediano": 2100},
+                            "affitto": {"minimo": 10.0, "massimo": 13.0, "mediano": 11.5},
+                        },
+                    }
+                ],
+            },
+        ],
+    },
+}
+
+
+def test_variants_are_answered_from_one_superset_call(monkeypatch):
+    async def ok(request):
+        return httpx.Response(200, request=request, json=SUPERSET_API_RESPONSE)
+
+    calls = patch_upstream(monkeypatch, ok)
+
+    async def scenario():
+        async with OMIClient() as client:
+            purchase = await client.get_purchase_price(
+                "Milano", 100, PropertyType.ABITAZIONI_CIVILI, "C2"
+            )
+            rental = await client.get_rental_price("Milano", 80, PropertyType.ABITAZIONI_CIVILI, "B1")
+            box = await client.query(
+                "Milano", metri_quadri=20, operazione="affitto", tipo_immobile=PropertyType.BOX
+            )
+            zone = await client.query("Milano", zona_omi="B1", operazione="acquisto")
+            return purchase, rental, box, zone
+
+    purchase, rental, box, zone = asyncio.run(scenario())
+
+    assert calls == [{"codice_comune": "F205", "metri_quadri": 1.0}]
+    assert purchase["medio_mq"] == pytest.approx(2100)
+    assert purchase["medio"] == pytest.approx(210000)
+    assert rental["max"] == pytest.approx(19.0 * 80)
+    assert box.quotations == []
+    assert {q.property_type for q in zone.quotations} == {"abitazioni_civili", "box"}
+    assert all(q.prezzo_affitto_medio is None for q in zone.quotations)
+    assert zone.zone_count == 2
+
+
+def test_stale_entry_is_served_while_refreshing_in_background(monkeypatch):
+    async def ok(request):
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    calls = patch_upstream(monkeypatch, ok)
+
+    async def scenario():
+        async with OMIClient(cache_ttl=0, cache_stale_ttl=60, rate_limit_per_second=100) as client:
+            first = await client.query("Milano")
+            second = await client.query("Milano")
+            assert second == first
+            await asyncio.gather(*client._background_tasks)
+            return client.cache_stats()
+
+    stats = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert stats["stale_hits"] == 1
+
+
+def test_warmer_prefetches_configured_and_most_queried_comuni(monkeypatch):
+    async def ok(request):
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    calls = patch_upstream(monkeypatch, ok)
+
+    async def scenario():
+        async with OMIClient(rate_limit_per_second=100) as client:
+            await client.query("Torino")
+            warmer = OMICacheWarmer(client, cities=["Milano", "Atlantide"], top_n=5)
+            assert warmer.targets() == ["milano", "torino"]
+            first = await warmer.run_once()
+            second = await warmer.run_once()
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first, second) == (1, 0)
+    assert [call["codice_comune"] for call in calls] == ["L219", "F205"]
+
+
+def test_last_good_response_is_served_stale_when_upstream_fails(monkeypatch):
+    responses = [httpx.Response(200, json=SAMPLE_API_RESPONSE)]
+
+    async def flaky(request):
+        if responses:
+            response = responses.pop()
+            response.request = request
+            return response
+        failure = httpx.Response(503, request=request, json={"error": "down"})
+        raise httpx.HTTPStatusError("error", request=request, response=failure)
+
+    patch_upstream(monkeypatch, flaky)
+
+    async def scenario():
+        async with OMIClient(
+            cache_ttl=0, cache_stale_ttl=0, rate_limit_per_second=100, retry_backoff=0
+        ) as client:
+            fresh = await client.query("Milano")
+            stale = await client.query("Milano", zona_omi="B1")
+            return fresh, stale
+
+    fresh, stale = asyncio.run(scenario())
+    assert not fresh.stale
+    assert stale.stale
+    assert stale.quotations[0].prezzo_acquisto_medio == pytest.approx(2800)
+
+
+def test_empty_results_and_client_errors_are_cached_briefly(monkeypatch):
+    async def respond(request):
+        if request.url.params["codice_comune"] == "F205":
+            return httpx.Response(200, request=request, json={"success": True, "data": {"zones": []}})
+        failure = httpx.Response(404, request=request, json={"detail": "Nessuna quotazione"})
+        raise httpx.HTTPStatusError("error", request=request, response=failure)
+
+    calls = patch_upstream(monkeypatch, respond)
+
+    async def scenario():
+        async with OMIClient(rate_limit_per_second=100) as client:
+            for _ in range(2):
+                with pytest.raises(OMINoQuotationsError):
+                    await client.get_purchase_price("Milano", 50)
+                with pytest.raises(OMIServiceError, match="Nessuna quotazione"):
+                    await client.query("Torino")
+            return client.cache_stats()
+
+    stats = asyncio.run(scenario())
+    assert [call["codice_comune"] for call in calls] == ["F205", "L219"]
+    assert stats["negative_entries"] == 1
+
+
+def test_transient_errors_are_retried_with_backoff(monkeypatch):
+    attempts = []
+
+    async def recovering(request):
+        attempts.append(request)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    patch_upstream(monkeypatch, recovering)
+
+    async def scenario():
+        async with OMIClient(rate_limit_per_second=100, retry_backoff=0) as client:
+            response = await client.query("Milano")
+            return response, client.circuit_stats()
+
+    response, circuit = asyncio.run(scenario())
+    assert len(attempts) == 3
+    assert response.quotations[0].zona_omi == "B1"
+    assert circuit["state"] == "closed"
+    assert circuit["consecutive_failures"] == 0
+
+
+def test_open_circuit_fails_fast_without_calling_upstream(monkeypatch):
+    async def down(request):
+        failure = httpx.Response(503, request=request, json={"error": "down"})
+        raise httpx.HTTPStatusError("error", request=request, response=failure)
+
+    calls = patch_upstream(monkeypatch, down)
+
+    async def scenario():
+        async with OMIClient(
+            rate_limit_per_second=100,
+            retry_attempts=2,
+            retry_backoff=0,
+            circuit_failure_threshold=2,
+        ) as client:
+            with pytest.raises(OMIServiceError):
+                await client.query("Milano")
+            assert client.circuit_open
+            with pytest.raises(OMICircuitOpenError):
+                await client.query("Torino")
+            return client.circuit_stats()
+
+    circuit = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert circuit["state"] == "open"
+    assert circuit["rejected"] == 1
@@ -0,0 +1,51 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.geo import OMIZoneIndex, ZonePolygon, main, read_geojson, read_kml, write_geojson
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "omi"
+
+
+def test_kml_zones_are_located_with_holes_excluded():
+    zones = read_kml(FIXTURES / "zone_F205.kml", codice_comune="F205")
+    assert [(zone.codice_comune, zone.zona) for zone in zones] == [("F205", "B1"), ("F205", "D20")]
+
+    index = OMIZoneIndex(zones)
+    assert index.locate(45.465, 9.19) == ("F205", "B1")
+    assert index.locate(45.50, 9.25) == ("F205", "D20")
+    assert index.locate(45.465, 9.19, codice_comune="L219") is None
+    assert index.locate(45.0, 9.0) is None
+
+
+def test_import_cli_merges_zones_by_comune(tmp_path):
+    output = tmp_path / "zones.geojson"
+    torino = ZonePolygon("L219", "C1", [[([7.6, 7.7, 7.7, 7.6], [45.0, 45.0, 45.1, 45.1])]])
+    write_geojson([torino], output)
+    arguments = [str(FIXTURES / "zone_F205.kml"), "--comune", "F205", "--output", str(output)]
+    assert main(arguments) == 0
+    assert main(arguments) == 0
+
+    index = OMIZoneIndex(read_geojson(output))
+    assert index.comuni() == ["F205", "L219"]
+    assert len(index) == 3
+    assert index.locate(45.05, 7.65) == ("L219", "C1")
+    assert index.locate(45.465, 9.19) == ("F205", "B1")
+
+
+def test_zone_code_is_extracted_from_descriptive_names(tmp_path):
+    square = [[[9.0, 45.0], [9.1, 45.0], [9.1, 45.1], [9.0, 45.1], [9.0, 45.0]]]
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"codice_comune": "F205", "zona": name},
+            "geometry": {"type": "Polygon", "coordinates": square},
+        }
+        for name in ("Zona B12 - Centro storico", "Zona OMI d20", "R1")
+    ]
+    path = tmp_path / "zones.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}), encoding="utf-8")
+
+    assert [zone.zona for zone in read_geojson(path)] == ["B12", "D20", "R1"]
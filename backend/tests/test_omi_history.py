@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.omi.history import OMIPriceHistory, growth_rates
+from app.omi.importer import import_semester
+from app.omi.offline import OMIOfflineDataset
+
+FIXTURES = BASE_DIR / "tests" / "fixtures" / "omi"
+
+
+def test_series_span_imported_semesters_and_follow_new_imports(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    import_semester(dataset, FIXTURES / "QI_1_20241_VALORI.csv")
+    history = OMIPriceHistory(dataset)
+
+    assert len(history.series("F205", "b12", "abitazioni_civili")) == 1
+
+    import_semester(dataset, FIXTURES / "QI_1_20232_VALORI.csv")
+    series = history.series("F205", "B12", "abitazioni_civili")
+    assert series.semesters == ["2023-S2", "2024-S1"]
+    # Per ogni semestre si usa lo stato di conservazione prevalente
+    assert [p["medio"] for p in series.points()] == [6500, 7000]
+    assert series.points("affitto")[0] == {"semestre": "2023-S2", "min": 20, "max": 28, "medio": 24}
+    assert history.series("F205", "D20", "box") is None
+    assert history.zones("F205") == ["B12", "D20"]
+    dataset.close()
+
+
+def test_growth_rates_are_semester_over_semester_and_annualised():
+    points = [
+        {"semestre": "2022-S1", "medio": 100.0},
+        {"semestre": "2022-S2", "medio": 110.0},
+        {"semestre": "2023-S1", "medio": 121.0},
+    ]
+    growth = growth_rates(points)
+    assert growth["variazioni"] == [None, 10.0, 10.0]
+    assert growth["variazione_totale_pct"] == pytest.approx(21.0)
+    assert growth["variazione_annua_pct"] == pytest.approx(21.0)
@@ -0,0 +1,106 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.omi.client import OMIClient, OMINoQuotationsError
+from app.omi.importer import detect_semester, import_semester, main, parse_decimal
+from app.omi.offline import OMIOfflineDataset
+from app.omi.property_types import PropertyType
+
+FIXTURES = BASE_DIR / "tests" / "fixtures" / "omi"
+VALORI = FIXTURES / "QI_1_20241_VALORI.csv"
+ZONE = FIXTURES / "QI_1_20241_ZONE.csv"
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    import_semester(dataset, VALORI, ZONE)
+    yield dataset
+    dataset.close()
+
+
+def test_parsing_helpers_handle_official_formats():
+    assert parse_decimal("21,5") == pytest.approx(21.5)
+    assert parse_decimal("1.250,50") == pytest.approx(1250.5)
+    assert parse_decimal("5800") == pytest.approx(5800)
+    assert parse_decimal("") is None
+    assert detect_semester("QI_1_20242_VALORI.csv") == "2024-S2"
+    assert detect_semester("valori.csv", "Quotazioni OMI - Anno 2023 - Semestre 2") == "2023-S2"
+    assert detect_semester("valori.csv", "1° semestre 2022") == "2022-S1"
+
+
+def test_import_builds_indexed_tables_per_comune(dataset):
+    assert dataset.semesters() == ["2024-S1"]
+
+    milano = dataset.load_comune("F205")
+    assert milano.comune == "Milano"
+    assert milano.zone_count == 2
+    # Lo stato prevalente precede gli altri per la stessa zona e tipo
+    civili = milano.get("B12", "abitazioni_civili")
+    assert civili.stato_conservazione == "ottimo"
+    assert civili.acquisto == (5800, 8200, 7000)
+    assert civili.affitto == (pytest.approx(21.5), pytest.approx(30.8), pytest.approx(26.15))
+    assert milano.get("D20", "negozi").affitto == (None, None, None)
+
+    zones = dataset.zones("F205")
+    assert zones["B12"]["descrizione"] == "BRERA, VIA SOLFERINO, CORSO GARIBALDI"
+    assert zones["D20"]["link_zona"] == "MI00000456"
+
+
+def test_reimport_replaces_the_semester(dataset):
+    summary = import_semester(dataset, VALORI, semestre="2024-S1")
+    assert summary == {"semestre": "2024-S1", "valori": 6, "zone": 0, "comuni": 2}
+    assert len(dataset.load_comune("F205")) == 5
+
+
+
+def test_latest_semester_follows_imports_from_other_instances(dataset):
+    assert dataset.latest_semester() == "2024-S1"
+    other = OMIOfflineDataset(dataset.path)
+    import_semester(other, VALORI, semestre="2024-S2")
+    other.close()
+    assert dataset.latest_semester() == "2024-S2"
+
+def test_offline_client_answers_without_network(monkeypatch, dataset):
+    async def no_network(self, url, params=None, **kwargs):
+        raise AssertionError("chiamata di rete inattesa")
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", no_network)
+
+    async def scenario():
+        async with OMIClient(offline_dataset=dataset) as client:
+            purchase = await client.get_purchase_price(
+                "Milano", 100, PropertyType.ABITAZIONI_CIVILI, "D20"
+            )
+            rental = await client.get_rental_price("Torino", 50, PropertyType.ABITAZIONI_CIVILI)
+            response = await client.query("Milano", zona_omi="B12", operazione="affitto")
+            with pytest.raises(OMINoQuotationsError):
+                await client.get_rental_price("Milano", 80, PropertyType.NEGOZI, "D20")
+            with pytest.raises(OMINoQuotationsError):
+                await client.get_purchase_price("Roma", 80)
+            return purchase, rental, response
+
+    purchase, rental, response = asyncio.run(scenario())
+    assert purchase["medio_mq"] == pytest.approx(3200)
+    assert purchase["medio"] == pytest.approx(320000)
+    assert rental["max"] == pytest.approx(14.5 * 50)
+    assert [(q.property_type, q.stato_conservazione) for q in response.quotations] == [
+        ("abitazioni_civili", "ottimo"),
+        ("abitazioni_civili", "normale"),
+        ("box", "normale"),
+    ]
+    assert response.semestre == "2024-S1"
+
+
+def test_command_line_import(tmp_path, capsys):
+    db = tmp_path / "cli.sqlite3"
+    assert main([str(VALORI), "--zone", str(ZONE), "--db", str(db)]) == 0
+    assert "2024-S1" in capsys.readouterr().out
+    assert OMIOfflineDataset(db).latest_semester() == "2024-S1"
@@ -0,0 +1,64 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BASE_DIR))
+
+from app.omi.client import OMIClient
+from app.omi.property_types import PropertyType
+
+
+def load_fixture(name: str) -> dict:
+    return json.loads((BASE_DIR / name).read_text(encoding="utf-8"))
+
+
+def as_nested_lists(payload: dict) -> dict:
+    return {
+        "zones": [
+            {
+                "zona_omi": zone,
+                "categorie": [{"categoria": prop_type, **fields} for prop_type, fields in types.items()],
+            }
+            for zone, types in payload.items()
+        ]
+    }
+
+
+@pytest.mark.parametrize("fixture", ["omi_response_debug.json", "omi_response_specific.json"])
+def test_fast_path_matches_generic_walker(fixture):
+    client = OMIClient()
+    payload = load_fixture(fixture)
+
+    fast, fast_zones = client._collect_quotations(payload, None, None)
+    generic, generic_zones = client._walk_quotations(as_nested_lists(payload), None, None)
+
+    assert fast
+    assert fast == generic
+    assert fast_zones == generic_zones
+
+
+def test_fast_path_applies_filters_and_counts_all_zones():
+    client = OMIClient()
+    payload = load_fixture("omi_response_debug.json")
+
+    response = client._parse_api_response(
+        payload, "F205", "Milano", 1.0, "B12", PropertyType.ABITAZIONI_SIGNORILI
+    )
+
+    assert len(response.quotations) == 1
+    assert response.quotations[0].prezzo_acquisto_medio == pytest.approx(1475000.0)
+    assert response.quotations[0].stato_conservazione == "ottimo"
+    assert response.zone_count == len(payload)
+
+
+def test_unknown_shapes_fall_back_to_generic_walker():
+    client = OMIClient()
+    payload = {"zones": [{"zona_omi": "B1", "prezzo": {"acquisto": {"minimo": "2.400", "massimo": 3200}}}]}
+
+    assert client._parse_zone_type_schema(payload, None, None) is None
+    quotations, zones = client._collect_quotations(payload, None, None)
+    assert zones == {"B1"}
+    assert quotations[0].prezzo_acquisto_min == pytest.approx(2400)
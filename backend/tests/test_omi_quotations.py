@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.client import OMIQuotation, OMIResponse
+from app.omi.quotations import QuotationTable
+
+
+def make_table() -> QuotationTable:
+    response = OMIResponse(
+        codice_comune="F205",
+        comune="Milano",
+        metri_quadri=1.0,
+        zone_count=2,
+        quotations=[
+            OMIQuotation(
+                zona_omi="B1",
+                property_type="abitazioni_civili",
+                stato_conservazione="ottimo",
+                prezzo_acquisto_min=2400,
+                prezzo_acquisto_max=3200,
+                prezzo_acquisto_medio=2800,
+                prezzo_affitto_min=14.0,
+                prezzo_affitto_max=19.0,
+                prezzo_affitto_medio=16.5,
+            ),
+            OMIQuotation(
+                zona_omi="B1",
+                property_type="box",
+                prezzo_acquisto_min=1500,
+                prezzo_acquisto_max=1900,
+                prezzo_acquisto_medio=1700,
+            ),
+            OMIQuotation(
+                zona_omi="C2",
+                property_type="abitazioni_civili",
+                prezzo_acquisto_min=1800,
+                prezzo_acquisto_max=2400,
+                prezzo_acquisto_medio=2100,
+            ),
+        ],
+    )
+    return QuotationTable.from_response(response)
+
+
+def test_lookups_use_zone_and_type_indexes():
+    table = make_table()
+
+    assert table.get("C2", "abitazioni_civili").acquisto == (1800, 2400, 2100)
+    assert table.get("C2", "box") is None
+    assert [r.property_type for r in table.select(zona_omi="B1")] == ["abitazioni_civili", "box"]
+    assert [r.zona_omi for r in table.select(property_type="abitazioni_civili")] == ["B1", "C2"]
+    assert table.select(operazione="affitto") == [table.get("B1", "abitazioni_civili")]
+    assert table.first(property_type="box", operazione="affitto") is None
+
+
+def test_models_are_built_only_when_leaving_the_table():
+    table = make_table()
+
+    response = table.to_response(comune="Milano", metri_quadri=50, operazione="acquisto", zona_omi="B1")
+    assert response.zona_omi_filter == "B1"
+    assert response.zone_count == 2
+    assert [q.prezzo_acquisto_medio for q in response.quotations] == [pytest.approx(140000), pytest.approx(85000)]
+    assert all(q.prezzo_affitto_medio is None for q in response.quotations)
+
+    record = table.get("B1", "abitazioni_civili")
+    assert record.to_dict() == record.to_model().model_dump(exclude_none=True)
+    assert table.as_stale().stale and not table.stale
@@ -0,0 +1,59 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.rate_limiter import RequestPriority, TokenBucketScheduler
+
+
+def test_burst_is_granted_immediately_then_rate_limited():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=20, burst=3)
+        waits = await asyncio.gather(*(scheduler.acquire() for _ in range(5)))
+        return scheduler, waits
+
+    scheduler, waits = asyncio.run(scenario())
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert all(wait > 0 for wait in waits[3:])
+    assert scheduler.stats()["lanes"]["interactive"]["acquired"] == 5
+
+
+def test_interactive_lane_overtakes_queued_batch_requests_fifo():
+    order = []
+
+    async def worker(scheduler, name, priority):
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=50, burst=1)
+        await scheduler.acquire()
+        tasks = [
+            asyncio.create_task(worker(scheduler, "batch-1", RequestPriority.BATCH)),
+            asyncio.create_task(worker(scheduler, "batch-2", RequestPriority.BATCH)),
+            asyncio.create_task(worker(scheduler, "background", RequestPriority.BACKGROUND)),
+            asyncio.create_task(worker(scheduler, "interactive", RequestPriority.INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        depth = scheduler.queue_depth()
+        await asyncio.gather(*tasks)
+        return depth
+
+    depth = asyncio.run(scenario())
+    assert depth == 4
+    assert order == ["interactive", "background", "batch-1", "batch-2"]
+
+
+def test_cancelled_waiter_is_skipped():
+    async def scenario():
+        scheduler = TokenBucketScheduler(rate=50, burst=1)
+        await scheduler.acquire()
+        cancelled = asyncio.create_task(scheduler.acquire())
+        waiting = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=1)
+        return scheduler.queue_depth()
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,39 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.resilience import CircuitBreaker, CircuitState
+
+
+def test_circuit_opens_after_threshold_and_recovers_through_half_open(fake_clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=10, clock=fake_clock)
+
+    for _ in range(3):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 10
+
+    fake_clock.advance(10)
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_the_circuit(fake_clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5, clock=fake_clock)
+
+    breaker.record_failure()
+    fake_clock.advance(5)
+    assert breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.retry_after() == 5
+    assert breaker.stats()["times_opened"] == 2
@@ -0,0 +1,121 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.client import OMIClient, OMIServiceError
+from app.omi.shared import InMemorySharedState, OMISharedState, SQLiteSharedState
+from app.omi.store import OMIQuotationStore
+
+SAMPLE_API_RESPONSE = {
+    "success": True,
+    "data": {
+        "B1": {
+            "abitazioni_civili": {
+                "prezzo_acquisto_min": 2400,
+                "prezzo_acquisto_max": 3200,
+                "prezzo_acquisto_medio": 2800,
+            }
+        }
+    },
+}
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "memory"])
+def test_global_budget_and_leases_are_shared(tmp_path, backend, fake_clock):
+    if backend == "sqlite":
+        first = SQLiteSharedState(tmp_path / "shared.sqlite3", clock=fake_clock)
+        second = SQLiteSharedState(tmp_path / "shared.sqlite3", clock=fake_clock)
+    else:
+        first = second = InMemorySharedState(clock=fake_clock)
+
+    assert first.reserve_token(rate=0.5, burst=1) == 0
+    assert second.reserve_token(rate=0.5, burst=1) == pytest.approx(2.0)
+    assert first.reserve_token(rate=0.5, burst=1) == pytest.approx(4.0)
+    second.refund_token(burst=1)
+    fake_clock.advance(4)
+    assert second.reserve_token(rate=0.5, burst=1) == pytest.approx(0.0)
+
+    if backend == "sqlite":
+        assert first.acquire_lease("F205", ttl_seconds=30)
+        assert not second.acquire_lease("F205", ttl_seconds=30)
+        first.release_lease("F205")
+        assert second.acquire_lease("F205", ttl_seconds=30)
+
+    first.set_negative("L219", "Nessuna quotazione", ttl_seconds=60)
+    assert second.get_negative("L219") == "Nessuna quotazione"
+    fake_clock.advance(61)
+    assert second.get_negative("L219") is None
+    first.close()
+    second.close()
+
+
+def test_workers_share_one_upstream_call_per_comune(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        await asyncio.sleep(0.05)
+        request = httpx.Request("GET", url, params=params)
+        if params["codice_comune"] == "L219":
+            failure = httpx.Response(404, request=request, json={"detail": "Comune non coperto"})
+            raise httpx.HTTPStatusError("error", request=request, response=failure)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    def worker() -> OMIClient:
+        return OMIClient(
+            store=OMIQuotationStore(tmp_path / "quotations.sqlite3"),
+            shared_state=SQLiteSharedState(tmp_path / "shared.sqlite3"),
+            rate_limit_per_second=100,
+        )
+
+    async def scenario():
+        async with worker() as first, worker() as second:
+            results = await asyncio.gather(first.query("Milano"), second.query("Milano"))
+            with pytest.raises(OMIServiceError, match="Comune non coperto"):
+                await first.query("Torino")
+            with pytest.raises(OMIServiceError, match="Comune non coperto"):
+                await second.query("Torino")
+            return results
+
+    first, second = asyncio.run(scenario())
+    assert calls == ["F205", "L219"]
+    assert first.quotations == second.quotations
+
+
+def test_shared_state_is_abstract():
+    with pytest.raises(TypeError):
+        OMISharedState()
+
+
+def test_empty_results_are_shared_through_negative_cache(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params["codice_comune"])
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json={"success": True, "data": {}})
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+
+    def worker() -> OMIClient:
+        return OMIClient(
+            store=OMIQuotationStore(tmp_path / "quotations.sqlite3"),
+            shared_state=SQLiteSharedState(tmp_path / "shared.sqlite3"),
+            rate_limit_per_second=100,
+            negative_ttl=60,
+        )
+
+    async def scenario():
+        async with worker() as first, worker() as second:
+            return await first.query("Milano"), await second.query("Milano")
+
+    first, second = asyncio.run(scenario())
+    assert calls == ["F205"]
+    assert first.quotations == second.quotations == []
@@ -0,0 +1,70 @@
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.client import OMIClient
+from app.omi.semesters import next_semester_boundary, semester_of
+from app.omi.store import OMIQuotationStore
+
+SAMPLE_API_RESPONSE = {
+    "success": True,
+    "data": {
+        "zones": [
+            {
+                "zona_omi": "B1",
+                "categorie": [
+                    {
+                        "categoria": "Abitazioni civili",
+                        "prezzo": {"acquisto": {"minimo": 2400, "massimo": 3200, "mediano": 2800}},
+                    }
+                ],
+            }
+        ],
+    },
+}
+
+
+def test_semester_helpers():
+    assert semester_of(datetime(2024, 6, 30)) == "2024-S1"
+    assert semester_of(datetime(2024, 7, 1)) == "2024-S2"
+    assert next_semester_boundary(datetime(2024, 3, 10)) == datetime(2024, 7, 1)
+    assert next_semester_boundary(datetime(2024, 11, 2)) == datetime(2025, 1, 1)
+
+
+def test_store_is_lazy_and_expires_at_semester_boundary(tmp_path):
+    path = tmp_path / "omi.sqlite3"
+    store = OMIQuotationStore(path)
+    assert not path.exists()
+
+    store.set("F205|1.0|all|all|all", "{}", fetched_at=datetime(2024, 2, 1))
+    assert path.exists()
+    assert store.get("F205|1.0|all|all|all", now=datetime(2024, 6, 30).timestamp()) == "{}"
+    assert store.get("F205|1.0|all|all|all", now=datetime(2024, 7, 1).timestamp()) is None
+    store.close()
+
+
+def test_client_serves_persisted_response_after_restart(monkeypatch, tmp_path):
+    calls = []
+
+    async def fake_get(self, url, params=None, **kwargs):
+        calls.append(params)
+        request = httpx.Request("GET", url, params=params)
+        return httpx.Response(200, request=request, json=SAMPLE_API_RESPONSE)
+
+    monkeypatch.setattr(httpx.AsyncClient, "get", fake_get)
+    path = tmp_path / "omi.sqlite3"
+
+    async def run_query():
+        async with OMIClient(store=OMIQuotationStore(path)) as client:
+            return await client.query("Milano")
+
+    first = asyncio.run(run_query())
+    second = asyncio.run(run_query())
+
+    assert len(calls) == 1
+    assert second.quotations == first.quotations
@@ -0,0 +1,80 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi import zone_index as zone_index_module
+from app.omi.importer import import_semester
+from app.omi.offline import OMIOfflineDataset
+from app.omi.property_types import PropertyType
+from app.omi.suggester import (
+    KeywordMatcher,
+    suggest_batch,
+    suggest_omi_zone,
+    suggest_property_type,
+    suggest_zone_matches,
+)
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "omi"
+
+
+@pytest.fixture(autouse=True)
+def offline_dataset(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    zone_index_module._zone_description_index = zone_index_module.OMIZoneDescriptionIndex(dataset)
+    yield dataset
+    zone_index_module._zone_description_index = None
+    dataset.close()
+
+
+def test_keywords_respect_word_boundaries_and_prefer_longer_phrases():
+    assert suggest_property_type("Via Roma 3, Casalmaggiore") == PropertyType.ABITAZIONI_CIVILI.value
+    assert suggest_property_type("Via Roma 3", "Ampio box doppio") == PropertyType.BOX.value
+    assert suggest_property_type("Via Torino", "Spazio nel centro commerciale") == (
+        PropertyType.CENTRI_COMMERCIALI.value
+    )
+    assert suggest_property_type("Corso Como", "Ufficio direzionale") == (
+        PropertyType.UFFICI_STRUTTURATI.value
+    )
+
+
+def test_zone_suggestion_uses_the_most_specific_indicator():
+    assert asyncio.run(suggest_omi_zone("Milano", "Piazza del Duomo 1")) == "B1"
+    assert asyncio.run(suggest_omi_zone("Milano", "Estrema periferia nord")) == "E1"
+    assert asyncio.run(suggest_omi_zone("Milano", "Via Zonaverde 2")) == "C1"
+    assert asyncio.run(suggest_omi_zone("Atlantide", "Piazza Grande")) is None
+
+
+def test_matcher_weights_and_batch_api():
+    matcher = KeywordMatcher({"a": ["studio"], "b": ["studio professionale", "sede"]})
+    assert matcher.scores("Studio  professionale in sede") == {"b": 3.0}
+    assert matcher.best("nessuna parola") is None
+
+    results = suggest_batch(
+        [
+            ("Milano", "Corso Buenos Aires 1", "Attico con terrazzo"),
+            ("Atlantide", "Via Roma 1", "Garage"),
+        ]
+    )
+    assert results == [
+        {"suggested_property_type": PropertyType.ABITAZIONI_SIGNORILI.value, "suggested_zone": "B1"},
+        {"suggested_property_type": PropertyType.BOX.value, "suggested_zone": None},
+    ]
+
+
+def test_zone_suggestion_prefers_streets_from_zone_descriptions(offline_dataset):
+    import_semester(offline_dataset, FIXTURES / "QI_1_20241_VALORI.csv", FIXTURES / "QI_1_20241_ZONE.csv")
+
+    assert asyncio.run(suggest_omi_zone("Milano", "Via Solferino 12")) == "B12"
+    assert asyncio.run(suggest_omi_zone("Milano", "Viale Certosa 40, periferia")) == "D20"
+    # Nessuna via riconosciuta: prima zona esistente della fascia stimata
+    assert asyncio.run(suggest_omi_zone("Milano", "Periferia nord")) == "D20"
+    assert suggest_batch([("Milano", "Corso Garibaldi 5", None)])[0]["suggested_zone"] == "B12"
+
+    matches = suggest_zone_matches("Milano", "Via Solferino angolo Viale Certosa")
+    assert [match["zona"] for match in matches] == ["B12", "D20"]
+    assert matches[0]["descrizione"] == "BRERA, VIA SOLFERINO, CORSO GARIBALDI"
+    assert suggest_zone_matches("Atlantide", "Via Solferino") == []
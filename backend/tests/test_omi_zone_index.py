@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi.importer import import_semester
+from app.omi.offline import OMIOfflineDataset
+from app.omi.zone_index import ComuneZoneIndex, OMIZoneDescriptionIndex, address_tokens
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "omi"
+
+
+def test_tokens_drop_street_types_and_numbers():
+    assert address_tokens("Via Solferino, 12 - 20121 Milano") == ["solferino", "milano"]
+    assert address_tokens("P.za Sant'Ambrogio") == ["sant", "ambrogio"]
+
+
+def test_rare_words_outweigh_shared_ones():
+    index = ComuneZoneIndex(
+        {
+            "B1": "CENTRO STORICO, VIA DANTE",
+            "C2": "PORTA ROMANA, VIA DANTE",
+            "D3": "PERIFERIA EST, VIA GARIBALDI",
+        }
+    )
+    assert index.match("Via Dante 4, Porta Romana")[0][0] == "C2"
+    assert [zona for zona, _ in index.match("Via Dante")] == ["B1", "C2"]
+    assert index.match("Via Sconosciuta") == []
+
+
+def test_dataset_index_follows_new_imports(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    index = OMIZoneDescriptionIndex(dataset)
+    assert index.match("F205", "Via Solferino") == []
+
+    import_semester(dataset, FIXTURES / "QI_1_20241_VALORI.csv", FIXTURES / "QI_1_20241_ZONE.csv")
+    assert index.match("F205", "Via Solferino 10")[0][0] == "B12"
+    assert index.match("F205", "Viale Certosa")[0][0] == "D20"
+    assert index.match("L219", "Piazza Castello")[0][0] == "B01"
+    assert index.comune("F205").zones() == ["B12", "D20"]
+    dataset.close()
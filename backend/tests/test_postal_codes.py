@@ -0,0 +1,43 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.omi import postal_codes
+from app.omi.postal_codes import (
+    extract_postal_code,
+    get_codes_by_postal_code,
+    resolve_comune,
+    write_cap_file,
+)
+
+
+def test_bundled_ranges_resolve_comuni():
+    assert get_codes_by_postal_code("20121") == ("F205",)
+    assert get_codes_by_postal_code("20162") == ("F205",)
+    assert get_codes_by_postal_code("00118") == ("H501",)
+    assert get_codes_by_postal_code("99999") == ()
+    assert extract_postal_code("via Roma 1, 20121 Milano (MI)") == "20121"
+
+
+def test_resolve_comune_prefers_name_then_postal_code():
+    assert resolve_comune("Torino", "20121") == "L219"
+    assert resolve_comune("Zona Navigli", "20143") == "F205"
+    assert resolve_comune("20143 Navigli (MI)") == "F205"
+    assert resolve_comune("Atlantide", None) is None
+
+
+def test_shared_postal_codes_are_disambiguated(tmp_path, monkeypatch):
+    output = tmp_path / "cap.csv"
+    count = write_cap_file(
+        [("E879", ["23826"]), ("F205", ["20121", "20122", "20123", "20125"]), ("A005", ["23826"])],
+        output,
+    )
+    assert count == 3
+    assert "F205;20121-20123,20125" in output.read_text(encoding="utf-8")
+
+    monkeypatch.setattr(postal_codes, "DATA_PATH", output)
+    monkeypatch.setattr(postal_codes, "_index", None)
+    assert get_codes_by_postal_code("23826") == ("A005", "E879")
+    assert resolve_comune("Frazione di Abbadia Lariana", "23826") == "A005"
+    assert resolve_comune("Lungolago", "23826") is None
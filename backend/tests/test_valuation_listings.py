@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.valuation.listings import (
+    ComparablesEngine,
+    ListingIndex,
+    ListingsStore,
+    haversine_m,
+    property_type_code,
+)
+
+
+def random_rows(count, seed=3):
+    rng = np.random.default_rng(seed)
+    latitudes = 45.46 + rng.normal(0, 0.03, count)
+    longitudes = 9.19 + rng.normal(0, 0.04, count)
+    surfaces = rng.uniform(30, 200, count)
+    return [
+        (i + 1, latitudes[i].item(), longitudes[i].item(), surfaces[i].item(), surfaces[i].item() * 4000, 0)
+        for i in range(count)
+    ]
+
+
+def brute_force_pool(rows, latitude, longitude, pool, max_distance):
+    columns = np.array(rows)
+    distances = haversine_m(latitude, longitude, columns[:, 1], columns[:, 2])
+    order = [i for i in np.argsort(distances) if distances[i] <= max_distance][:pool]
+    return {int(columns[i, 0]) for i in order}
+
+
+def test_haversine_matches_known_distance():
+    # Milano Duomo - Torino Porta Nuova, circa 126 km
+    distance = haversine_m(45.4642, 9.1900, np.array([45.0621]), np.array([7.6782]))[0]
+    assert distance == pytest.approx(125_900, rel=0.01)
+
+
+def test_candidates_are_the_true_nearest_listings():
+    rows = random_rows(20_000)
+    index = ListingIndex(rows)
+
+    for latitude, longitude in [(45.46, 9.19), (45.52, 9.10), (45.30, 9.40)]:
+        matches = index.nearest(latitude, longitude, k=32, pool=32, surface=None)
+        expected = brute_force_pool(rows, latitude, longitude, 32, 3000.0)
+        assert {match[0] for match in matches} == expected
+
+
+def test_updates_replace_and_remove_listings():
+    index = ListingIndex([(1, 45.0, 9.0, 80, 320000, 0), (2, 45.001, 9.0, 80, 300000, 0)])
+    index.add((1, 46.0, 10.0, 80, 320000, 0))
+    assert [match[0] for match in index.nearest(45.0, 9.0, k=3)] == [2]
+
+    index.remove(2)
+    assert index.nearest(45.0, 9.0, k=3) == []
+    assert [match[0] for match in index.nearest(46.0, 10.0, k=3)] == [1]
+
+    for listing_id in range(3, 3 + ListingIndex.MERGE_THRESHOLD):
+        index.add((listing_id, 46.0, 10.0 + listing_id * 1e-6, 80, 300000, 0))
+    assert len(index) == 1 + ListingIndex.MERGE_THRESHOLD
+    assert len(index.nearest(46.0, 10.0, k=5)) == 5
+
+
+def test_similarity_prefers_matching_surface_and_type(tmp_path):
+    engine = ComparablesEngine(ListingsStore(tmp_path / "listings.sqlite3"))
+    base = {"latitude": 45.4642, "longitude": 9.19, "price": 300000, "contractType": "vendita"}
+    engine.save({**base, "url": "https://example.it/vendita/1", "surface": 200, "propertyType": "appartamento"})
+    engine.save({**base, "url": "https://example.it/vendita/2", "surface": 82, "propertyType": "villa"})
+    engine.save({**base, "url": "https://example.it/vendita/3", "surface": 80, "propertyType": "appartamento"})
+
+    found = engine.find(45.4642, 9.19, k=3, surface=80, property_type="appartamento")
+    assert [listing.url[-1] for listing in found] == ["3", "2", "1"]
+
+    # Un annuncio analizzato di nuovo sostituisce il precedente, anche dopo il riavvio
+    engine.save({**base, "url": "https://example.it/vendita/3", "surface": 80, "price": 320000})
+    reloaded = ComparablesEngine(ListingsStore(tmp_path / "listings.sqlite3"))
+    assert [listing.price for listing in reloaded.find(45.4642, 9.19, k=1, surface=80)] == [320000]
+    assert property_type_code("villa") != property_type_code("appartamento")
@@ -0,0 +1,81 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.api.valuation import (
+    PropertyInput,
+    _adjust_price_per_sqm,
+    _calculate_confidence,
+    _pricing_columns,
+)
+from app.omi import base_prices as base_prices_module
+from app.omi.offline import OMIOfflineDataset
+from app.valuation.pricing import adjust_price_per_sqm, calculate_confidence, estimate_spread
+
+
+@pytest.fixture(autouse=True)
+def empty_base_prices(tmp_path):
+    dataset = OMIOfflineDataset(tmp_path / "offline.sqlite3")
+    base_prices_module._base_price_table = base_prices_module.BasePriceTable(dataset)
+    yield
+    base_prices_module._base_price_table = None
+    dataset.close()
+
+
+def random_properties(count, seed=7):
+    rng = random.Random(seed)
+    cities = ["Milano", "Roma", "Lesa", "Atlantide"]
+
+    def maybe(value):
+        return value if rng.random() > 0.25 else None
+
+    properties = []
+    for _ in range(count):
+        surface = rng.choice([0, 20, 54.9, 55, 84, 85, 150, 151, 200, 201, 340]) * rng.uniform(0.9, 1.1)
+        properties.append(
+            PropertyInput(
+                address="Via Roma 1",
+                city=rng.choice(cities),
+                province=rng.choice([None, "MI", "VB"]),
+                surface=surface,
+                price=maybe(rng.choice([0, 40000, 250000, 900000])),
+                rooms=maybe(rng.randint(0, 8)),
+                bedrooms=maybe(rng.randint(0, 5)),
+                bathrooms=maybe(rng.randint(0, 4)),
+                floor=maybe(rng.randint(-1, 9)),
+                latitude=maybe(rng.choice([0.0, 45.46])),
+                longitude=maybe(9.19),
+            )
+        )
+    return properties
+
+
+def test_vectorized_engine_matches_the_scalar_path():
+    properties = random_properties(5000)
+    columns = _pricing_columns(properties)
+
+    prices = adjust_price_per_sqm(columns)
+    confidences = calculate_confidence(columns)
+
+    np.testing.assert_allclose(prices, [_adjust_price_per_sqm(p) for p in properties], rtol=1e-12)
+    assert confidences.tolist() == [_calculate_confidence(p) for p in properties]
+
+    boosted = np.minimum(confidences + 15, 95)
+    expected = [max(0.08, 0.18 - (c - 55) * 0.002) for c in boosted.tolist()]
+    np.testing.assert_allclose(estimate_spread(boosted), expected, rtol=1e-12)
+
+
+def test_large_surfaces_keep_the_scalar_discount():
+    # Oltre i 150 mq il percorso scalare applica sempre 0,92, anche sopra i 200
+    properties = [
+        PropertyInput(address="Via Roma 1", city="Milano", surface=surface)
+        for surface in (160, 250)
+    ]
+    prices = adjust_price_per_sqm(_pricing_columns(properties))
+    assert prices.tolist() == pytest.approx([4700 * 0.92, 4700 * 0.92])
@@ -107,6 +107,7 @@ export function Step4Calculation({ onNext, onBack, propertyData }: Step4Props) {
           // Dati OMI per valutazione più accurata
           property_type: propertyData.propertyTypeOMI,
           zona_omi: propertyData.zonaOMI,
+          postal_code: propertyData.postalCode,
         }),
       });
 